@@ -7,13 +7,48 @@ from flask_login import LoginManager
 from flask_pagedown import PageDown
 from flask_wtf.csrf import CsrfProtect
 from config import config
+from .email import MailDispatcher
+from .event_calendar import EventCalendar
+from .facets import FacetIndex
+from .feed import FeedCache
+from .images import ImagePipeline
+from .ingredient_index import IngredientIndex
+from .last_seen import LastSeenWriter
+from .passwords import PasswordHasher
+from .log_writer import LogWriter
+from .metrics import Metrics
+from .read_only import ReadOnlyRequests
+from .recommendations import Recommender
+from .reference import ReferenceData
+from .response_cache import ResponseCache
+from .search import SearchIndex, install_ddl
+from .social_graph import SocialGraph
+from .user_cache import UserCache
 
 bootstrap = Bootstrap()
 mail = Mail()
 moment = Moment()
 db = SQLAlchemy()
+install_ddl(db.metadata)
 pagedown = PageDown()
 csrf = CsrfProtect()
+metrics = Metrics()
+log_writer = LogWriter()
+last_seen_writer = LastSeenWriter()
+read_only_requests = ReadOnlyRequests()
+feed_cache = FeedCache()
+search_index = SearchIndex()
+response_cache = ResponseCache()
+reference_data = ReferenceData()
+image_pipeline = ImagePipeline()
+mail_dispatcher = MailDispatcher()
+password_hasher = PasswordHasher()
+recommender = Recommender()
+user_cache = UserCache()
+ingredient_index = IngredientIndex()
+facets = FacetIndex()
+event_calendar = EventCalendar()
+social_graph = SocialGraph()
 
 login_manager = LoginManager()
 login_manager.session_protection = 'strong'
@@ -32,6 +67,23 @@ def create_app(config_name):
     login_manager.init_app(app)
     pagedown.init_app(app)
     csrf.init_app(app)
+    metrics.init_app(app)
+    log_writer.init_app(app)
+    last_seen_writer.init_app(app)
+    read_only_requests.init_app(app)
+    feed_cache.init_app(app)
+    search_index.init_app(app)
+    response_cache.init_app(app)
+    reference_data.init_app(app)
+    image_pipeline.init_app(app)
+    mail_dispatcher.init_app(app)
+    password_hasher.init_app(app)
+    recommender.init_app(app)
+    user_cache.init_app(app)
+    ingredient_index.init_app(app)
+    facets.init_app(app)
+    event_calendar.init_app(app)
+    social_graph.init_app(app)
 
     if not app.debug and not app.testing and not app.config['SSL_DISABLE']:
         from flask_sslify import SSLify
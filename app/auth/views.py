@@ -3,6 +3,7 @@ from flask_login import login_user, logout_user, login_required, \
     current_user
 from . import auth
 from .. import db
+from ..decorators import read_write
 from ..models import User
 from ..email import send_email
 from .forms import LoginForm, RegistrationForm, ChangePasswordForm,\
@@ -64,6 +65,7 @@ def register():
 
 
 @auth.route('/confirm/<token>')
+@read_write
 @login_required
 def confirm(token):
     if current_user.confirmed:
@@ -156,6 +158,7 @@ def change_email_request():
 
 
 @auth.route('/change-email/<token>')
+@read_write
 @login_required
 def change_email(token):
     if current_user.change_email(token):
@@ -0,0 +1,115 @@
+"""
+Recipe writes in bulk: the recipes, their ingredients, links and tags of a
+whole batch in one transaction, with one query per kind of row.
+"""
+import sqlalchemy as sa
+
+from .exceptions import ValidationError
+
+# ids per IN clause, below SQLite's limit of bound parameters
+CHUNK_SIZE = 900
+
+
+def _ids(value, what, number):
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise ValidationError('recipe {}: {} must be a list of ids'.format(number, what))
+    try:
+        return [int(i) for i in value]
+    except (TypeError, ValueError):
+        raise ValidationError('recipe {}: {} must be ids'.format(number, what))
+
+
+def _text(value, what, number):
+    """A string field of an entry, None when missing."""
+    if value is not None and not isinstance(value, str):
+        raise ValidationError('recipe {}: {} must be a string'.format(number, what))
+    return value
+
+
+def _clean(entry, number):
+    """The fields of one recipe of a batch, as the columns and rows to write."""
+    if not isinstance(entry, dict):
+        raise ValidationError('recipe {}: not an object'.format(number))
+    title = (_text(entry.get('title'), 'the title', number) or '').strip()
+    if not title:
+        raise ValidationError('recipe {}: a title is required'.format(number))
+    try:
+        serving = int(entry.get('serving') or 1)
+    except (TypeError, ValueError):
+        raise ValidationError('recipe {}: serving must be a number'.format(number))
+    if not isinstance(entry.get('ingredients') or [], list):
+        raise ValidationError('recipe {}: ingredients must be a list'.format(number))
+    ingredients = {}
+    for ingredient in entry.get('ingredients') or ():
+        if not isinstance(ingredient, dict):
+            raise ValidationError('recipe {}: every ingredient must be an object'.format(number))
+        name = (_text(ingredient.get('name'), 'an ingredient name', number) or '').strip()
+        if not name:
+            raise ValidationError('recipe {}: every ingredient needs a name'.format(number))
+        unit = _text(ingredient.get('unit'), 'the unit of {}'.format(name), number)
+        try:
+            quantity = float(ingredient['quantity']) if ingredient.get('quantity') not in (None, '') else None
+        except (TypeError, ValueError):
+            raise ValidationError('recipe {}: the quantity of {} must be a number'.format(number, name))
+        # an ingredient is listed once per recipe, the last one wins
+        ingredients[name] = dict(name=name, unit=unit, quantity=quantity)
+    return dict(title=title, serving=serving, body=_text(entry.get('body'), 'the body', number),
+                photos=_text(entry.get('photos'), 'photos', number) or '',
+                ingredients=list(ingredients.values()), links=_ids(entry.get('links'), 'links', number),
+                tags=_ids(entry.get('tags'), 'tags', number))
+
+
+def _existing(column, ids):
+    """The subset of ``ids`` found in ``column``, one IN query per CHUNK_SIZE ids."""
+    from . import db
+
+    ids, found = sorted(set(ids)), set()
+    for start in range(0, len(ids), CHUNK_SIZE):
+        found.update(row[0] for row in db.session.query(column).filter(column.in_(ids[start:start + CHUNK_SIZE])))
+    return found
+
+
+def create_recipes(author, entries):
+    """
+    Write a batch of recipes by ``author`` and return them.
+
+    Each entry is a dict with a title and optional serving, body, photos,
+    ingredients (dicts of name, unit and quantity), links (ids of the
+    recipes it links to) and tags (tag ids). Links and tags to ids that do
+    not exist are dropped. Raises ValidationError, writing nothing, when an
+    entry is malformed.
+
+    The referenced recipe and tag ids are checked with one IN query each,
+    the recipes are inserted through the session so every commit listener
+    sees them, and the ingredient, relates and recipe_tags rows go in with
+    one executemany each, all committed together.
+    """
+    from . import db
+    from .models import Recipe, Tag, Ingredient, relates, recipe_tags
+
+    entries = [_clean(entry, number) for number, entry in enumerate(entries, 1)]
+    links = _existing(Recipe.id, [i for entry in entries for i in entry['links']])
+    tags = _existing(Tag.id, [i for entry in entries for i in entry['tags']])
+
+    recipes = [Recipe(author=author, title=entry['title'], serving=entry['serving'], body=entry['body'],
+                      photos=entry['photos']) for entry in entries]
+    try:
+        db.session.add_all(recipes)
+        db.session.flush()
+        ingredient_rows, link_rows, tag_rows = [], [], []
+        for recipe, entry in zip(recipes, entries):
+            ingredient_rows += [dict(ingredient, recipe_id=recipe.id) for ingredient in entry['ingredients']]
+            link_rows += [dict(link_id=recipe.id, linked_id=i)
+                          for i in sorted(set(entry['links']) & links) if i != recipe.id]
+            tag_rows += [dict(recipe_id=recipe.id, tag_id=i) for i in sorted(set(entry['tags']) & tags)]
+        for table, rows in ((Ingredient.__table__, ingredient_rows), (relates, link_rows),
+                            (recipe_tags, tag_rows)):
+            if rows:
+                db.session.execute(table.insert(), rows)
+        db.session.commit()
+    except sa.exc.SQLAlchemyError:
+        db.session.rollback()
+        raise
+    return recipes
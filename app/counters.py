@@ -0,0 +1,122 @@
+import sqlalchemy as sa
+from flask_sqlalchemy import SignallingSession
+
+_counters = []
+
+
+class CounterCache(object):
+    """
+    Keeps a denormalized count column on a parent row equal to the number of
+    child rows pointing at it.
+
+    The parent is adjusted with an atomic ``col = col +/- 1`` UPDATE inside
+    the flush that inserts, deletes or re-parents a child, and the loaded
+    parent attribute is expired so the next read sees the new value.
+
+    With ``match``, a (child attribute, value) pair, only the children whose
+    attribute holds the value are counted; an update that moves a child in
+    or out of the match adjusts the parent too.
+    """
+
+    def __init__(self, column, foreign_key, match=None):
+        self.column = column.property.columns[0]
+        self.key = column.key
+        self.parent = column.class_
+        self.child = foreign_key.class_
+        self.foreign_key = foreign_key.key
+        self.child_column = foreign_key.property.columns[0]
+        self.parent_pk = list(self.child_column.foreign_keys)[0].column
+        self.match_key = self.match_column = self.match_value = None
+        if match is not None:
+            self.match_key, self.match_value = match[0].key, match[1]
+            self.match_column = match[0].property.columns[0]
+        sa.event.listen(self.child, 'after_insert', self._after_insert)
+        sa.event.listen(self.child, 'after_delete', self._after_delete)
+        sa.event.listen(self.child, 'after_update', self._after_update)
+        # load the previous parent id (and matched value) when a loaded child is changed
+        sa.event.listen(foreign_key, 'set', _keep_history, active_history=True)
+        if match is not None:
+            sa.event.listen(match[0], 'set', _keep_history, active_history=True)
+
+    def _matches(self, value):
+        return self.match_key is None or value == self.match_value
+
+    def _adjust(self, connection, target, parent_id, delta):
+        if parent_id is None:
+            return
+        connection.execute(self.parent_pk.table.update()
+                           .where(self.parent_pk == parent_id)
+                           .values({self.column: self.column + delta}))
+        session = sa.orm.object_session(target)
+        if session is not None:
+            session.info.setdefault('expired_counters', set()).add(
+                (self.parent, parent_id, self.key))
+
+    def _after_insert(self, mapper, connection, target):
+        if self._matches(getattr(target, self.match_key) if self.match_key else None):
+            self._adjust(connection, target, getattr(target, self.foreign_key), 1)
+
+    def _after_delete(self, mapper, connection, target):
+        if self._matches(getattr(target, self.match_key) if self.match_key else None):
+            self._adjust(connection, target, getattr(target, self.foreign_key), -1)
+
+    def _after_update(self, mapper, connection, target):
+        attrs = sa.inspect(target).attrs
+        before, after = [], []
+        for key in (self.foreign_key, self.match_key):
+            history = attrs[key].history if key else None
+            if history is not None and history.has_changes():
+                before.append(history.deleted[0] if history.deleted else None)
+                after.append(history.added[0] if history.added else None)
+            else:
+                before.append(getattr(target, key) if key else None)
+                after.append(before[-1])
+        if before == after:
+            return
+        if self._matches(before[1]):
+            self._adjust(connection, target, before[0], -1)
+        if self._matches(after[1]):
+            self._adjust(connection, target, after[0], 1)
+
+    def reconcile(self, connection):
+        """Recompute the column for every parent, return the rows that drifted."""
+        condition = self.child_column == self.parent_pk
+        if self.match_key is not None:
+            condition = sa.and_(condition, self.match_column == self.match_value)
+        actual = sa.select([sa.func.count()]).where(condition).as_scalar()
+        return connection.execute(self.parent_pk.table.update()
+                                  .where(self.column != actual)
+                                  .values({self.column: actual})).rowcount
+
+
+def _keep_history(target, value, oldvalue, initiator):
+    pass
+
+
+def counter_cache(column, foreign_key, match=None):
+    """
+    Declare ``column`` (e.g. Recipe.review_count) as the count of rows whose
+    ``foreign_key`` (e.g. Review.recipe_id) points at the parent, and whose
+    ``match`` attribute holds the given value when a (attribute, value) pair
+    is passed (e.g. (RSVP.status, RSVPStatus.GOING) for Event.going_count).
+    """
+    counter = CounterCache(column, foreign_key, match)
+    _counters.append(counter)
+    return counter
+
+
+def reconcile_counters(engine):
+    """Recompute every counter cache in bulk, return {column: rows fixed}."""
+    fixed = {}
+    with engine.begin() as conn:
+        for counter in _counters:
+            fixed['{}.{}'.format(counter.parent.__name__, counter.key)] = counter.reconcile(conn)
+    return fixed
+
+
+@sa.event.listens_for(SignallingSession, 'after_flush_postexec')
+def _expire_counters(session, flush_context):
+    for cls, parent_id, key in session.info.pop('expired_counters', ()):
+        obj = session.identity_map.get(sa.orm.util.identity_key(cls, parent_id))
+        if obj is not None:
+            session.expire(obj, [key])
@@ -18,6 +18,12 @@ def permission_required(permission):
 def admin_required(f):
     return permission_required(Permission.ADMINISTER)(f)
 
+
+def read_write(f):
+    """Let a view write on GET, e.g. the follow and confirm links."""
+    f.read_write = True
+    return f
+
 # def member_required():
 #     def decorator(f):
 #         @wraps(f)
@@ -1,20 +1,196 @@
-from threading import Thread
+import atexit
+import logging
+import queue
+import smtplib
+import threading
+import time
+
 from flask import current_app, render_template
 from flask_mail import Message
-from . import mail
 
+from .exceptions import MailQueueFull
+
+logger = logging.getLogger(__name__)
+
+
+class MailDispatcher(object):
+    """
+    Delivers mail from a queue of COOKZILLA_MAIL_QUEUE_SIZE messages on
+    COOKZILLA_MAIL_WORKERS threads.
+
+    Each worker keeps its authenticated SMTP connection open across
+    messages, sends whatever is queued (up to COOKZILLA_MAIL_BATCH messages)
+    over it in one go, and hangs up after COOKZILLA_MAIL_IDLE_TIMEOUT idle
+    seconds. A message that fails on a connection the server dropped or is
+    closing (421) is retried once on a new one; after any other SMTP error
+    the connection is replaced. When the queue is full send() blocks for up
+    to COOKZILLA_MAIL_ENQUEUE_TIMEOUT seconds and then raises MailQueueFull.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._workers = []
+        self._lock = threading.Lock()
+        self.reset_stats()
+        atexit.register(self.join, 5)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['mail_dispatcher'] = self
+        self._queue = queue.Queue(app.config['COOKZILLA_MAIL_QUEUE_SIZE'])
+        self._workers = []
+
+    def reset_stats(self):
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self.batches = 0
+        self.connections = 0
+        self.delivery_time = 0.0
+
+    @property
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def average_delay(self):
+        """Seconds from send() to delivery, on average."""
+        return self.delivery_time / self.sent if self.sent else 0.0
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+    def send(self, msg):
+        self._ensure_workers()
+        try:
+            self._queue.put((msg, time.time()), timeout=self.app.config['COOKZILLA_MAIL_ENQUEUE_TIMEOUT'])
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise MailQueueFull('{} messages waiting for delivery'.format(self._queue.maxsize))
+        with self._lock:
+            self.queued += 1
+
+    def join(self, timeout=None):
+        """Wait until every queued message was delivered or given up on."""
+        if self._queue is None or not self._workers:
+            return True
+        deadline = None if timeout is None else time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        with self._lock:
+            if not self._workers:
+                for i in range(self.app.config['COOKZILLA_MAIL_WORKERS']):
+                    worker = threading.Thread(target=self._run, args=(self.app, self._queue),
+                                              name='cookzilla-mail-{}'.format(i))
+                    worker.daemon = True
+                    worker.start()
+                    self._workers.append(worker)
+
+    def _run(self, app, messages):
+        with app.app_context():
+            connection = None
+            while True:
+                try:
+                    batch = [messages.get(timeout=app.config['COOKZILLA_MAIL_IDLE_TIMEOUT'])]
+                except queue.Empty:
+                    connection = self._close(connection)
+                    continue
+                while len(batch) < app.config['COOKZILLA_MAIL_BATCH']:
+                    try:
+                        batch.append(messages.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    connection = self._deliver(connection, batch)
+                finally:
+                    for _ in batch:
+                        messages.task_done()
+
+    def _deliver(self, connection, batch):
+        with self._lock:
+            self.batches += 1
+        for msg, queued_at in batch:
+            connection, delivered = self._send(connection, msg)
+            with self._lock:
+                if delivered:
+                    self.sent += 1
+                    self.delivery_time += time.time() - queued_at
+                else:
+                    self.failed += 1
+        return connection
+
+    def _send(self, connection, msg):
+        """Send ``msg``, on a new connection if the current one dropped. Returns (connection, delivered)."""
+        for attempt in (1, 2):
+            try:
+                if connection is None:
+                    connection = self._open()
+                connection.send(msg)
+                return connection, True
+            except smtplib.SMTPConnectError as e:
+                error = e
+            except smtplib.SMTPRecipientsRefused as e:
+                # a 421 means the server is closing the connection
+                if all(code != 421 for code, _ in e.recipients.values()):
+                    # smtplib reset the transaction, the connection is still good
+                    logger.error('Mail to %s refused: %s', msg.recipients, e)
+                    return connection, False
+                error = e
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code != 421:
+                    # refused, and the session state is unknown: start over
+                    # on a new connection with the next message
+                    logger.error('Mail to %s refused: %s', msg.recipients, e)
+                    return self._close(connection), False
+                error = e
+            except OSError as e:
+                # includes every other SMTPException, e.g. SMTPServerDisconnected
+                # on an idle connection the server timed out
+                error = e
+            except Exception:
+                logger.exception('Could not send mail to %s', msg.recipients)
+                return connection, False
+            connection = self._close(connection)
+        logger.error('Could not send mail to %s: %s', msg.recipients, error)
+        return connection, False
+
+    def _open(self):
+        from . import mail
+
+        connection = mail.connect()
+        connection.__enter__()
+        with self._lock:
+            self.connections += 1
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+        return None
 
 
 def send_email(to, subject, template, **kwargs):
+    from . import mail_dispatcher
+
     app = current_app._get_current_object()
     msg = Message(app.config['COOKZILLA_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
                   sender=app.config['COOKZILLA_MAIL_SENDER'], recipients=[to])
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', **kwargs)
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
-    return thr
+    mail_dispatcher.send(msg)
+    return msg
@@ -0,0 +1,186 @@
+import bisect
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from .signals import model_committed
+
+#: an event of the calendar, the user's RSVP status (None without one) and
+#: the ids of the events they are going to that overlap it
+CalendarEntry = namedtuple('CalendarEntry', 'event status conflicts')
+CalendarPage = namedtuple('CalendarPage', 'entries more')
+#: what the navbar shows of an upcoming event, plain values safe to share between requests
+UpcomingEvent = namedtuple('UpcomingEvent', 'id title timestamp location status conflict')
+
+
+class EventCalendar(object):
+    """
+    The upcoming events of every group a user is a member of.
+
+    A page of the calendar is one query: the user's memberships joined to
+    events on the (group_id, timestamp) index and to the user's RSVPs,
+    ordered by (timestamp, id) and paged by keyset. A second query over the
+    user's "go" RSVPs around the page flags the events that overlap one
+    they already go to; events have no end, each is taken to last
+    COOKZILLA_EVENT_DURATION minutes.
+
+    The next COOKZILLA_CALENDAR_SUMMARY events shown in the navbar are kept
+    per user and per worker for COOKZILLA_CALENDAR_SUMMARY_TTL seconds, or
+    until the first of them starts. Commits in this worker that change the
+    user's memberships or RSVPs, or an event of one of their groups, drop
+    the summary.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+
+        self.app = app
+        app.extensions['event_calendar'] = self
+        self.invalidate()
+        self.hits = self.misses = 0
+        model_committed.connect(self._on_model_committed, sender=app)
+        for event in ('after_create', 'after_drop'):
+            if not sa.event.contains(db.metadata, event, self._on_ddl):
+                sa.event.listen(db.metadata, event, self._on_ddl)
+
+    def __len__(self):
+        return len(self._summaries)
+
+    @property
+    def duration(self):
+        return timedelta(minutes=self.app.config['COOKZILLA_EVENT_DURATION'])
+
+    def query(self, user_id, start=None, end=None):
+        """(Event, RSVP status) of the events of the user's groups starting in [start, end)."""
+        from . import db
+        from .models import Event, GroupMember, RSVP
+
+        query = db.session.query(Event, RSVP.status) \
+            .join(GroupMember, sa.and_(GroupMember.group_id == Event.group_id, GroupMember.member_id == user_id)) \
+            .outerjoin(RSVP, sa.and_(RSVP.event_id == Event.id, RSVP.member_id == user_id))
+        if start is not None:
+            query = query.filter(Event.timestamp >= start)
+        if end is not None:
+            query = query.filter(Event.timestamp < end)
+        return query
+
+    def upcoming(self, user_id, start=None, end=None, after=None, limit=None):
+        """
+        A CalendarPage of the user's events from ``start`` (now by default)
+        until ``end``, soonest first and with their group loaded, resuming
+        after the (timestamp, id) cursor ``after``. ``more`` tells whether
+        events remain past ``limit``.
+        """
+        from .models import Event
+
+        query = self.query(user_id, datetime.utcnow() if start is None else start, end)
+        if after is not None:
+            timestamp, ident = after
+            query = query.filter(Event.timestamp >= timestamp,
+                                 sa.or_(Event.timestamp > timestamp, Event.id > ident))
+        query = query.options(sa.orm.joinedload(Event.group)).order_by(Event.timestamp.asc(), Event.id.asc())
+        if limit is not None:
+            query = query.limit(limit + 1)
+        rows = query.all()
+        more = limit is not None and len(rows) > limit
+        rows = rows[:limit] if limit is not None else rows
+        conflicts = self.conflicts(user_id, [event for event, status in rows])
+        return CalendarPage([CalendarEntry(event, status, conflicts.get(event.id, []))
+                             for event, status in rows], more)
+
+    def conflicts(self, user_id, events):
+        """{event id: ids of the events the user goes to that overlap it} for ``events``, in one query."""
+        from . import db
+        from .models import Event, RSVP, RSVPStatus
+
+        timestamps = [event.timestamp for event in events if event.timestamp is not None]
+        if not timestamps:
+            return {}
+        duration = self.duration
+        going = db.session.query(Event.timestamp, Event.id).join(RSVP, RSVP.event_id == Event.id) \
+            .filter(RSVP.member_id == user_id, RSVP.status == RSVPStatus.GOING,
+                    Event.timestamp > min(timestamps) - duration, Event.timestamp < max(timestamps) + duration) \
+            .order_by(Event.timestamp, Event.id).all()
+        starts = [timestamp for timestamp, ident in going]
+        overlaps = {}
+        for event in events:
+            if event.timestamp is None:
+                continue
+            low = bisect.bisect_right(starts, event.timestamp - duration)
+            high = bisect.bisect_left(starts, event.timestamp + duration)
+            ids = [ident for timestamp, ident in going[low:high] if ident != event.id]
+            if ids:
+                overlaps[event.id] = ids
+        return overlaps
+
+    def next_events(self, user_id):
+        """The user's next COOKZILLA_CALENDAR_SUMMARY events as UpcomingEvent tuples."""
+        now = time.time()
+        with self._lock:
+            entry = self._summaries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._summaries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        page = self.upcoming(user_id, limit=self.app.config['COOKZILLA_CALENDAR_SUMMARY'])
+        events = [UpcomingEvent(entry.event.id, entry.event.title, entry.event.timestamp, entry.event.location,
+                                entry.status, bool(entry.conflicts)) for entry in page.entries]
+        expires = now + self.app.config['COOKZILLA_CALENDAR_SUMMARY_TTL']
+        if events:
+            # the first event drops out of the summary once it starts
+            expires = min(expires, now + (events[0].timestamp - datetime.utcnow()).total_seconds())
+        with self._lock:
+            self._summaries[user_id] = (expires, events)
+            self._summaries.move_to_end(user_id)
+            while len(self._summaries) > self.app.config['COOKZILLA_CALENDAR_CACHE_USERS']:
+                self._summaries.popitem(last=False)
+        return events
+
+    def discard(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._summaries.pop(user_id, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._summaries = OrderedDict()
+
+    def _on_model_committed(self, app, changes):
+        from .models import Event, GroupMember, RSVP
+
+        if not self._summaries:
+            return
+        users, groups = set(), set()
+        for change in changes:
+            if isinstance(change.instance, (GroupMember, RSVP)):
+                users.add(change.values.get('member_id'))
+            elif isinstance(change.instance, Event):
+                if change.operation == 'update' and 'group_id' in change.changed:
+                    self.invalidate()
+                    return
+                if change.operation != 'update' or change.changed & set(['title', 'timestamp', 'location']):
+                    groups.add(change.values.get('group_id'))
+        groups.discard(None)
+        if groups:
+            from . import db
+            with db.get_engine(app).connect() as conn:
+                users.update(row[0] for row in conn.execute(
+                    sa.select([GroupMember.member_id]).where(GroupMember.group_id.in_(groups))))
+        users.discard(None)
+        if users:
+            self.discard(*users)
+
+    def _on_ddl(self, target, connection, **kw):
+        self.invalidate()
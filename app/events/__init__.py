@@ -1,5 +1,19 @@
 from flask import Blueprint
+from flask_login import current_user
 
 events = Blueprint('events', __name__)
 
 from . import views
+from .. import event_calendar
+from ..models import RSVPStatus
+
+
+@events.app_context_processor
+def inject_upcoming_events():
+    def upcoming_events():
+        """The navbar summary of the current user's next events, cached per user."""
+        # most users are in no group, their counter spares the query
+        if not current_user.is_authenticated or not current_user.group_count:
+            return []
+        return event_calendar.next_events(current_user.id)
+    return dict(upcoming_events=upcoming_events, RSVPStatus=RSVPStatus)
@@ -1,9 +1,14 @@
-from flask import render_template, redirect, url_for, abort, flash, request, current_app, make_response
+from datetime import datetime, timedelta
+
+from flask import render_template, redirect, url_for, abort, flash, request, current_app, make_response, jsonify
 from flask_login import login_required, current_user
 from . import events
 from .forms import EventForm, ReportForm
-from .. import db
+from .. import db, event_calendar
+from ..decorators import read_write
 from ..models import Group, Role, User, Recipe, Review, GroupMember, Event, Report, RSVP
+from ..pagination import paginate, encode_cursor, decode_cursor
+from ..rsvps import attendees
 
 
 @events.route('/create', methods=['GET', 'POST'])
@@ -39,6 +44,7 @@ def create():
 def event_profile(id):
     event = Event.query.get_or_404(id)
     group = event.group
+    current_user.preload_relations(users=[event.creator], groups=[group], events=[event])
     if not current_user.is_member(group):
         flash("You cannot see this event because you are not member")
         return redirect(url_for('groups.group_profile', id=group.id))
@@ -51,48 +57,88 @@ def event_profile(id):
                         body=form.body.data)
         db.session.add(report)
         flash('Your report has been published.')
-        return redirect(url_for('events.event_profile', id=event.id, page=-1))
-    page = request.args.get('page', 1, type=int)
-    if page == -1:
-        page = (event.reports.count() - 1) // \
-               current_app.config['COOKZILLA_COMMENTS_PER_PAGE'] + 1
-    pagination = event.reports.order_by(Report.timestamp.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_COMMENTS_PER_PAGE'],
-        error_out=False)
+        # newest reports come first
+        return redirect(url_for('events.event_profile', id=event.id))
+    pagination = paginate(event.reports, Report.timestamp, Report.id,
+                          current_app.config['COOKZILLA_COMMENTS_PER_PAGE'], total=event.report_count)
     reports = pagination.items
-    return render_template('events/event.html', event=event, form=form, reports=reports, pagination=pagination)
+    return render_template('events/event.html', event=event, form=form, reports=reports, pagination=pagination,
+                           attendees=attendees(event.id, current_app.config['COOKZILLA_ATTENDEES_SHOWN']))
 
 
 @events.route('/go/<int:id>')
+@read_write
 @login_required
 def go(id):
     event = Event.query.filter_by(id=id).first()
     if event is None:
         flash('Invalid event.')
         return redirect(url_for('.index'))
-    if current_user.is_go(event):
-        flash('You are going to this event.')
-        return redirect(url_for('events.event_profile', id=id))
     current_user.go(event)
-    flash('You have a new event: {}.'.format(event.title))
+    flash('You are going to this event: {}.'.format(event.title))
     return redirect(url_for('events.event_profile', id=id))
 
 
 @events.route('/ungo/<int:id>')
+@read_write
 @login_required
 def ungo(id):
     event = Event.query.filter_by(id=id).first()
     if event is None:
         flash('Invalid event.')
         return redirect(url_for('.index'))
-    if current_user.is_not_go(event):
-        flash('You are not going to this event.')
-        return redirect(url_for('events.event_profile', id=id))
     current_user.ungo(event)
     flash('You are not attending this event: {}'.format(event.title))
     return redirect(url_for('events.event_profile', id=id))
 
 
+@events.route('/maybe/<int:id>')
+@read_write
+@login_required
+def maybe(id):
+    event = Event.query.filter_by(id=id).first()
+    if event is None:
+        flash('Invalid event.')
+        return redirect(url_for('.index'))
+    current_user.maybe(event)
+    flash('You might go to this event: {}'.format(event.title))
+    return redirect(url_for('events.event_profile', id=id))
+
+
+@events.route('/calendar')
+@login_required
+def calendar():
+    """The upcoming events of the current user's groups, from ``from`` (a date, today by default) for ``days``."""
+    start = request.args.get('from')
+    if start:
+        try:
+            start = datetime.strptime(start, '%Y-%m-%d')
+        except ValueError:
+            abort(400)
+    else:
+        start = datetime.utcnow()
+    days = min(max(request.args.get('days', current_app.config['COOKZILLA_CALENDAR_DAYS'], type=int), 1),
+               current_app.config['COOKZILLA_CALENDAR_MAX_DAYS'])
+    after = request.args.get('after')
+    page = event_calendar.upcoming(current_user.id, start, start + timedelta(days=days),
+                                   after=decode_cursor(after) if after else None,
+                                   limit=current_app.config['COOKZILLA_POSTS_PER_PAGE'])
+    next_url = None
+    if page.more:
+        last = page.entries[-1].event
+        next_url = url_for('.calendar', after=encode_cursor(last.timestamp, last.id), days=days,
+                           **{'from': start.strftime('%Y-%m-%d')})
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        return jsonify({'events': [{'id': entry.event.id, 'title': entry.event.title,
+                                    'timestamp': entry.event.timestamp.isoformat(),
+                                    'location': entry.event.location, 'group_id': entry.event.group_id,
+                                    'status': entry.status, 'conflicts': entry.conflicts}
+                                   for entry in page.entries],
+                        'next': next_url})
+    return render_template('events/calendar.html', entries=page.entries, start=start, days=days,
+                           next_url=next_url)
+
+
 @events.route('/<username>')
 @login_required
 def event_list(username):
@@ -100,12 +146,11 @@ def event_list(username):
     if user is None:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    page = request.args.get('page', 1, type=int)
-    pagination = user.events.order_by(RSVP.timestamp.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(user.events, RSVP.timestamp, RSVP.event_id,
+                          current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'], total='cached')
     events = [{'user': item.member, 'event': item.event, 'timestamp': item.timestamp}
               for item in pagination.items]
+    user.preload_relations(events=[item['event'] for item in events])
     return render_template('events/my_events_list.html', user=user,
                            endpoint='.events', pagination=pagination,
                            events=events)
@@ -1,2 +1,18 @@
 class ValidationError(ValueError):
     pass
+
+
+class ReadOnlySessionError(RuntimeError):
+    pass
+
+
+class MailQueueFull(RuntimeError):
+    pass
+
+
+class ImgurError(Exception):
+    """An Imgur request failed: (message, HTTP status, decoded answer)."""
+
+    @property
+    def status(self):
+        return self.args[1] if len(self.args) > 1 else None
@@ -0,0 +1,284 @@
+import threading
+import time
+from collections import namedtuple, OrderedDict
+
+import sqlalchemy as sa
+
+from .signals import model_committed
+
+# rows fetched from the database per round trip while loading the bitmaps
+FETCH_SIZE = 100000
+# ids per IN clause, below SQLite's limit of bound parameters
+CHUNK_SIZE = 900
+
+#: serving size facet: (key, fewest people, most people or None)
+SERVING_BUCKETS = (('1', 1, 1), ('2', 2, 2), ('3-4', 3, 4), ('5-6', 5, 6), ('7+', 7, None))
+#: rating facet: (key, lowest average rating), a recipe is in every bucket it reaches
+RATING_BUCKETS = (('4+', 4), ('3+', 3), ('2+', 2))
+
+ALIVE = ('recipe', None)
+
+FacetResult = namedtuple('FacetResult', 'ids counts')
+
+
+def _popcounts():
+    import numpy as np
+    return np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def serving_bucket(serving):
+    """The SERVING_BUCKETS key of a number of people."""
+    serving = serving or 1
+    for key, low, high in SERVING_BUCKETS:
+        if serving >= low and (high is None or serving <= high):
+            return key
+    return SERVING_BUCKETS[0][0]
+
+
+def rating_buckets(rating):
+    """The RATING_BUCKETS keys an average rating reaches."""
+    return [key for key, low in RATING_BUCKETS if rating is not None and rating >= low]
+
+
+class FacetIndex(object):
+    """
+    Per-worker bitmaps of recipe ids for faceted browsing: one per tag,
+    per serving size bucket and per rating bucket, plus one of every recipe.
+
+    Bit ``i`` of a bitmap is recipe id ``i``, eight to a byte, and all the
+    bitmaps are the rows of one matrix. A filter such as "Vegan and Soup but
+    not Spicy" is a few row ANDs, and the counts of every facet within the
+    result are one AND of the whole matrix with it and a popcount. A million
+    recipes take 125 KB per facet.
+
+    The bitmaps are loaded with one scan of recipes, recipe_tags and reviews
+    on first use and reloaded after COOKZILLA_FACETS_TTL seconds, which
+    bounds how long changes made through another worker stay invisible.
+    Commits in this worker that tag or untag a recipe, add, change or delete
+    one, or review it, update its bits in a copy of the matrix that then
+    replaces the published one, so a browse() in another thread never sees
+    a half-updated recipe.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+
+        self.app = app
+        app.extensions['facets'] = self
+        self.invalidate()
+        model_committed.connect(self._on_model_committed, sender=app)
+        for event in ('after_create', 'after_drop'):
+            if not sa.event.contains(db.metadata, event, self._on_ddl):
+                sa.event.listen(db.metadata, event, self._on_ddl)
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    @property
+    def size(self):
+        """(facets, bytes of bitmaps) of the loaded index."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return 0, 0
+        return len(snapshot['rows']) - 1, snapshot['matrix'].nbytes
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def browse(self, tags=(), any_tags=(), not_tags=(), serving=None, rating=None):
+        """
+        The recipes with every tag of ``tags``, at least one of
+        ``any_tags`` and none of ``not_tags``, in the ``serving`` and
+        ``rating`` buckets when given.
+
+        Returns a FacetResult of the recipe ids, highest id first, and the
+        number of them in each facet: {('tag', tag id) or ('serving', key)
+        or ('rating', key): count}.
+        """
+        import numpy as np
+
+        snapshot = self._get()
+        matrix, rows = snapshot['matrix'], snapshot['rows']
+        empty = np.zeros(matrix.shape[1], dtype=np.uint8)
+
+        def bitmap(label):
+            row = rows.get(label)
+            return empty if row is None else matrix[row]
+
+        result = matrix[rows[ALIVE]].copy()
+        for tag in tags:
+            result &= bitmap(('tag', tag))
+        if any_tags:
+            either = empty.copy()
+            for tag in any_tags:
+                either |= bitmap(('tag', tag))
+            result &= either
+        for tag in not_tags:
+            result &= ~bitmap(('tag', tag))
+        if serving is not None:
+            result &= bitmap(('serving', serving))
+        if rating is not None:
+            result &= bitmap(('rating', rating))
+
+        counts = snapshot['popcount'][matrix & result].sum(axis=1, dtype=np.int64)
+        facets = OrderedDict((label, int(counts[row])) for label, row in rows.items() if label != ALIVE)
+        ids = np.flatnonzero(np.unpackbits(result))[::-1]
+        return FacetResult(ids, facets)
+
+    def _get(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot['expires'] < time.time():
+            snapshot = self._load()
+        return snapshot
+
+    def _labels(self, conn):
+        from .models import Tag
+
+        labels = [ALIVE]
+        labels += [('tag', row[0]) for row in conn.execute(sa.select([Tag.id]).order_by(Tag.id))]
+        labels += [('serving', bucket[0]) for bucket in SERVING_BUCKETS]
+        labels += [('rating', bucket[0]) for bucket in RATING_BUCKETS]
+        return OrderedDict((label, i) for i, label in enumerate(labels))
+
+    def _load(self):
+        import numpy as np
+        from . import db
+
+        def fetch(query, columns):
+            result = conn.execute(query)
+            chunks = []
+            while True:
+                rows = result.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                chunks.append(np.array([tuple(row) for row in rows], dtype=np.float64).reshape(-1, columns))
+            return np.concatenate(chunks) if chunks else np.zeros((0, columns))
+
+        with db.get_engine(self.app).connect() as conn:
+            rows = self._labels(conn)
+            recipes, tagged, rated = (fetch(query, 2) for query in self._queries(None))
+        size = int(recipes[:, 0].max(initial=0)) + 1
+        bits = np.zeros((len(rows), size), dtype=bool)
+        recipe = recipes[:, 0].astype(np.int64)
+        bits[rows[ALIVE], recipe] = True
+        serving = np.where(np.isnan(recipes[:, 1]), 1, recipes[:, 1])
+        for key, low, high in SERVING_BUCKETS:
+            inside = (serving >= low) & ((serving <= high) if high is not None else True)
+            if key == SERVING_BUCKETS[0][0]:
+                inside |= serving < low
+            bits[rows[('serving', key)], recipe[inside]] = True
+        tag_ids = [label[1] for label in rows if label[0] == 'tag']
+        tag_rows = np.full(max(tag_ids + [0]) + 1, -1, dtype=np.int64)
+        tag_rows[tag_ids] = [rows[('tag', tag_id)] for tag_id in tag_ids]
+        tagged = tagged[(tagged[:, 0] < size) & (tagged[:, 1] < len(tag_rows))].astype(np.int64)
+        tag_row = tag_rows[tagged[:, 1]]
+        bits[tag_row[tag_row >= 0], tagged[tag_row >= 0, 0]] = True
+        rated = rated[rated[:, 0] < size]
+        for key, low in RATING_BUCKETS:
+            bits[rows[('rating', key)], rated[rated[:, 1] >= low, 0].astype(np.int64)] = True
+        # deleted recipes keep their ratings and tags out of every result
+        bits &= bits[rows[ALIVE]]
+
+        snapshot = dict(rows=rows, matrix=np.packbits(bits, axis=1), popcount=_popcounts(),
+                        expires=time.time() + self.app.config['COOKZILLA_FACETS_TTL'])
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def _queries(recipe_ids):
+        """Select (id, serving), (recipe id, tag id) and (recipe id, average rating) of the recipes."""
+        from .models import Recipe, Review, recipe_tags
+
+        recipes = sa.select([Recipe.id, Recipe.serving])
+        tagged = sa.select([recipe_tags.c.recipe_id, recipe_tags.c.tag_id]) \
+            .where(sa.and_(recipe_tags.c.recipe_id.isnot(None), recipe_tags.c.tag_id.isnot(None)))
+        rated = sa.select([Review.recipe_id, sa.func.avg(Review.rating)]) \
+            .where(sa.and_(Review.recipe_id.isnot(None), Review.rating.isnot(None),
+                           sa.or_(Review.disabled.is_(None), Review.disabled == sa.false()))) \
+            .group_by(Review.recipe_id)
+        if recipe_ids is not None:
+            recipes = recipes.where(Recipe.id.in_(recipe_ids))
+            tagged = tagged.where(recipe_tags.c.recipe_id.in_(recipe_ids))
+            rated = rated.where(Review.recipe_id.in_(recipe_ids))
+        return recipes, tagged, rated
+
+    def refresh(self, recipe_ids):
+        """Reread the facets of the given recipes into the loaded bitmaps."""
+        import numpy as np
+        from . import db
+
+        if self._snapshot is None:
+            return
+        recipe_ids = sorted(set(int(i) for i in recipe_ids))
+        facets = dict((recipe_id, []) for recipe_id in recipe_ids)
+        with db.get_engine(self.app).connect() as conn:
+            for start in range(0, len(recipe_ids), CHUNK_SIZE):
+                recipes, tagged, rated = self._queries(recipe_ids[start:start + CHUNK_SIZE])
+                for recipe_id, serving in conn.execute(recipes):
+                    facets[recipe_id] += [ALIVE, ('serving', serving_bucket(serving))]
+                for recipe_id, tag_id in conn.execute(tagged):
+                    facets[recipe_id].append(('tag', tag_id))
+                for recipe_id, rating in conn.execute(rated):
+                    facets[recipe_id] += [('rating', key) for key in rating_buckets(rating)]
+            labels = self._labels(conn)
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            rows, matrix = OrderedDict(snapshot['rows']), snapshot['matrix']
+            added = [label for label in labels if label not in rows]
+            width = max(matrix.shape[1], (max(recipe_ids) >> 3) + 1)
+            if added or width > matrix.shape[1]:
+                # grow to twice the width needed, so new recipes rarely copy the matrix
+                if width > matrix.shape[1]:
+                    width *= 2
+                grown = np.zeros((len(rows) + len(added), width), dtype=np.uint8)
+                grown[:matrix.shape[0], :matrix.shape[1]] = matrix
+                for label in added:
+                    rows[label] = len(rows)
+                matrix = grown
+            else:
+                # browse() reads the published matrix without the lock
+                matrix = matrix.copy()
+            for recipe_id, recipe_labels in facets.items():
+                byte, bit = recipe_id >> 3, np.uint8(0x80 >> (recipe_id & 7))
+                matrix[:, byte] &= ~bit
+                if ALIVE in recipe_labels:
+                    for label in recipe_labels:
+                        if label in rows:
+                            matrix[rows[label], byte] |= bit
+            self._snapshot = dict(snapshot, rows=rows, matrix=matrix)
+
+    def _on_model_committed(self, app, changes):
+        from .models import Recipe, Review, Tag
+
+        if self._snapshot is None:
+            return
+        stale = set()
+        for change in changes:
+            if isinstance(change.instance, Recipe):
+                if change.operation != 'update' or change.changed & set(['serving', 'tags']):
+                    stale.add(change.values['id'])
+            elif isinstance(change.instance, Review):
+                if change.operation != 'update' or change.changed & set(['rating', 'disabled', 'recipe_id']):
+                    stale.add(change.values['recipe_id'])
+            elif isinstance(change.instance, Tag) and change.operation == 'delete':
+                self.invalidate()
+                return
+        stale.discard(None)
+        if stale:
+            self.refresh(stale)
+
+    def _on_ddl(self, target, connection, **kw):
+        self.invalidate()
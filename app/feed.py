@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask_sqlalchemy import Pagination
+
+from .signals import model_committed
+
+
+class FeedCache(object):
+    """
+    Materialized "followed" home feed.
+
+    A user's feed is the ranked list of recipe ids built from their own log
+    counts plus every recipe of the people they follow. It is computed with a
+    single query, kept in a per-worker LRU with a TTL and, when
+    COOKZILLA_FEED_TABLE is set, in the feeds table so workers can share it.
+    Pages are then served with one primary key IN query.
+
+    Entries are dropped when the user follows or unfollows someone and when
+    a followed author posts a recipe. Reordering by the user's own browsing
+    shows up once the entry is older than COOKZILLA_FEED_TTL; dropping it on
+    every log flush would recompute the feed of every active user.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['feed_cache'] = self
+        model_committed.connect(self._on_model_committed, sender=app)
+
+    def get(self, user_id):
+        """Return the ranked recipe ids of the user's feed."""
+        ids = self._get_cached(user_id)
+        if ids is None:
+            self.misses += 1
+            ids = self._load(user_id)
+            if ids is None:
+                ids = self.compute(user_id)
+                self._store(user_id, ids)
+            self._put(user_id, ids)
+        else:
+            self.hits += 1
+        return ids
+
+    def paginate(self, user_id, page, per_page):
+        from .models import Recipe
+
+        ids = self.get(user_id)
+        page_ids = ids[(page - 1) * per_page:page * per_page] if page > 0 else []
+        items = []
+        if page_ids:
+            recipes = dict((r.id, r) for r in Recipe.query.filter(Recipe.id.in_(page_ids)))
+            items = [recipes[i] for i in page_ids if i in recipes]
+        return Pagination(None, page, per_page, len(ids), items)
+
+    def compute(self, user_id):
+        from . import db
+        from .models import Follow, LogEvent, Recipe
+
+        logged = db.session.query(LogEvent.recipe_id.label('recipe_id'),
+                                  sa.func.sum(LogEvent.ct).label('score')) \
+            .filter(LogEvent.user_id == user_id).group_by(LogEvent.recipe_id)
+        followed = db.session.query(Recipe.id.label('recipe_id'),
+                                    sa.literal_column('1', sa.Integer).label('score')) \
+            .join(Follow, Follow.followed_id == Recipe.author_id) \
+            .filter(Follow.follower_id == user_id)
+        candidates = sa.union_all(logged, followed).alias('candidates')
+        rows = db.session.query(candidates.c.recipe_id) \
+            .join(Recipe, Recipe.id == candidates.c.recipe_id) \
+            .group_by(candidates.c.recipe_id, Recipe.timestamp) \
+            .order_by(sa.func.sum(candidates.c.score).desc(), Recipe.timestamp.desc()) \
+            .limit(self.app.config['COOKZILLA_FEED_SIZE'])
+        return [row[0] for row in rows]
+
+    def invalidate(self, *user_ids):
+        if not user_ids:
+            return
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+        if self.app.config['COOKZILLA_FEED_TABLE']:
+            from . import db
+            from .models import Feed
+            with db.get_engine(self.app).begin() as conn:
+                conn.execute(Feed.__table__.delete().where(Feed.user_id.in_(user_ids)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get_cached(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            ids, expires = entry
+            if expires < time.time():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return ids
+
+    def _put(self, user_id, ids):
+        with self._lock:
+            self._entries[user_id] = (ids, time.time() + self.app.config['COOKZILLA_FEED_TTL'])
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.app.config['COOKZILLA_FEED_CACHE_USERS']:
+                self._entries.popitem(last=False)
+
+    def _load(self, user_id):
+        if not self.app.config['COOKZILLA_FEED_TABLE']:
+            return None
+        from . import db
+        from .models import Feed
+        oldest = datetime.utcnow() - timedelta(seconds=self.app.config['COOKZILLA_FEED_TTL'])
+        row = db.session.query(Feed.recipe_ids) \
+            .filter(Feed.user_id == user_id, Feed.computed_at > oldest).first()
+        if row is None:
+            return None
+        return [int(i) for i in row[0].split(',')] if row[0] else []
+
+    def _store(self, user_id, ids):
+        if not self.app.config['COOKZILLA_FEED_TABLE']:
+            return
+        from . import db
+        from .models import Feed
+        table = Feed.__table__
+        with db.get_engine(self.app).begin() as conn:
+            conn.execute(table.delete().where(table.c.user_id == user_id))
+            conn.execute(table.insert(), user_id=user_id, computed_at=datetime.utcnow(),
+                         recipe_ids=','.join(str(i) for i in ids))
+
+    def _on_model_committed(self, app, changes):
+        from .models import Follow, Recipe
+
+        users, authors = set(), set()
+        for change in changes:
+            if isinstance(change.instance, Follow) and change.operation != 'update':
+                users.add(change.values['follower_id'])
+            elif isinstance(change.instance, Recipe) and change.operation == 'insert':
+                authors.add(change.values['author_id'])
+        if authors:
+            from . import db
+            with db.get_engine(app).connect() as conn:
+                users.update(row[0] for row in conn.execute(
+                    sa.select([Follow.follower_id]).where(Follow.followed_id.in_(authors))))
+        users.discard(None)
+        self.invalidate(*users)
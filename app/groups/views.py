@@ -4,7 +4,9 @@ from datetime import datetime
 from . import groups
 from .forms import GroupForm
 from .. import db
+from ..decorators import read_write
 from ..models import Group, Role, User, Recipe, Review, GroupMember, Event
+from ..pagination import paginate
 
 
 @groups.route('/create', methods=['GET', 'POST'])
@@ -30,11 +32,10 @@ def create():
 @login_required
 def group_profile(id):
     group = Group.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = group.events.order_by(Event.timestamp.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_POSTS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(group.events, Event.timestamp, Event.id,
+                          current_app.config['COOKZILLA_POSTS_PER_PAGE'], total=group.event_count)
     events = pagination.items
+    current_user.preload_relations(users=[group.creator], groups=[group])
     return render_template('groups/group.html', group=group, events=events, pagination=pagination)
 
 
@@ -45,10 +46,8 @@ def group_list(username):
     if user is None:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    page = request.args.get('page', 1, type=int)
-    pagination = user.groups.order_by(GroupMember.member_since.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(user.groups, GroupMember.member_since, GroupMember.group_id,
+                          current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'], total=user.group_count)
     groups = [{'user': item.member, 'group': item.group, 'member_since': item.member_since}
               for item in pagination.items]
     return render_template('groups/my_groups_list.html', user=user,
@@ -57,6 +56,7 @@ def group_list(username):
 
 
 @groups.route('/member/<int:id>')
+@read_write
 @login_required
 def member(id):
     group = Group.query.filter_by(id=id).first()
@@ -72,6 +72,7 @@ def member(id):
 
 
 @groups.route('/unmember/<int:id>')
+@read_write
 @login_required
 def unmember(id):
     group = Group.query.filter_by(id=id).first()
@@ -0,0 +1,178 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+#: variant name: height in CSS pixels
+VARIANTS = {
+    'thumb': 200,  # recipe lists
+    'detail': 400,  # recipe page
+}
+DENSITIES = (1, 2)
+
+# photos remembered as not processed yet, past which the memory is cleared
+MISSING_CACHE_SIZE = 10000
+
+
+def derivative_name(filename, variant, density=1):
+    stem = os.path.splitext(filename)[0]
+    return '{}-{}{}.jpg'.format(stem, variant, '' if density == 1 else '-{}x'.format(density))
+
+
+def make_derivatives(source, quality=85):
+    """
+    Write every variant of the image at ``source`` next to it.
+
+    Derivatives are RGB progressive JPEGs without EXIF or other metadata,
+    never upscaled past the original. JPEGs are decoded at the smallest DCT
+    scale still covering the largest variant, and each variant is resized
+    from the next larger one. Each file is written to a temporary name and
+    renamed, so a derivative that exists is complete. Runs in the worker
+    processes, so it must not touch the app. Returns the names written.
+    """
+    from PIL import Image, ImageOps
+
+    directory, filename = os.path.split(source)
+    targets = sorted(set((variant, height * density) for variant, height in VARIANTS.items()
+                         for density in DENSITIES), key=lambda t: -t[1])
+    written = []
+    with Image.open(source) as original:
+        largest = targets[0][1]
+        if original.height > largest:
+            original.draft('RGB', (original.width * largest // original.height, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        for variant, height in targets:
+            if height < image.height:
+                width = max(int(round(image.width * height / float(image.height))), 1)
+                image = image.resize((width, height), Image.LANCZOS)
+            name = derivative_name(filename, variant, height // VARIANTS[variant])
+            path = os.path.join(directory, name)
+            image.save(path + '.tmp', 'JPEG', quality=quality, optimize=True, progressive=True)
+            os.rename(path + '.tmp', path)
+            written.append(name)
+    return written
+
+
+class ImagePipeline(object):
+    """
+    Resizes uploaded recipe photos into list and detail sized derivatives,
+    plus 2x variants for high density screens, in a pool of
+    COOKZILLA_IMAGE_WORKERS processes (every core by default; 0 processes
+    uploads inline, which the tests use).
+
+    Uploads are saved as they come and queued with submit(); pages keep
+    showing the original until its derivatives exist, srcset() then points
+    the templates at them. A photo found without derivatives is not looked
+    for on disk again for COOKZILLA_IMAGE_MISSING_TTL seconds, unless this
+    worker finishes processing it sooner.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._ready = set()
+        self._missing = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['image_pipeline'] = self
+        app.add_template_global(self.srcset, 'photo_srcset')
+
+    @property
+    def upload_folder(self):
+        return os.path.join(self.app.static_folder, 'upload')
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.app.config['COOKZILLA_IMAGE_WORKERS'] or None)
+            return self._executor
+
+    def submit(self, filename, recipe_id=None):
+        """Queue the derivatives of an upload; ``recipe_id``'s pages are purged when they are done."""
+        source = os.path.join(self.upload_folder, filename)
+        quality = self.app.config['COOKZILLA_IMAGE_QUALITY']
+        if self.app.config['COOKZILLA_IMAGE_WORKERS'] == 0:
+            try:
+                self._done(source, recipe_id, make_derivatives(source, quality))
+            except Exception:
+                logger.exception('Could not resize %s', source)
+            return None
+        future = self._get_executor().submit(make_derivatives, source, quality)
+        future.add_done_callback(lambda f: self._on_done(f, source, recipe_id))
+        return future
+
+    def map(self, filenames, chunksize=16):
+        """Process a backlog of uploads on every worker, yielding the names written per upload."""
+        quality = self.app.config['COOKZILLA_IMAGE_QUALITY']
+        sources = [os.path.join(self.upload_folder, filename) for filename in filenames]
+        for written in self._get_executor().map(make_derivatives, sources,
+                                                [quality] * len(sources), chunksize=chunksize):
+            yield written
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _on_done(self, future, source, recipe_id):
+        if future.exception() is not None:
+            logger.error('Could not resize %s: %s', source, future.exception())
+            return
+        self._done(source, recipe_id, future.result())
+
+    def _done(self, source, recipe_id, written):
+        from . import response_cache
+
+        with self._lock:
+            self._ready.update(written)
+            self._missing.pop(os.path.basename(source), None)
+        if recipe_id is not None:
+            response_cache.purge('recipe', recipe_id)
+            for kind in ('index', 'tag', 'user'):
+                response_cache.purge(kind)
+
+    def _has(self, name):
+        if name in self._ready:
+            return True
+        if os.path.exists(os.path.join(self.upload_folder, name)):
+            with self._lock:
+                self._ready.add(name)
+            return True
+        return False
+
+    def srcset(self, url, variant):
+        """
+        (src, srcset) for showing the photo at ``url`` as ``variant``.
+        Photos that are not uploads, or whose derivatives are still being
+        made, keep their original url and an empty srcset.
+        """
+        prefix = self.app.static_url_path + '/upload/'
+        if not url or not url.startswith(prefix):
+            return url, ''
+        filename = url[len(prefix):]
+        if self._missing.get(filename, 0) > time.time():
+            return url, ''
+        names = [derivative_name(filename, variant, density) for density in DENSITIES]
+        if not all(self._has(name) for name in names):
+            with self._lock:
+                if len(self._missing) >= MISSING_CACHE_SIZE:
+                    self._missing.clear()
+                self._missing[filename] = time.time() + self.app.config['COOKZILLA_IMAGE_MISSING_TTL']
+            return url, ''
+        urls = [prefix + name for name in names]
+        return urls[0], ', '.join('{} {}x'.format(u, density) for u, density in zip(urls, DENSITIES))
@@ -0,0 +1,263 @@
+import threading
+import time
+
+import sqlalchemy as sa
+
+from .signals import model_committed
+
+# rows fetched from the database per round trip while loading the index
+FETCH_SIZE = 100000
+# ids per IN clause, below SQLite's limit of bound parameters
+CHUNK_SIZE = 900
+
+
+def normalize(name):
+    """The index term of an ingredient name: "Garlic " and "garlic" are the same ingredient."""
+    return ' '.join((name or '').lower().split())
+
+
+def _build(names, name_index, recipe):
+    """
+    The snapshot of ingredient rows given as ``names[name_index[i]]`` used
+    by ``recipe[i]``: sorted terms, and per term the sorted ids of the
+    recipes using it, all terms' ids in one array with an offsets array.
+    """
+    import numpy as np
+
+    # blank names sort first as '', which is no ingredient
+    normalized = np.array([''] + [normalize(n) for n in names], dtype=object)
+    terms, term_of_name = np.unique(normalized, return_inverse=True)
+    term = term_of_name.ravel()[1:][name_index]
+    recipe = np.asarray(recipe, dtype=np.int64)
+    keep = term > 0
+    terms, term, recipe = terms[1:], term[keep] - 1, recipe[keep]
+    order = np.lexsort((recipe, term))
+    term, recipe = term[order], recipe[order]
+    # "Salt" and "salt" in one recipe count once
+    keep = np.ones(len(term), dtype=bool)
+    keep[1:] = (term[1:] != term[:-1]) | (recipe[1:] != recipe[:-1])
+    term, recipe = term[keep], recipe[keep]
+    postings = recipe.astype(np.uint32) if not len(recipe) or recipe.max() < 2 ** 32 else recipe
+    recipes, sizes = np.unique(recipe, return_counts=True)
+    return dict(terms=dict((t, i) for i, t in enumerate(terms.tolist())),
+                offsets=np.searchsorted(term, np.arange(len(terms) + 1)), postings=postings,
+                recipes=recipes, sizes=sizes, pending={}, pending_ids=np.zeros(0, dtype=np.int64))
+
+
+class IngredientIndex(object):
+    """
+    Per-worker inverted index from ingredient to the recipes using it, for
+    "recipes with garlic and basil but no pork" and "what can I cook with
+    what I have" queries.
+
+    Every ingredient name (matched case-insensitively) has a sorted array of
+    recipe ids, and every recipe its number of ingredients, so a query is a
+    few array intersections. The index is loaded with one scan of the
+    ingredients table on first use and reloaded after
+    COOKZILLA_INGREDIENT_INDEX_TTL seconds, which bounds how long recipes
+    written through another worker stay invisible. Commits in this worker
+    apply at once: recipes whose ingredients changed are kept aside and
+    merged into the arrays once COOKZILLA_INGREDIENT_INDEX_PENDING of them
+    pile up. Bulk ``Query.update()`` and ``Query.delete()`` calls bypass the
+    session's change tracking and only show up after the next reload.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+
+        self.app = app
+        app.extensions['ingredient_index'] = self
+        self.invalidate()
+        model_committed.connect(self._on_model_committed, sender=app)
+        for event in ('after_create', 'after_drop'):
+            if not sa.event.contains(db.metadata, event, self._on_ddl):
+                sa.event.listen(db.metadata, event, self._on_ddl)
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    @property
+    def size(self):
+        """(ingredients, recipe ids stored, bytes of arrays) of the loaded index."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return 0, 0, 0
+        return len(snapshot['terms']), len(snapshot['postings']), sum(
+            snapshot[key].nbytes for key in ('offsets', 'postings', 'recipes', 'sizes'))
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def recipes_with(self, name):
+        """The ids of the recipes using ``name``, newest first."""
+        return self.find(with_all=[name])[0]
+
+    def recipes_with_any(self, names):
+        """The sorted ids of the recipes using any of ``names``."""
+        import numpy as np
+
+        found = [self.recipes_with(name) for name in names]
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def find(self, with_all=(), without=(), have=None, missing=0):
+        """
+        Find recipes by their ingredients.
+
+        Recipes use every ingredient of ``with_all`` and none of
+        ``without``. With ``have``, a pantry, recipes also use at least one
+        ingredient of ``have`` and at most ``missing`` ingredients that are
+        not in it. Only recipes with ingredients are found.
+
+        Returns (recipe ids, missing ingredients) arrays ordered by fewest
+        missing ingredients, then newest recipe first.
+        """
+        import numpy as np
+
+        snapshot = self._get()
+        with_all = set(filter(None, map(normalize, with_all)))
+        without = set(filter(None, map(normalize, without)))
+        pantry = None if have is None else set(filter(None, map(normalize, have)))
+
+        def posting(term):
+            index = snapshot['terms'].get(term)
+            if index is None:
+                return snapshot['postings'][:0]
+            return snapshot['postings'][snapshot['offsets'][index]:snapshot['offsets'][index + 1]]
+
+        if pantry is not None:
+            lists = [posting(term) for term in pantry]
+            ids, matched = np.unique(np.concatenate(lists).astype(np.int64) if lists else
+                                     np.zeros(0, dtype=np.int64), return_counts=True)
+            needed = snapshot['sizes'][np.searchsorted(snapshot['recipes'], ids)] - matched
+            keep = needed <= missing
+            ids, needed = ids[keep], needed[keep]
+        elif with_all:
+            # start from the rarest ingredient, the other lists only filter it
+            ids = min((posting(term) for term in with_all), key=len).astype(np.int64)
+            needed = np.zeros(len(ids), dtype=np.int64)
+        else:
+            ids, needed = snapshot['recipes'], np.zeros(len(snapshot['recipes']), dtype=np.int64)
+        keep = ~np.isin(ids, snapshot['pending_ids'], assume_unique=True)
+        for term in with_all:
+            keep &= np.isin(ids, posting(term), assume_unique=True)
+        for term in without:
+            keep &= ~np.isin(ids, posting(term), assume_unique=True)
+        ids, needed = ids[keep], needed[keep]
+
+        # recipes changed since the arrays were built
+        extra = []
+        for recipe_id, terms in snapshot['pending'].items():
+            if not terms or not with_all <= terms or without & terms:
+                continue
+            if pantry is not None:
+                short = len(terms - pantry)
+                if short > missing or short == len(terms):
+                    continue
+                extra.append((recipe_id, short))
+            else:
+                extra.append((recipe_id, 0))
+        if extra:
+            ids = np.concatenate([ids, np.array([e[0] for e in extra], dtype=np.int64)])
+            needed = np.concatenate([needed, np.array([e[1] for e in extra], dtype=np.int64)])
+        order = np.lexsort((-ids, needed))
+        return ids[order], needed[order]
+
+    def _get(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot['expires'] < time.time():
+            snapshot = self._load()
+        return snapshot
+
+    def _load(self):
+        import numpy as np
+        from . import db
+        from .models import Ingredient
+
+        names, name_index, recipe = {}, [], []
+        with db.get_engine(self.app).connect() as conn:
+            result = conn.execute(sa.select([Ingredient.recipe_id, Ingredient.name])
+                                  .where(Ingredient.recipe_id.isnot(None)))
+            while True:
+                rows = result.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                for recipe_id, name in rows:
+                    recipe.append(recipe_id)
+                    name_index.append(names.setdefault(name, len(names)))
+        snapshot = _build(list(names), np.array(name_index, dtype=np.int64), recipe)
+        snapshot['expires'] = time.time() + self.app.config['COOKZILLA_INGREDIENT_INDEX_TTL']
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def _fold(self, snapshot):
+        """A snapshot with the pending recipes merged into the arrays."""
+        import numpy as np
+
+        terms = sorted(snapshot['terms'], key=snapshot['terms'].get)
+        term = np.repeat(np.arange(len(terms)), np.diff(snapshot['offsets']))
+        recipe = snapshot['postings'].astype(np.int64)
+        keep = ~np.isin(recipe, snapshot['pending_ids'])
+        term, recipe = list(term[keep]), list(recipe[keep])
+        index = dict((t, i) for i, t in enumerate(terms))
+        for recipe_id, names in snapshot['pending'].items():
+            for name in names:
+                if name not in index:
+                    index[name] = len(terms)
+                    terms.append(name)
+                term.append(index[name])
+                recipe.append(recipe_id)
+        folded = _build(terms, np.array(term, dtype=np.int64), recipe)
+        folded['expires'] = snapshot['expires']
+        return folded
+
+    def _on_model_committed(self, app, changes):
+        import numpy as np
+        from . import db
+        from .models import Ingredient, Recipe
+
+        if self._snapshot is None:
+            return
+        stale, deleted = set(), set()
+        for change in changes:
+            if isinstance(change.instance, Ingredient):
+                stale.add(change.values['recipe_id'])
+            elif isinstance(change.instance, Recipe) and change.operation == 'delete':
+                deleted.add(change.values['id'])
+            elif isinstance(change.instance, Recipe) and change.operation == 'insert':
+                # bulk writes insert the ingredients of a new recipe past the session
+                stale.add(change.values['id'])
+        stale -= deleted
+        stale.discard(None)
+        if not stale and not deleted:
+            return
+        terms = dict((recipe_id, set()) for recipe_id in stale | deleted)
+        stale = sorted(stale)
+        with db.get_engine(self.app).connect() as conn:
+            for start in range(0, len(stale), CHUNK_SIZE):
+                for recipe_id, name in conn.execute(
+                        sa.select([Ingredient.recipe_id, Ingredient.name])
+                        .where(Ingredient.recipe_id.in_(stale[start:start + CHUNK_SIZE]))):
+                    terms[recipe_id].add(normalize(name))
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            pending = dict(snapshot['pending'])
+            pending.update((recipe_id, frozenset(filter(None, names))) for recipe_id, names in terms.items())
+            snapshot = dict(snapshot, pending=pending, pending_ids=np.array(sorted(pending), dtype=np.int64))
+            if len(pending) > self.app.config['COOKZILLA_INGREDIENT_INDEX_PENDING']:
+                snapshot = self._fold(snapshot)
+            self._snapshot = snapshot
+
+    def _on_ddl(self, target, connection, **kw):
+        self.invalidate()
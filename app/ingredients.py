@@ -0,0 +1,144 @@
+"""
+Ingredient math: quantities in base units, recipes scaled to a number of
+servings and shopping lists summed over many recipes.
+
+INGREDIENT_CONVERSION gives every unit as an amount per kilogram. Units
+listed in INGREDIENT_VOLUME_UNITS measure volume and are converted to
+milliliters, the others to grams. Units missing from the table are free
+form ("pinch", "clove") and only add up with the same unit.
+"""
+from collections import namedtuple
+
+import sqlalchemy as sa
+from flask import current_app
+
+MASS, VOLUME, OTHER = 0, 1, 2
+
+#: the unit quantities of each kind are converted to
+BASE_UNITS = {MASS: 'gram(g)', VOLUME: 'milliliter(ml)'}
+#: the unit a total of this kind is shown in once it reaches 1000 base units
+LARGE_UNITS = {MASS: 'kilogram(kg)', VOLUME: 'liter(l)'}
+
+# ids per IN clause, below SQLite's limit of bound parameters
+CHUNK_SIZE = 900
+
+ShoppingItem = namedtuple('ShoppingItem', 'name quantity unit recipes')
+ScaledIngredient = namedtuple('ScaledIngredient', 'name quantity unit base_quantity base_unit')
+
+
+class UnitTable(object):
+    """The kind and the factor to its base unit of every unit in the conversion table."""
+
+    def __init__(self, conversion, volume_units):
+        self.conversion = conversion
+        self.kinds = {}
+        self.factors = {}
+        for name, per_kilogram in conversion.items():
+            kind = VOLUME if name in volume_units else MASS
+            self.kinds[name] = kind
+            self.factors[name] = conversion[BASE_UNITS[kind]] / per_kilogram
+
+    def lookup(self, units):
+        """
+        (distinct units, index into them, kind, factor) of an array of unit
+        strings, with one dict lookup per distinct unit.
+        """
+        import numpy as np
+
+        distinct, inverse = np.unique(np.asarray(units, dtype=object).astype(str), return_inverse=True)
+        kinds = np.array([self.kinds.get(u, OTHER) for u in distinct], dtype=np.int64)
+        factors = np.array([self.factors.get(u, 1.0) for u in distinct])
+        inverse = inverse.ravel()
+        return distinct, inverse, kinds[inverse], factors[inverse]
+
+    def display(self, kind, quantity, unit):
+        """(quantity, unit) of a total in base units, in the larger unit when it reads better."""
+        if kind == OTHER:
+            return quantity, unit
+        if quantity >= 1000 and LARGE_UNITS[kind] in self.factors:
+            return quantity / self.factors[LARGE_UNITS[kind]], LARGE_UNITS[kind]
+        return quantity, BASE_UNITS[kind]
+
+
+def unit_table():
+    """The UnitTable of the current app's configuration."""
+    config = current_app.config
+    cached = current_app.extensions.get('cookzilla_units')
+    if cached is None or cached.conversion is not config['INGREDIENT_CONVERSION']:
+        cached = current_app.extensions['cookzilla_units'] = UnitTable(
+            config['INGREDIENT_CONVERSION'], frozenset(config['INGREDIENT_VOLUME_UNITS']))
+    return cached
+
+
+def _rows(recipe_ids):
+    """(recipe id, servings, name, unit, quantity) of every ingredient of the recipes."""
+    from . import db
+    from .models import Ingredient, Recipe
+
+    rows = []
+    query = sa.select([Ingredient.recipe_id, Recipe.serving, Ingredient.name, Ingredient.unit,
+                       Ingredient.quantity]) \
+        .select_from(sa.join(Ingredient, Recipe, Ingredient.recipe_id == Recipe.id))
+    for start in range(0, len(recipe_ids), CHUNK_SIZE):
+        rows.extend(db.session.execute(
+            query.where(Ingredient.recipe_id.in_(recipe_ids[start:start + CHUNK_SIZE]))).fetchall())
+    return rows
+
+
+def scale(recipe, servings):
+    """The ingredients of ``recipe`` for ``servings`` people, in their own and in base units."""
+    table = unit_table()
+    ratio = float(servings) / (recipe.serving or 1)
+    scaled = []
+    for ingredient in recipe.ingredients.order_by('name'):
+        quantity = (ingredient.quantity or 0) * ratio
+        kind = table.kinds.get(ingredient.unit, OTHER)
+        base = quantity * table.factors.get(ingredient.unit, 1.0)
+        scaled.append(ScaledIngredient(ingredient.name, quantity, ingredient.unit,
+                                       *table.display(kind, base, ingredient.unit)))
+    return scaled
+
+
+def shopping_list(servings):
+    """
+    Sum the ingredients of many recipes into one list.
+
+    ``servings`` maps recipe ids to the number of people each is cooked
+    for, None keeps the recipe's own serving. Ingredients are matched by
+    case-insensitive name and by kind of unit, so "Sugar" in cups and
+    "sugar" in tablespoons add up while sugar in grams is a line of its
+    own. Returns ShoppingItem tuples ordered by name.
+    """
+    import numpy as np
+
+    recipe_ids = sorted(servings)
+    rows = _rows(recipe_ids)
+    if not rows:
+        return []
+    table = unit_table()
+    recipe, serving, names, units, quantities = (np.array(column, dtype=object) for column in zip(*rows))
+
+    wanted = np.array([servings[r] for r in recipe_ids], dtype=object)
+    per = np.array([s or 1 for s in serving], dtype=np.float64)
+    wanted = wanted[np.searchsorted(recipe_ids, recipe.astype(np.int64))]
+    ratio = np.where(wanted == None, per, wanted).astype(np.float64) / per  # noqa: E711
+    amounts = np.where(quantities == None, 0, quantities).astype(np.float64) * ratio  # noqa: E711
+
+    distinct, unit_index, kinds, factors = table.lookup(units)
+    amounts *= factors
+    keys = np.char.lower(np.char.strip(names.astype(str)))
+    _, name_index = np.unique(keys, return_inverse=True)
+    # one group per name and kind, free form units only add up with themselves
+    unit_key = np.where(kinds == OTHER, OTHER + unit_index, kinds)
+    groups, first, group_index = np.unique(name_index.ravel() * (len(distinct) + OTHER) + unit_key,
+                                           return_index=True, return_inverse=True)
+    group_index = group_index.ravel()
+    totals = np.bincount(group_index, weights=amounts, minlength=len(groups))
+    pairs = np.unique(np.stack([group_index, recipe.astype(np.int64)]), axis=1)
+    recipe_counts = np.bincount(pairs[0], minlength=len(groups))
+
+    items = []
+    for g, row in enumerate(first):
+        quantity, unit = table.display(kinds[row], totals[g], units[row])
+        items.append(ShoppingItem(names[row].strip(), float(quantity), unit, int(recipe_counts[g])))
+    return items
@@ -0,0 +1,70 @@
+import logging
+from datetime import timedelta
+
+from sqlalchemy import text
+
+from .log_writer import BufferedWriter
+
+logger = logging.getLogger(__name__)
+
+# never move last_seen backwards when an older batch lands late
+UPDATE = text("UPDATE users SET last_seen = :last_seen "
+              "WHERE id = :id AND (last_seen IS NULL OR last_seen < :last_seen)")
+
+
+class LastSeenWriter(BufferedWriter):
+    """
+    Coalesces User.last_seen updates so a request never writes the users row.
+
+    A user is queued at most once per COOKZILLA_LAST_SEEN_INTERVAL seconds,
+    judged by the last_seen value loaded with the user, and the queued
+    timestamps are written as one batched UPDATE every
+    COOKZILLA_LAST_SEEN_FLUSH_INTERVAL seconds. A flush interval of 0
+    disables the thread, timestamps then stay queued until flush() is called.
+    """
+
+    def __init__(self, app=None):
+        self._pending = {}
+        super(LastSeenWriter, self).__init__(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['last_seen_writer'] = self
+
+    @property
+    def interval(self):
+        return self.app.config['COOKZILLA_LAST_SEEN_FLUSH_INTERVAL']
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def touch(self, user_id, last_seen, now):
+        """Queue ``now`` for the user unless ``last_seen`` is recent enough."""
+        throttle = timedelta(seconds=self.app.config['COOKZILLA_LAST_SEEN_INTERVAL'])
+        if user_id is None or (last_seen is not None and now - last_seen < throttle):
+            return False
+        with self._lock:
+            self._pending[user_id] = now
+        if self.interval > 0:
+            self._ensure_thread()
+        return True
+
+    def flush(self):
+        """Write every queued timestamp in one transaction, return the row count."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self.app is None:
+            return 0
+        rows = [dict(id=user_id, last_seen=last_seen) for user_id, last_seen in pending.items()]
+        try:
+            from . import db
+            with db.get_engine(self.app).begin() as conn:
+                conn.execute(UPDATE, rows)
+        except Exception:
+            logger.exception('Flushing last_seen of %d users failed', len(rows))
+            with self._lock:
+                for user_id, last_seen in pending.items():
+                    self._pending.setdefault(user_id, last_seen)
+            return 0
+        return len(rows)
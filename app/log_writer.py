@@ -0,0 +1,185 @@
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from blinker import Namespace
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+_signals = Namespace()
+
+#: Sent by the log writer after a successful flush with ``keys``, the
+#: (user_id, op, recipe_id) triples whose counters were incremented.
+log_flushed = _signals.signal('log-flushed')
+
+UPSERT = text("""
+INSERT INTO log_events (user_id, op, recipe_id, ct, logged_at)
+VALUES (:user_id, :op, :recipe_id, :n, :logged_at)
+ON CONFLICT (user_id, op, recipe_id)
+DO UPDATE SET ct = log_events.ct + excluded.ct, logged_at = excluded.logged_at
+""")
+
+UPDATE = text("""
+UPDATE log_events SET ct = ct + :n, logged_at = :logged_at
+WHERE user_id = :user_id AND op = :op AND recipe_id = :recipe_id
+""")
+
+INSERT = text("""
+INSERT INTO log_events (user_id, op, recipe_id, ct, logged_at)
+VALUES (:user_id, :op, :recipe_id, :n, :logged_at)
+""")
+
+# the first releases with INSERT ... ON CONFLICT
+UPSERT_VERSIONS = {'sqlite': (3, 24), 'postgresql': (9, 5)}
+
+
+def supports_upsert(conn):
+    """Whether the database behind ``conn`` understands INSERT ... ON CONFLICT."""
+    version = UPSERT_VERSIONS.get(conn.dialect.name)
+    return version is not None and tuple(conn.dialect.server_version_info or ()) >= version
+
+
+class BufferedWriter(object):
+    """
+    Base for per-worker write buffers drained by a daemon thread every
+    ``interval`` seconds, on wakeup() and once more when the process exits.
+    Subclasses implement flush() and the interval property.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+        if app is not None:
+            self.init_app(app)
+
+    @property
+    def interval(self):
+        raise NotImplementedError
+
+    def flush(self):
+        raise NotImplementedError
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=type(self).__name__)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+class LogWriter(BufferedWriter):
+    """
+    Buffers LogEvent increments per worker and writes them as one set-based
+    upsert, so request handlers never touch the log_events table themselves.
+
+    Pending increments are flushed every COOKZILLA_LOG_FLUSH_INTERVAL seconds
+    by a background thread, as soon as COOKZILLA_LOG_FLUSH_SIZE keys are
+    pending, and once more when the process exits. An interval of 0 disables
+    the thread, increments then stay buffered until flush() is called or
+    COOKZILLA_LOG_FLUSH_SIZE keys pile up, which flushes inline.
+
+    A batch the database rejects as a whole is written again one row at a
+    time, and the rows still refused (a recipe deleted meanwhile) are
+    dropped. A batch that fails for any other reason goes back to the buffer
+    until COOKZILLA_LOG_FLUSH_RETRIES flushes in a row have failed, then it
+    is dropped too, so one outage cannot grow the buffer without bound.
+    """
+
+    def __init__(self, app=None):
+        self._pending = {}
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0
+        super(LogWriter, self).__init__(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['log_writer'] = self
+
+    @property
+    def interval(self):
+        return self.app.config['COOKZILLA_LOG_FLUSH_INTERVAL']
+
+    @property
+    def pending(self):
+        return sum(self._pending.values())
+
+    def record(self, user_id, op, recipe_id, n=1):
+        key = (user_id, op, recipe_id)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + n
+            full = len(self._pending) >= self.app.config['COOKZILLA_LOG_FLUSH_SIZE']
+        if self.interval > 0:
+            self._ensure_thread()
+            if full:
+                self.wakeup()
+        elif full:
+            self.flush()
+
+    def flush(self):
+        """Write every pending increment in one transaction, return the row count."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self.app is None:
+            return 0
+        now = datetime.utcnow()
+        rows = [dict(user_id=u, op=op, recipe_id=r, n=n, logged_at=now)
+                for (u, op, r), n in pending.items()]
+        try:
+            self._write(rows)
+        except IntegrityError:
+            logger.warning('Flushing %d log events failed, writing them one by one', len(rows))
+            rows = [row for row in rows if self._write_one(row)]
+        except Exception:
+            self.failures += 1
+            if self.failures < self.app.config['COOKZILLA_LOG_FLUSH_RETRIES']:
+                logger.exception('Flushing %d log events failed, retrying later', len(rows))
+                with self._lock:
+                    for key, n in pending.items():
+                        self._pending[key] = self._pending.get(key, 0) + n
+            else:
+                logger.exception('Flushing %d log events failed %d times, dropping them',
+                                 len(rows), self.failures)
+                self.dropped += len(rows)
+                self.failures = 0
+            return 0
+        self.failures = 0
+        self.flushes += 1
+        log_flushed.send(self, keys=[(row['user_id'], row['op'], row['recipe_id']) for row in rows])
+        return len(rows)
+
+    def _write(self, rows):
+        from . import db
+        with db.get_engine(self.app).begin() as conn:
+            if supports_upsert(conn):
+                conn.execute(UPSERT, rows)
+            else:
+                for row in rows:
+                    if conn.execute(UPDATE, row).rowcount == 0:
+                        conn.execute(INSERT, row)
+
+    def _write_one(self, row):
+        try:
+            self._write([row])
+            return True
+        except Exception:
+            logger.exception('Dropping log event %r', row)
+            self.dropped += 1
+            return False
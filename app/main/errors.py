@@ -1,5 +1,6 @@
-from flask import render_template, request, jsonify
+from flask import render_template, request, jsonify, make_response
 from . import main
+from ..exceptions import MailQueueFull
 
 
 @main.app_errorhandler(403)
@@ -27,3 +28,16 @@ def internal_server_error(e):
         response.status_code = 500
         return response
     return render_template('500.html'), 500
+
+
+@main.app_errorhandler(MailQueueFull)
+def mail_queue_full(e):
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        response = jsonify({'error': 'service unavailable'})
+    else:
+        response = make_response(render_template(
+            'error_page.html', code=503, name='Service Unavailable',
+            description='Too many emails are waiting to be sent, please try again in a minute.'))
+    response.status_code = 503
+    response.headers['Retry-After'] = '60'
+    return response
@@ -3,7 +3,8 @@ from wtforms import StringField, TextAreaField, BooleanField, SelectField, Submi
 from wtforms import ValidationError
 from wtforms.validators import DataRequired, Length, Email, Regexp, InputRequired
 
-from ..models import Role, User
+from .. import reference_data
+from ..models import User
 
 
 class NameForm(FlaskForm):
@@ -31,7 +32,7 @@ class EditProfileAdminForm(FlaskForm):
 
     def __init__(self, user, *args, **kwargs):
         super(EditProfileAdminForm, self).__init__(*args, **kwargs)
-        self.role.choices = [(role.id, role.name) for role in Role.query.order_by(Role.name).all()]
+        self.role.choices = [(role.id, role.name) for role in reference_data.roles]
         self.user = user
 
     def validate_email(self, field):
@@ -1,24 +1,17 @@
-from flask import render_template, redirect, url_for, abort, flash, request, current_app, make_response
+import hmac
+
+from flask import render_template, redirect, url_for, abort, flash, request, current_app, make_response, jsonify
 from flask_login import login_required, current_user
-from flask_sqlalchemy import get_debug_queries
 from sqlalchemy import func
 
 from . import main
 from .forms import EditProfileForm, EditProfileAdminForm, SearchForm
-from .. import db
-from ..decorators import admin_required, permission_required
-from ..models import Permission, Role, User, Recipe, Tag, Follow, LogEvent
-
-
-@main.after_app_request
-def after_request(response):
-    for query in get_debug_queries():
-        if query.duration >= current_app.config['COOKZILLA_SLOW_DB_QUERY_TIME']:
-            current_app.logger.warning(
-                'Slow query: %s\nParameters: %s\nDuration: %fs\nContext: %s\n'
-                % (query.statement, query.parameters, query.duration,
-                   query.context))
-    return response
+from .. import db, feed_cache, search_index, response_cache, reference_data, mail_dispatcher, \
+    user_cache, metrics, ingredient_index, facets, event_calendar, social_graph
+from ..decorators import admin_required, permission_required, read_write
+from ..models import Permission, Role, User, Recipe, Tag, Follow, LogEvent, Group
+from ..pagination import paginate
+from ..response_cache import recipe_list_validator
 
 
 @main.route('/shutdown')
@@ -32,30 +25,25 @@ def server_shutdown():
     return 'Shutting down...'
 
 
+def _index_validator():
+    return recipe_list_validator(Recipe.query, current_app.config['COOKZILLA_POSTS_PER_PAGE'])
+
+
 @main.route('/', methods=['GET', 'POST'])
+@response_cache.cached('index', _index_validator)
 def index():
     page = request.args.get('page', 1, type=int)
     show_followed = False
     if current_user.is_authenticated:
         show_followed = bool(request.cookies.get('show_followed', ''))
     if show_followed:
-        query1 = current_user.query_logs
-        query2 = current_user.followed_recipes
-        if query1:
-            query = query1.union(query2)
-            query = query.group_by(Recipe).add_columns(func.sum(LogEvent.ct).label("ct"))
-            query = query.order_by(LogEvent.ct.desc()).order_by(Recipe.timestamp.desc())
-        else:
-            query = query2
-        query = query.with_entities(Recipe)
+        pagination = feed_cache.paginate(current_user.id, page,
+                                         current_app.config['COOKZILLA_POSTS_PER_PAGE'])
     else:
-        query = Recipe.query.order_by(Recipe.timestamp.desc())
-
-    pagination = query.paginate(
-        page, per_page=current_app.config['COOKZILLA_POSTS_PER_PAGE'],
-        error_out=False)
+        pagination = paginate(Recipe.query, Recipe.timestamp, Recipe.id,
+                              current_app.config['COOKZILLA_POSTS_PER_PAGE'], total='cached')
     recipes = pagination.items
-    tags = Tag.query.all()
+    tags = reference_data.tags
     form = SearchForm()
     if form.validate_on_submit():
         return redirect(url_for('main.search_results', query=form.search.data))
@@ -63,13 +51,23 @@ def index():
                            show_followed=show_followed, pagination=pagination, tags=tags)
 
 
+def _user_validator(username):
+    row = db.session.query(User.last_seen, User.follower_count, User.followed_count, User.recipe_count,
+                           User.review_count, User.group_count,
+                           db.session.query(func.max(Recipe.timestamp))
+                           .filter(Recipe.author_id == User.id).as_scalar()) \
+        .filter(User.username == username).first()
+    if row is None:
+        return None
+    return row[-1], tuple(row[:-1])
+
+
 @main.route('/user/<username>')
+@response_cache.cached('user', _user_validator, key='username')
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
-    page = request.args.get('page', 1, type=int)
-    pagination = user.recipes.order_by(Recipe.timestamp.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_POSTS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(user.recipes, Recipe.timestamp, Recipe.id,
+                          current_app.config['COOKZILLA_POSTS_PER_PAGE'], total=user.recipe_count)
     recipes = pagination.items
 
     follows = user.followers.filter(Follow.follower_id != user.id).order_by(Follow.timestamp.desc()).limit(
@@ -82,6 +80,8 @@ def user(username):
     followeds = [{'user': item.followed, 'timestamp': item.timestamp}
                  for item in follows]
 
+    if current_user.is_authenticated:
+        current_user.preload_relations(users=[user])
     return render_template('users/user.html', user=user, recipes=recipes,
                            followers=followers, followeds=followeds,
                            pagination=pagination)
@@ -128,6 +128,7 @@ def edit_profile_admin(id):
 
 
 @main.route('/follow/<username>')
+@read_write
 @login_required
 @permission_required(Permission.FOLLOW)
 def follow(username):
@@ -144,6 +145,7 @@ def follow(username):
 
 
 @main.route('/unfollow/<username>')
+@read_write
 @login_required
 @permission_required(Permission.FOLLOW)
 def unfollow(username):
@@ -159,16 +161,37 @@ def unfollow(username):
     return redirect(url_for('.user', username=username))
 
 
+@main.route('/suggestions')
+@login_required
+def suggestions():
+    limit = current_app.config['COOKZILLA_SUGGESTIONS']
+    people = social_graph.suggest_people(current_user.id, limit)
+    groups = social_graph.suggest_groups(current_user.id, limit)
+    users = dict((u.id, u) for u in User.query.filter(User.id.in_([i for i, _ in people]))) if people else {}
+    found = dict((g.id, g) for g in Group.query.filter(Group.id.in_([i for i, _ in groups]))) if groups else {}
+    # rows deleted since the graph was loaded drop out
+    people = [(users[i], count) for i, count in people if i in users]
+    groups = [(found[i], count) for i, count in groups if i in found]
+    mutual = len(social_graph.mutual(current_user.id))
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        return jsonify({'people': [{'id': u.id, 'username': u.username, 'followed_by': count}
+                                   for u, count in people],
+                        'groups': [{'id': g.id, 'title': g.title, 'members_followed': count}
+                                   for g, count in groups],
+                        'mutual': mutual})
+    current_user.preload_relations(users=[u for u, _ in people])
+    return render_template('users/suggestions.html', people=people, groups=groups, mutual=mutual)
+
+
 @main.route('/followers/<username>')
 def followers(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    page = request.args.get('page', 1, type=int)
-    pagination = user.followers.filter(Follow.follower_id != user.id).order_by(Follow.timestamp.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'],
-        error_out=False)
+    # the counter includes the user's own follow
+    pagination = paginate(user.followers.filter(Follow.follower_id != user.id), Follow.timestamp, Follow.follower_id,
+                          current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'], total=max(user.follower_count - 1, 0))
     follows = [{'user': item.follower, 'timestamp': item.timestamp}
                for item in pagination.items]
     return render_template('users/followers.html', user=user, title="Followers of",
@@ -182,10 +205,8 @@ def followed_by(username):
     if user is None:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    page = request.args.get('page', 1, type=int)
-    pagination = user.followed.filter(Follow.followed_id != user.id).order_by(Follow.timestamp.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(user.followed.filter(Follow.followed_id != user.id), Follow.timestamp, Follow.followed_id,
+                          current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'], total=max(user.followed_count - 1, 0))
     follows = [{'user': item.followed, 'timestamp': item.timestamp}
                for item in pagination.items]
     return render_template('users/followers.html', user=user, title="Followed by",
@@ -212,11 +233,15 @@ def show_followed():
 @main.route('/search_results/<query>')
 def search_results(query):
     import time
-    from sqlalchemy import or_
     start = time.time()
-    recipes = Recipe.query.order_by(Recipe.timestamp.desc()) \
-        .filter(or_(Recipe.title.contains(query), Recipe.body.contains(query))) \
-        .limit(current_app.config["SEARCH_RESULTS"]).all()
+    page = request.args.get('page', 1, type=int)
+    # narrowed down by ingredients with ?with=garlic,basil&without=pork
+    with_all = [name for name in request.args.get('with', '').split(',') if name.strip()]
+    without = [name for name in request.args.get('without', '').split(',') if name.strip()]
+    pagination = search_index.search(query, page, current_app.config["SEARCH_RESULTS"],
+                                     within=ingredient_index.find(with_all)[0] if with_all else None,
+                                     excluding=ingredient_index.recipes_with_any(without) if without else None)
+    recipes = pagination.items
     end = time.time()
     time = "{:.8f} seconds".format(end - start)
     # log
@@ -225,19 +250,48 @@ def search_results(query):
     return render_template('utils/search_results.html',
                            query=query,
                            recipes=recipes,
+                           pagination=pagination,
                            time=time)
 
 
 @main.route('/logs')
 @admin_required
 def log():
-    page = request.args.get('page', 1, type=int)
-    pagination = LogEvent.query.order_by(LogEvent.logged_at.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(LogEvent.query, LogEvent.logged_at, LogEvent.id,
+                          current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'], total='cached')
     logs = [{'user': item.user, "op": item.op, 'recipe': item.recipe, "ct": item.ct, 'logged_at': item.logged_at}
             for item in pagination.items]
     return render_template('logs/logs.html', endpoint='main.log', pagination=pagination,
                            logs=logs)
 
 
+@main.route('/caches')
+@admin_required
+def caches():
+    return render_template('utils/caches.html', response_cache=response_cache, feed_cache=feed_cache,
+                           mail_dispatcher=mail_dispatcher, user_cache=user_cache,
+                           ingredient_index=ingredient_index, facets=facets, event_calendar=event_calendar,
+                           social_graph=social_graph)
+
+
+@main.route('/performance')
+@admin_required
+def performance():
+    return render_template('utils/performance.html', metrics=metrics)
+
+
+def _metrics_token_valid():
+    token = current_app.config['COOKZILLA_METRICS_TOKEN']
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                                               ('Bearer ' + token).encode('utf-8'))
+
+
+@main.route('/metrics')
+def metrics_exposition():
+    if not _metrics_token_valid() \
+            and request.remote_addr not in current_app.config['COOKZILLA_METRICS_ALLOWED_IPS'] \
+            and not current_user.is_administrator():
+        abort(403)
+    return metrics.exposition(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
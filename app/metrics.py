@@ -0,0 +1,215 @@
+import heapq
+import random
+import threading
+import time
+from bisect import bisect_left
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request, before_render_template, \
+    template_rendered
+
+
+class EndpointStats(object):
+    """Counters of one endpoint; latencies go into ``buckets`` (upper bounds, seconds)."""
+
+    def __init__(self, endpoint, buckets):
+        self.endpoint = endpoint
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.requests = 0
+        self.errors = 0
+        self.latency = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.response_bytes = 0
+        self.sampled = 0
+        # (duration, statement, parameters) of the slowest sampled queries
+        self.slow_queries = []
+
+    def add(self, metrics, latency, status, size, keep):
+        self.counts[bisect_left(self.bounds, latency)] += 1
+        self.requests += 1
+        self.errors += status >= 500
+        self.latency += latency
+        self.queries += metrics.queries
+        self.db_time += metrics.db_time
+        self.render_time += metrics.render_time
+        self.response_bytes += size
+        if metrics.statements is not None:
+            self.sampled += 1
+            for query in metrics.statements:
+                if len(self.slow_queries) < keep:
+                    heapq.heappush(self.slow_queries, query)
+                elif query[0] > self.slow_queries[0][0]:
+                    heapq.heapreplace(self.slow_queries, query)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile of the latencies."""
+        if not self.requests:
+            return 0.0
+        rank, seen = q * self.requests, 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def mean(self, total):
+        return total / self.requests if self.requests else 0.0
+
+
+class RequestMetrics(object):
+    """What one request spent so far, kept in ``g``."""
+
+    def __init__(self, sampled):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_start = []
+        # full statements are only kept for sampled requests
+        self.statements = [] if sampled else None
+
+
+class Metrics(object):
+    """
+    Per-worker request metrics, by endpoint: a latency histogram over
+    COOKZILLA_METRICS_BUCKETS, query count, time spent in the database and
+    in templates, and response bytes.
+
+    Queries are timed with cursor events and only counted; the statements
+    are kept for a COOKZILLA_METRICS_SAMPLE_RATE fraction of the requests,
+    and the COOKZILLA_METRICS_SLOW_QUERIES slowest of those are listed per
+    endpoint. Any query over COOKZILLA_SLOW_DB_QUERY_TIME is logged.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['metrics'] = self
+        self.reset()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, sender=app)
+        template_rendered.connect(self._rendered, sender=app)
+        for event, listener in (('before_cursor_execute', _before_cursor_execute),
+                                ('after_cursor_execute', _after_cursor_execute)):
+            if not sa.event.contains(sa.engine.Engine, event, listener):
+                sa.event.listen(sa.engine.Engine, event, listener)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self.started = time.time()
+
+    @property
+    def uptime(self):
+        """Seconds the metrics have been collected for."""
+        return time.time() - self.started
+
+    @property
+    def endpoints(self):
+        """The stats of every endpoint seen, slowest on average first."""
+        with self._lock:
+            endpoints = list(self._endpoints.values())
+        return sorted(endpoints, key=lambda e: e.mean(e.latency), reverse=True)
+
+    def _before_request(self):
+        g._metrics = RequestMetrics(random.random() < self.app.config['COOKZILLA_METRICS_SAMPLE_RATE'])
+
+    def _after_request(self, response):
+        metrics = g.pop('_metrics', None)
+        if metrics is not None:
+            self._record(metrics, response.status_code, response.content_length or 0)
+        return response
+
+    def _teardown_request(self, exc):
+        # an unhandled exception skips after_request, the request crashed
+        metrics = g.pop('_metrics', None)
+        if metrics is not None:
+            self._record(metrics, 500, 0)
+
+    def _record(self, metrics, status_code, response_bytes):
+        latency = time.perf_counter() - metrics.start
+        endpoint = request.endpoint or '<unmatched>'
+        config = self.app.config
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats(endpoint, config['COOKZILLA_METRICS_BUCKETS'])
+            stats.add(metrics, latency, status_code, response_bytes, config['COOKZILLA_METRICS_SLOW_QUERIES'])
+
+    @staticmethod
+    def _before_render(app, template, context):
+        metrics = g.get('_metrics')
+        if metrics is not None:
+            metrics.render_start.append(time.perf_counter())
+
+    @staticmethod
+    def _rendered(app, template, context):
+        metrics = g.get('_metrics')
+        if metrics is not None and metrics.render_start:
+            metrics.render_time += time.perf_counter() - metrics.render_start.pop()
+
+    def exposition(self):
+        """The metrics in the Prometheus text format."""
+        families = (
+            ('requests_total', 'counter', 'Requests answered.', lambda e: e.requests),
+            ('request_errors_total', 'counter', 'Requests answered with a 5xx status.', lambda e: e.errors),
+            ('db_queries_total', 'counter', 'Database queries run.', lambda e: e.queries),
+            ('db_seconds_total', 'counter', 'Seconds spent in database queries.', lambda e: e.db_time),
+            ('template_seconds_total', 'counter', 'Seconds spent rendering templates.',
+             lambda e: e.render_time),
+            ('response_bytes_total', 'counter', 'Response body bytes sent.', lambda e: e.response_bytes),
+        )
+        endpoints = sorted(self.endpoints, key=lambda e: e.endpoint)
+        lines = ['# HELP cookzilla_request_duration_seconds Request latency.',
+                 '# TYPE cookzilla_request_duration_seconds histogram']
+        for e in endpoints:
+            label = 'endpoint="{}"'.format(_escape(e.endpoint))
+            seen = 0
+            for bound, count in zip(list(e.bounds) + ['+Inf'], e.counts):
+                seen += count
+                lines.append('cookzilla_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(
+                    label, bound, seen))
+            lines.append('cookzilla_request_duration_seconds_sum{{{}}} {!r}'.format(label, e.latency))
+            lines.append('cookzilla_request_duration_seconds_count{{{}}} {}'.format(label, e.requests))
+        for name, kind, help, value in families:
+            lines.append('# HELP cookzilla_{} {}'.format(name, help))
+            lines.append('# TYPE cookzilla_{} {}'.format(name, kind))
+            for e in endpoints:
+                lines.append('cookzilla_{}{{endpoint="{}"}} {!r}'.format(name, _escape(e.endpoint), value(e)))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('cookzilla_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['cookzilla_query_start'].pop()
+    if not has_request_context():
+        return
+    metrics = g.get('_metrics')
+    if metrics is None:
+        return
+    metrics.queries += 1
+    metrics.db_time += duration
+    if metrics.statements is not None:
+        metrics.statements.append((duration, statement, repr(parameters)[:200]))
+    if duration >= current_app.config['COOKZILLA_SLOW_DB_QUERY_TIME']:
+        current_app.logger.warning('Slow query: %s\nParameters: %s\nDuration: %fs\nEndpoint: %s\n'
+                                   % (statement, parameters, duration, request.endpoint))
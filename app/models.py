@@ -6,9 +6,12 @@ from sqlalchemy import func
 from flask import current_app, request
 from flask_login import UserMixin, AnonymousUserMixin
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from werkzeug.security import generate_password_hash, check_password_hash
 
-from . import db, login_manager
+from . import db, login_manager, log_writer, last_seen_writer, reference_data, password_hasher, \
+    user_cache, event_calendar
+from .counters import counter_cache
+from .relations import relations
+from .rsvps import set_rsvp
 
 # 128 is for avatar
 LENGTH = 64
@@ -63,11 +66,14 @@ class LogEvent(db.Model):
     op = db.Column(db.String(64))
     recipe_id = db.Column(db.INTEGER, db.ForeignKey("recipes.id"))
     ct = db.Column(db.INTEGER)
-    logged_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    logged_at = db.Column(db.DateTime(), index=True, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_log_events_user_op_recipe', 'user_id', 'op', 'recipe_id', unique=True),)
 
     @staticmethod
     def log(user, op, recipe):
         """
+        Count one (user, op, recipe) hit. The increment is buffered by the
+        log writer and upserted later, nothing is written on the request.
 
         :param user:
         :param recipe:
@@ -76,24 +82,33 @@ class LogEvent(db.Model):
         """
         if not user.can(Permission.WRITE_ARTICLES):
             return
-        log = LogEvent.query.filter_by(user=user, op=op, recipe=recipe).first()
-        if log:
-            log.ct += 1
-            log.logged_at = datetime.utcnow()
-        else:
-            log = LogEvent(user=user, op=op, recipe=recipe, ct=1)
-
-        db.session.add(log)
-        db.session.commit()
+        log_writer.record(user.id, op, recipe.id)
 
     def __repr__(self):
         return '<LogEvent {}, {}, {}>'.format(self.user.username, self.op, self.recipe.title)
 
 
+class Feed(db.Model):
+    """Stored ranked recipe ids of a user's followed feed, see app.feed."""
+    __tablename__ = 'feeds'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    recipe_ids = db.Column(db.Text)
+    computed_at = db.Column(db.DateTime(), default=datetime.utcnow)
+
+
+class RelatedRecipe(db.Model):
+    """Precomputed "you might also like" recipes of a recipe, see app.recommendations."""
+    __tablename__ = 'related_recipes'
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    related_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=False)
+    score = db.Column(db.Float)
+
+
 class Follow(db.Model):
     __tablename__ = 'follows'
     follower_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
-    followed_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    followed_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, index=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
 
@@ -106,16 +121,24 @@ class Follow(db.Model):
 class GroupMember(db.Model):
     __tablename__ = 'group_members'
     member_id = db.Column(db.INTEGER, db.ForeignKey('users.id'), primary_key=True)
-    group_id = db.Column(db.INTEGER, db.ForeignKey('groups.id'), primary_key=True)
+    group_id = db.Column(db.INTEGER, db.ForeignKey('groups.id'), primary_key=True, index=True)
     member_since = db.Column(db.DATETIME, default=datetime.utcnow)
 
 
+class RSVPStatus:
+    NOT_GOING = 0
+    GOING = 1
+    MAYBE = 2
+
+
 class RSVP(db.Model):
     __tablename__ = 'rsvps'
+    # an event's attendees by status, and the tallies' reconcile
+    __table_args__ = (db.Index('ix_rsvps_event_id_status', 'event_id', 'status'),)
     member_id = db.Column(db.INTEGER, db.ForeignKey('users.id'), primary_key=True)
     event_id = db.Column(db.INTEGER, db.ForeignKey('events.id'), primary_key=True)
     timestamp = db.Column(db.DATETIME, default=datetime.utcnow)
-    status = db.Column(db.INTEGER, default=0)  # 0 not go, 1: go, others: not sure
+    status = db.Column(db.INTEGER, default=RSVPStatus.NOT_GOING)  # an RSVPStatus
 
 
 class User(UserMixin, db.Model):
@@ -131,6 +154,12 @@ class User(UserMixin, db.Model):
     joined_since = db.Column(db.DateTime(), default=datetime.utcnow)
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     avatar_hash = db.Column(db.String(32))  # https://en.gravatar.com/
+    # counter caches, see the counter_cache declarations at the bottom
+    follower_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    followed_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    recipe_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    review_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    group_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     recipes = db.relationship('Recipe', backref='author', lazy='dynamic')
     followed = db.relationship('Follow',
                                foreign_keys=[Follow.follower_id],
@@ -161,13 +190,6 @@ class User(UserMixin, db.Model):
     #                          secondary='group_member',  # association table
     #                          backref=db.backref('members', lazy='dynamic'),  # User.groups and Group.members
     #                          lazy='dynamic')
-    @property
-    def query_logs(self):
-        return self.logs.group_by(LogEvent.recipe_id).add_columns(func.count(LogEvent.ct)).with_entities(
-            LogEvent.recipe_id, sa.func.count(LogEvent.ct).label('ct')).join(Recipe,
-                                                                             LogEvent.recipe_id == Recipe.id).with_entities(
-            Recipe, LogEvent.ct, Recipe.timestamp)
-
     @staticmethod
     def generate_fake(count=100):
         from sqlalchemy.exc import IntegrityError
@@ -214,10 +236,15 @@ class User(UserMixin, db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        valid, new_hash = password_hasher.verify_and_update(self.password_hash, password)
+        if new_hash is not None:
+            # the hashing policy changed since this hash was made
+            self.password_hash = new_hash
+            db.session.add(self)
+        return valid
 
     def generate_confirmation_token(self, expiration=3600):
         s = Serializer(current_app.config['SECRET_KEY'], expiration)
@@ -275,14 +302,20 @@ class User(UserMixin, db.Model):
         return True
 
     def can(self, permissions):
-        return self.role is not None and (self.role.permissions & permissions) == permissions
+        # the cached role, a new user's role is only known through the relationship
+        role = reference_data.role(self.role_id) if self.role_id is not None else self.role
+        return role is not None and (role.permissions & permissions) == permissions
 
     def is_administrator(self):
         return self.can(Permission.ADMINISTER)
 
     def ping(self):
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
+        # the row is written later in a batch, keep this instance clean
+        now = datetime.utcnow()
+        if last_seen_writer.touch(self.id, self.last_seen, now):
+            # the cached snapshot throttles the next touch from this write
+            user_cache.seen(self.id, now)
+        sa.orm.attributes.set_committed_value(self, 'last_seen', now)
 
     def gravatar(self, size=100, default='identicon', rating='g'):
         if request.is_secure:
@@ -298,19 +331,28 @@ class User(UserMixin, db.Model):
         if not self.is_following(user):
             f = Follow(follower=self, followed=user)
             db.session.add(f)
+            self._set_following(user, True)
 
     def unfollow(self, user):
         f = self.followed.filter_by(followed_id=user.id).first()
         if f:
             db.session.delete(f)
+            self._set_following(user, False)
+
+    def _set_following(self, user, following):
+        if self.id is not None and user.id is not None:
+            relations(self).following[user.id] = following
+            relations(user).followed_by[self.id] = following
 
     def is_following(self, user):
-        return self.followed.filter_by(
-            followed_id=user.id).first() is not None
+        return relations(self).is_following(user)
 
     def is_followed_by(self, user):
-        return self.followers.filter_by(
-            follower_id=user.id).first() is not None
+        return relations(self).is_followed_by(user)
+
+    def preload_relations(self, users=(), groups=(), events=()):
+        """Load follow, membership and RSVP state for a page of rows at once."""
+        relations(self).load(users=users, groups=groups, events=events)
 
     @property
     def followed_recipes(self):
@@ -325,46 +367,51 @@ class User(UserMixin, db.Model):
         if not self.is_member(group):
             gm = GroupMember(member=self, group=group)
             db.session.add(gm)
+            if group.id is not None:
+                relations(self).member_of[group.id] = True
 
     def unmember(self, group):
         gm = self.groups.filter_by(group_id=group.id).first()
         if gm:
             db.session.delete(gm)
+            relations(self).member_of[group.id] = False
 
     def is_member(self, group):
-        return self.groups.filter_by(group_id=group.id).first() is not None
+        return relations(self).is_member(group)
 
     # event part
     def get_all_events(self):
-        return [e for g in self.groups.all() for e in g.group.events.all()]
+        return [event for event, status in event_calendar.query(self.id)]
 
     def get_all_available_events(self):
-        return [e for g in self.groups.all() for e in g.group.events.all() if e.timestamp > datetime.utcnow()]
+        return [entry.event for entry in event_calendar.upcoming(self.id).entries]
 
     # rsvp part
     def go(self, event):
-        if self.is_go(event) or self.is_not_go(event):
-            r = RSVP.query.filter_by(member=self, event=event).first()
-        else:
-            r = RSVP(member=self, event=event)
-        r.status = 1
-        db.session.add(r)
+        self._rsvp(event, RSVPStatus.GOING)
 
     def ungo(self, event):
-        if self.is_go(event) or self.is_not_go(event):
-            r = RSVP.query.filter_by(member=self, event=event).first()
-        else:
-            r = RSVP(member=self, event=event)
-        r.status = 0
-        db.session.add(r)
+        self._rsvp(event, RSVPStatus.NOT_GOING)
+
+    def maybe(self, event):
+        self._rsvp(event, RSVPStatus.MAYBE)
+
+    def _rsvp(self, event, status):
+        if event.id is None or self.id is None:
+            # nothing to upsert against yet, the RSVP is inserted with the event
+            db.session.add(RSVP(member=self, event=event, status=status))
+            return
+        set_rsvp(db.session, self.id, event.id, status)
+        relations(self).rsvps[event.id] = status
 
     def is_go(self, event):
-        e = self.events.filter_by(event_id=event.id).first()
-        return e is not None and e.status == 1
+        return relations(self).rsvp(event) == RSVPStatus.GOING
 
     def is_not_go(self, event):
-        e = self.events.filter_by(event_id=event.id).first()
-        return e is not None and e.status == 0
+        return relations(self).rsvp(event) == RSVPStatus.NOT_GOING
+
+    def is_maybe(self, event):
+        return relations(self).rsvp(event) == RSVPStatus.MAYBE
 
     @staticmethod
     def is_available(event):
@@ -404,7 +451,7 @@ login_manager.anonymous_user = AnonymousUser
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 
 # recipe part
@@ -415,19 +462,20 @@ relates = db.Table('relates',
                    db.Column('linked_id', db.INTEGER, db.ForeignKey('recipes.id')))
 
 recipe_tags = db.Table('recipe_tags',
-                       db.Column('recipe_id', db.INTEGER, db.ForeignKey('recipes.id')),
-                       db.Column('tag_id', db.INTEGER, db.ForeignKey('tags.id')))
+                       db.Column('recipe_id', db.INTEGER, db.ForeignKey('recipes.id'), index=True),
+                       db.Column('tag_id', db.INTEGER, db.ForeignKey('tags.id'), index=True))
 
 
 class Recipe(db.Model):
     __tablename__ = 'recipes'
     id = db.Column(db.Integer, primary_key=True)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     photos = db.Column(db.String(LENGTH * 2), default="")
     title = db.Column(db.String(LENGTH))
     serving = db.Column(db.INTEGER, default=1)  # less than 10
     body = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    review_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     ingredients = db.relationship('Ingredient', backref='recipe', lazy='dynamic')  # Ingredient.recipe
     reviews = db.relationship('Review', backref='recipe', lazy='dynamic')
     links = db.relationship('Recipe',  # table name
@@ -493,7 +541,7 @@ class Recipe(db.Model):
 class Ingredient(db.Model):
     __tablename__ = 'ingredients'
     name = db.Column(db.String(LENGTH), primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), primary_key=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), primary_key=True, index=True)
     unit = db.Column(db.String(LENGTH))
     quantity = db.Column(db.FLOAT)
 
@@ -562,8 +610,8 @@ class Review(db.Model):
     suggestion = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     disabled = db.Column(db.Boolean)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'))
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), index=True)
 
     @staticmethod
     def generate_fake(count=1000):
@@ -599,6 +647,8 @@ class Group(db.Model):
     title = db.Column(db.String(LENGTH))
     about_group = db.Column(db.Text)
     grouped_since = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    member_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    event_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     members = db.relationship('GroupMember',
                               backref=db.backref('group', lazy='joined'),
                               lazy='dynamic',
@@ -610,10 +660,10 @@ class Group(db.Model):
 
     # membership part
     def is_member(self, user):
-        return self.members.filter_by(member_id=user.id).first() is not None
+        return relations(user).is_member(self)
 
     def get_available_events(self):
-        return [e for e in self.events.all() if e.timestamp > datetime.utcnow()]
+        return self.events.filter(Event.timestamp > datetime.utcnow()).order_by(Event.timestamp, Event.id).all()
 
     @staticmethod
     def generate_fake(count=10):
@@ -653,6 +703,8 @@ class Group(db.Model):
 
 class Event(db.Model):
     __tablename__ = 'events'
+    # a group's events by date, also serves lookups by group_id alone
+    __table_args__ = (db.Index('ix_events_group_id_timestamp', 'group_id', 'timestamp'),)
     id = db.Column(db.INTEGER, index=True, primary_key=True)
     group_id = db.Column(db.Integer, db.ForeignKey('groups.id'))
     creator_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # should be a member
@@ -660,6 +712,11 @@ class Event(db.Model):
     timestamp = db.Column(db.DATETIME, default=datetime.utcnow)
     location = db.Column(db.String(LENGTH))
     about_event = db.Column(db.TEXT)
+    report_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # RSVP tallies by status
+    going_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    not_going_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    maybe_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     reports = db.relationship('Report', backref='event', lazy='dynamic')
     rsvps = db.relationship('RSVP',
                             backref=db.backref('event', lazy='joined'),
@@ -667,7 +724,7 @@ class Event(db.Model):
                             cascade='all, delete-orphan')
 
     def is_rsvp(self, user):
-        return self.rsvps.filter_by(member_id=user.id).first() is not None
+        return relations(user).rsvp(self) is not None
 
     def is_event_of_group(self, group):
         return self in group.events
@@ -709,7 +766,7 @@ class Event(db.Model):
 class Report(db.Model):
     __tablename__ = "reports"
     id = db.Column(db.INTEGER, index=True, primary_key=True)
-    event_id = db.Column(db.Integer, db.ForeignKey('events.id'))
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), index=True)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # should be a member
     title = db.Column(db.String(LENGTH))
     timestamp = db.Column(db.DATETIME, default=datetime.utcnow)
@@ -738,3 +795,20 @@ class Report(db.Model):
                 db.session.commit()
             except IntegrityError:
                 db.session.rollback()
+
+
+# counter caches, kept in step by the flush that writes the child rows;
+# `python manage.py reconcile_counters` repairs drift from bulk writes
+counter_cache(User.follower_count, Follow.followed_id)
+counter_cache(User.followed_count, Follow.follower_id)
+counter_cache(User.recipe_count, Recipe.author_id)
+counter_cache(User.review_count, Review.author_id)
+counter_cache(User.group_count, GroupMember.member_id)
+counter_cache(Recipe.review_count, Review.recipe_id)
+counter_cache(Group.member_count, GroupMember.group_id)
+counter_cache(Group.event_count, Event.group_id)
+counter_cache(Event.report_count, Report.event_id)
+# set_rsvp() upserts past the flush and adjusts these itself
+RSVP_TALLIES = [counter_cache(Event.going_count, RSVP.event_id, match=(RSVP.status, RSVPStatus.GOING)),
+                counter_cache(Event.not_going_count, RSVP.event_id, match=(RSVP.status, RSVPStatus.NOT_GOING)),
+                counter_cache(Event.maybe_count, RSVP.event_id, match=(RSVP.status, RSVPStatus.MAYBE))]
@@ -0,0 +1,143 @@
+import math
+import threading
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+from flask import abort, current_app, request, url_for
+
+CURSOR_TIME_FORMAT = '%Y%m%d%H%M%S%f'
+
+_counts_lock = threading.Lock()
+
+
+def encode_cursor(timestamp, ident):
+    return '{}.{}'.format(timestamp.strftime(CURSOR_TIME_FORMAT), ident)
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, ident = cursor.split('.')
+        return datetime.strptime(timestamp, CURSOR_TIME_FORMAT), int(ident)
+    except ValueError:
+        abort(400)
+
+
+def page_query(query, order_column, id_column, per_page):
+    """
+    Restrict ``query`` to the page the request asks for, newest first.
+
+    The page is picked by ``after`` or ``before`` cursors, (timestamp, id)
+    of the last or first row of the page the link came from, so no rows
+    are skipped with OFFSET; the redundant bound on the timestamp alone lets
+    the database range-scan its index. Plain ``page`` numbers without a cursor are
+    still honoured with OFFSET for old links. Returns the query, limited to
+    one row more than ``per_page`` so the caller knows whether the scan
+    goes on, and whether it runs backwards (towards newer rows).
+    """
+    after, before = request.args.get('after'), request.args.get('before')
+    if before:
+        timestamp, ident = decode_cursor(before)
+        query = query.filter(order_column >= timestamp,
+                             sa.or_(order_column > timestamp, id_column > ident)) \
+            .order_by(order_column.asc(), id_column.asc())
+        return query.limit(per_page + 1), True
+    query = query.order_by(order_column.desc(), id_column.desc())
+    if after:
+        timestamp, ident = decode_cursor(after)
+        query = query.filter(order_column <= timestamp,
+                             sa.or_(order_column < timestamp, id_column < ident))
+    else:
+        page = max(request.args.get('page', 1, type=int), 1)
+        query = query.offset((page - 1) * per_page)
+    return query.limit(per_page + 1), False
+
+
+def cached_count(query):
+    """
+    COUNT(*) of ``query``, remembered per worker for COOKZILLA_COUNT_TTL
+    seconds and shared by every request running the same statement.
+    """
+    statement = query.order_by(None).statement.compile()
+    key = (str(statement), tuple(sorted((k, repr(v)) for k, v in statement.params.items())))
+    counts = current_app.extensions.setdefault('cookzilla_counts', {})
+    now = time.time()
+    with _counts_lock:
+        entry = counts.get(key)
+    if entry is not None and now - entry[1] < current_app.config['COOKZILLA_COUNT_TTL']:
+        return entry[0]
+    total = query.order_by(None).count()
+    with _counts_lock:
+        if len(counts) >= current_app.config['COOKZILLA_COUNT_CACHE_SIZE']:
+            counts.clear()
+        counts[key] = (total, now)
+    return total
+
+
+def paginate(query, order_column, id_column, per_page, total=None):
+    """
+    Keyset-paginate ``query`` on (order_column, id_column), newest first.
+
+    ``total`` is opt-in: an int (e.g. a counter cache column), 'cached' for
+    cached_count(), or None to skip counting altogether.
+    """
+    if total == 'cached':
+        total = cached_count(query)
+    page_query_, backwards = page_query(query, order_column, id_column, per_page)
+    rows = page_query_.all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    return KeysetPagination(rows, order_column, id_column, per_page, total, more, backwards)
+
+
+class KeysetPagination(object):
+    """
+    A page of a keyset pagination, rendered by utils/_pagination.html as
+    previous/next links. ``page`` is only carried along in the links for
+    display, the rows are found with the cursors.
+    """
+
+    def __init__(self, items, order_column, id_column, per_page, total, more, backwards):
+        self.items = items
+        self.per_page = per_page
+        self.total = total
+        self.page = max(request.args.get('page', 1, type=int), 1)
+        self._order_key = order_column.key
+        self._id_key = id_column.key
+        cursor = request.args.get('after') or request.args.get('before')
+        if backwards:
+            self.has_prev, self.has_next = more, True
+        else:
+            self.has_prev = cursor is not None or self.page > 1
+            self.has_next = more
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        return max(int(math.ceil(self.total / float(self.per_page))), 1)
+
+    def _cursor(self, item):
+        return encode_cursor(getattr(item, self._order_key), getattr(item, self._id_key))
+
+    def _url(self, **args):
+        params = dict(request.view_args)
+        params.update((k, v) for k, v in request.args.items() if k not in ('after', 'before', 'page'))
+        params.update(args)
+        return url_for(request.endpoint, **params)
+
+    @property
+    def next_url(self):
+        if not self.has_next or not self.items:
+            return None
+        return self._url(after=self._cursor(self.items[-1]), page=self.page + 1)
+
+    @property
+    def prev_url(self):
+        if not self.has_prev:
+            return None
+        if self.page <= 2 or not self.items:
+            return self._url()
+        return self._url(before=self._cursor(self.items[0]), page=self.page - 1)
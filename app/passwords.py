@@ -0,0 +1,83 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+def verify_and_update(pwhash, password, method):
+    """
+    Check ``password`` against ``pwhash`` and, when it matches but was made
+    with another method or cost than ``method``, hash it again. Returns
+    (valid, new hash or None). Runs in the worker processes.
+    """
+    if not pwhash or not check_password_hash(pwhash, password):
+        return False, None
+    if pwhash.split('$', 1)[0] != method_of(method):
+        return True, generate_password_hash(password, method)
+    return True, None
+
+
+@lru_cache(32)
+def method_of(method):
+    """The method prefix hashes made with ``method`` carry, e.g. pbkdf2:sha256:50000."""
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2' and len(parts) == 2:
+        return generate_password_hash('', method).split('$', 1)[0]
+    return method
+
+
+class PasswordHasher(object):
+    """
+    Hashes and checks passwords with COOKZILLA_PASSWORD_METHOD (a werkzeug
+    method such as pbkdf2:sha256:50000, i.e. algorithm and cost) in a pool
+    of COOKZILLA_PASSWORD_WORKERS processes, one per core by default, so a
+    burst of logins queues for the pool instead of holding up the request
+    threads of the worker. 0 workers hashes inline.
+
+    Hashes made with another method or cost are replaced the next time
+    their password is verified.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['password_hasher'] = self
+
+    @property
+    def method(self):
+        return self.app.config['COOKZILLA_PASSWORD_METHOD']
+
+    def hash(self, password):
+        return self._call(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self.verify_and_update(pwhash, password)[0]
+
+    def verify_and_update(self, pwhash, password):
+        """(valid, new hash or None); the new hash is set when the policy changed."""
+        return self._call(verify_and_update, pwhash, password, self.method)
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != method_of(self.method)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _call(self, f, *args):
+        workers = self.app.config['COOKZILLA_PASSWORD_WORKERS']
+        if workers == 0:
+            return f(*args)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(workers)
+        return self._executor.submit(f, *args).result()
@@ -0,0 +1,57 @@
+import logging
+
+import sqlalchemy as sa
+from flask import request
+from flask_sqlalchemy import SignallingSession
+
+from .exceptions import ReadOnlySessionError
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class ReadOnlyRequests(object):
+    """
+    Runs GET and HEAD requests in a read-only session.
+
+    Such a session refuses to flush, and its transaction is rolled back
+    instead of committed on teardown, so a page view never takes a write lock.
+    Views that change data on GET opt out with the read_write decorator.
+    Disabled when COOKZILLA_READ_ONLY_GETS is false.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['read_only_requests'] = self
+        app.before_request(self._before_request)
+        # request teardown runs before the commit on app context teardown
+        app.teardown_request(self._teardown)
+
+    def _before_request(self):
+        if not self.app.config['COOKZILLA_READ_ONLY_GETS'] or request.method not in SAFE_METHODS:
+            return
+        view = self.app.view_functions.get(request.endpoint)
+        if view is None or not getattr(view, 'read_write', False):
+            from . import db
+            db.session.info['read_only'] = True
+
+    def _teardown(self, exc):
+        from . import db
+        if db.session.info.pop('read_only', False):
+            if db.session.new or db.session.dirty or db.session.deleted:
+                logger.warning('Discarding changes made during read-only %s %s',
+                               request.method, request.path)
+            db.session.rollback()
+
+
+@sa.event.listens_for(SignallingSession, 'before_flush')
+def _refuse_flush(session, flush_context, instances):
+    if session.info.get('read_only'):
+        raise ReadOnlySessionError('{} {} runs in a read-only session, '
+                                   'mark the view with @read_write'.format(request.method, request.path))
@@ -1,10 +1,11 @@
-from flask import current_app
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField
 from wtforms import StringField, TextAreaField, SelectField, SubmitField, \
     SelectMultipleField, FieldList, FormField, widgets, FloatField
 from wtforms.validators import Length, url, Optional, InputRequired
 
+from .. import reference_data
+
 
 class MultiCheckboxField(SelectMultipleField):
     widget = widgets.ListWidget(prefix_label=False)
@@ -23,7 +24,7 @@ class IngredientForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(IngredientForm, self).__init__(*args, **kwargs)
-        self.unit.choices = [(_, _) for _ in current_app.config['INGREDIENT_CONVERSION'].keys()]
+        self.unit.choices = [(_, _) for _ in reference_data.units.keys()]
 
 
 class LinkForm(FlaskForm):
@@ -50,8 +51,8 @@ class RecipeForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(RecipeForm, self).__init__(*args, **kwargs)
         self.serving.choices = [(_, _) for _ in range(1, 6)]  # (value, label) pairs
-        self.tags.choices = [(str(i), _) for i, _ in enumerate(current_app.config['RECIPE_TAGS'], 1)]
-        self.tags.default = ['1']
+        self.tags.choices = [(str(tag.id), tag.tag) for tag in reference_data.tags]
+        self.tags.default = [value for value, label in self.tags.choices[:1]]
 
 
 class ReviewForm(FlaskForm):
@@ -1,14 +1,21 @@
 import os
 
-from flask import render_template, redirect, url_for, abort, flash, request, current_app
+from flask import render_template, redirect, url_for, abort, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
+from flask_sqlalchemy import Pagination
+from sqlalchemy import func
 from werkzeug.utils import secure_filename
 
 from app.recipes.forms import RecipeForm
 from . import recipes
 from .forms import ReviewForm
-from .. import db
-from ..models import Permission, Recipe, Review, Ingredient, Tag, User, LogEvent
+from .. import db, csrf, response_cache, image_pipeline, recommender, ingredient_index
+from ..bulk import create_recipes
+from ..decorators import permission_required
+from ..exceptions import ValidationError
+from ..ingredients import scale, shopping_list as aggregate
+from ..models import Permission, Recipe, Review, User, LogEvent
+from ..pagination import paginate
 from ..utils.tools import gen_rnd_filename
 
 
@@ -29,63 +36,25 @@ def create():
         recipe_form.photo.data.save(os.path.join(fpath))
         photos = url_for('static', filename='{}/{}'.format('upload', filename))
 
-        recipe = Recipe(author=current_user._get_current_object(),
-                        title=title, serving=serving, body=body, photos=photos)
-        db.session.add(recipe)
-        db.session.commit()
-
-        # Snoopyimage.jpg
-        # [{'name': 'app', 'unit': 'pound(lb)', 'quantity': '1'}]
-        # [{'name': 'ban', 'unit': 'pound(lb)', 'quantity': '2'}, {'name': '', 'unit': 'pound(lb)', 'quantity': ''},
-        #  {'name': '', 'unit': 'pound(lb)', 'quantity': ''}, {'name': '', 'unit': 'pound(lb)', 'quantity': ''}]
-        # ['2', '3', '4']
-        # [{'link': 'http://127.0.0.1:5000/recipes/1'}, {'link': 'http://127.0.0.1:5000/recipes/2'}]
-
-        # # ingredient must one
-        # tmp = recipe_form.ingredients.data[0]
-        # name = tmp["name"]
-        # unit = tmp["unit"]
-        # try:
-        #     quantity = int(tmp["quantity"])
-        #     ingredient = Ingredient(name=name, recipe=recipe, unit=unit, quantity=quantity)
-        #     db.session.add(ingredient)
-        # except:
-        #     pass
-
-        # ingredient optical
-        for ingredient in recipe_form.ingredients_optical.data:
-            if ingredient["name"] and ingredient["quantity"]:
-                name = ingredient["name"]
-                unit = ingredient["unit"]
-                try:
-                    quantity = float(ingredient["quantity"])
-                    ingredient = Ingredient(name=name, recipe=recipe, unit=unit, quantity=quantity)
-                    db.session.add(ingredient)
-                except:
-                    pass
-
-        # if link is provided
+        # links are urls of other recipes, ending with their id
+        links = []
         for data in recipe_form.links.data:
             try:
-                tmp = data["link"].split("/")
-                other_link = Recipe.query.filter_by(id=int(tmp[-1])).first()
-                if other_link:
-                    recipe.link(other_link)
-                    db.session.add(recipe)
-            except:
-                pass
-
-        # if tags is provided
-        for tag in recipe_form.tags.data:
-            try:
-                tag = Tag.query.filter_by(id=int(tag)).first()
-                if tag:
-                    recipe.tag(tag)
-                    db.session.add(recipe)
-            except:
+                links.append(int(data["link"].split("/")[-1]))
+            except (KeyError, AttributeError, ValueError):
                 pass
-
-        db.session.commit()
+        ingredients = []
+        for ingredient in recipe_form.ingredients_optical.data:
+            if ingredient["name"] and ingredient["quantity"]:
+                try:
+                    float(ingredient["quantity"])
+                except (TypeError, ValueError):
+                    continue
+                ingredients.append(ingredient)
+        recipe, = create_recipes(current_user._get_current_object(), [dict(
+            title=title, serving=serving, body=body, photos=photos, ingredients=ingredients,
+            links=links, tags=[tag for tag in recipe_form.tags.data if tag.isdigit()])])
+        image_pipeline.submit(filename, recipe.id)
 
         flash('You have posted your recipe')
 
@@ -98,7 +67,43 @@ def create():
     return render_template('recipes/create.html', recipe_form=recipe_form)
 
 
+@recipes.route('/import', methods=['POST'])
+@login_required
+@permission_required(Permission.WRITE_ARTICLES)
+def import_recipes():
+    """
+    Create many recipes from a JSON body ``{"recipes": [...]}``, each entry
+    as create_recipes() takes it. Nothing is written when any is invalid.
+    """
+    data = request.get_json(silent=True)
+    entries = data.get('recipes') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return jsonify({'error': 'expected {"recipes": [...]}'}), 400
+    if len(entries) > current_app.config['COOKZILLA_IMPORT_MAX_RECIPES']:
+        return jsonify({'error': 'at most {} recipes per import'.format(
+            current_app.config['COOKZILLA_IMPORT_MAX_RECIPES'])}), 400
+    try:
+        created = create_recipes(current_user._get_current_object(), entries)
+    except ValidationError as e:
+        return jsonify({'error': e.args[0]}), 400
+    return jsonify({'recipes': [{'id': recipe.id, 'url': url_for('.recipe', id=recipe.id, _external=True)}
+                                for recipe in created]}), 201
+
+
+def _recipe_validator(id):
+    row = db.session.query(Recipe.timestamp, Recipe.review_count,
+                           db.session.query(func.max(Review.timestamp))
+                           .filter(Review.recipe_id == Recipe.id).as_scalar()) \
+        .filter(Recipe.id == id).first()
+    if row is None:
+        return None
+    timestamp, review_count, newest_review = row
+    timestamps = [t for t in (timestamp, newest_review) if t is not None]
+    return max(timestamps) if timestamps else None, review_count
+
+
 @recipes.route('/<int:id>', methods=['GET', 'POST'])
+@response_cache.cached('recipe', _recipe_validator, key='id')
 def recipe(id):
     recipe = Recipe.query.get_or_404(id)
     form = ReviewForm()
@@ -111,20 +116,106 @@ def recipe(id):
                         author=current_user._get_current_object())
         db.session.add(review)
         flash('Your review has been published.')
-        return redirect(url_for('.recipe', id=recipe.id, page=-1))
-    page = request.args.get('page', 1, type=int)
-    if page == -1:
-        page = (recipe.reviews.count() - 1) // \
-               current_app.config['COOKZILLA_COMMENTS_PER_PAGE'] + 1
-    pagination = recipe.reviews.order_by(Review.timestamp.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_COMMENTS_PER_PAGE'],
-        error_out=False)
+        # newest reviews come first
+        return redirect(url_for('.recipe', id=recipe.id))
+    pagination = paginate(recipe.reviews, Review.timestamp, Review.id,
+                          current_app.config['COOKZILLA_COMMENTS_PER_PAGE'], total=recipe.review_count)
     reviews = pagination.items
     # log
     LogEvent.log(current_user, "browse", recipe)
 
+    servings = request.args.get('servings', recipe.serving or 1, type=int)
+    servings = min(max(servings, 1), current_app.config['COOKZILLA_MAX_SERVINGS'])
     return render_template('recipes/recipe.html', recipe=recipe, form=form,
-                           reviews=reviews, pagination=pagination)
+                           reviews=reviews, pagination=pagination,
+                           related=recommender.related(recipe.id),
+                           servings=servings, ingredients=scale(recipe, servings))
+
+
+def _servings(value):
+    """A number of people from a request, None for the recipe's own serving."""
+    if value in (None, ''):
+        return None
+    try:
+        servings = int(value)
+    except (TypeError, ValueError):
+        abort(400)
+    if not 1 <= servings <= current_app.config['COOKZILLA_MAX_SERVINGS']:
+        abort(400)
+    return servings
+
+
+@csrf.exempt
+@recipes.route('/shopping-list', methods=['GET', 'POST'])
+def shopping_list():
+    """
+    The combined ingredients of many recipes.
+
+    GET takes comma separated recipe ``ids`` and an optional ``servings``
+    for all of them. POST takes a JSON object of recipe id to servings,
+    null for the recipe's own, for lists too long for a query string; it
+    changes nothing, so it needs no CSRF token.
+    """
+    if request.method == 'POST':
+        wanted = request.get_json(silent=True)
+        if not isinstance(wanted, dict):
+            abort(400)
+        try:
+            servings = dict((int(id), _servings(value)) for id, value in wanted.items())
+        except ValueError:
+            abort(400)
+    else:
+        servings = _servings(request.args.get('servings'))
+        try:
+            ids = [int(id) for id in request.args.get('ids', '').split(',') if id.strip()]
+        except ValueError:
+            abort(400)
+        servings = dict((id, servings) for id in ids)
+    if len(servings) > current_app.config['COOKZILLA_SHOPPING_LIST_MAX_RECIPES']:
+        abort(400)
+    items = aggregate(servings)
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        return jsonify({'recipes': len(servings),
+                        'items': [item._asdict() for item in items]})
+    recipes = Recipe.query.filter(Recipe.id.in_(list(servings)[:50])).all() if servings else []
+    return render_template('recipes/shopping_list.html', items=items, recipes=recipes,
+                           count=len(servings))
+
+
+def _names(value):
+    """The ingredient names of a comma separated request argument."""
+    return [name for name in (value or '').split(',') if name.strip()]
+
+
+@recipes.route('/by-ingredients')
+def by_ingredients():
+    """
+    Recipes using every ingredient of ``with`` and none of ``without``.
+    With ``have``, the recipes that can be cooked from those ingredients
+    short of at most ``missing`` others.
+    """
+    with_all, without = _names(request.args.get('with')), _names(request.args.get('without'))
+    have = _names(request.args.get('have')) if 'have' in request.args else None
+    missing = min(max(request.args.get('missing', 1 if have is not None else 0, type=int), 0), 10)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['COOKZILLA_POSTS_PER_PAGE']
+    if with_all or have is not None:
+        ids, needed = ingredient_index.find(with_all, without, have, missing)
+    else:
+        ids, needed = [], []
+    start = (page - 1) * per_page
+    shown = dict(zip(ids[start:start + per_page].tolist(), needed[start:start + per_page].tolist())) \
+        if len(ids) else {}
+    found = dict((r.id, r) for r in Recipe.query.filter(Recipe.id.in_(list(shown)))) if shown else {}
+    items = [found[id] for id in shown if id in found]
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        return jsonify({'total': len(ids), 'page': page,
+                        'recipes': [{'id': r.id, 'title': r.title, 'missing': shown[r.id],
+                                     'url': url_for('.recipe', id=r.id, _external=True)} for r in items]})
+    pagination = Pagination(None, page, per_page, len(ids), items)
+    return render_template('recipes/by_ingredients.html', recipes=items, missing=shown,
+                           pagination=pagination, with_all=with_all, without=without, have=have,
+                           max_missing=missing)
 
 
 @recipes.route('/edit/<int:id>', methods=['GET', 'POST'])
@@ -150,10 +241,8 @@ def recipe_list(username):
     if user is None:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    page = request.args.get('page', 1, type=int)
-    pagination = user.recipes.order_by(Recipe.timestamp.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(user.recipes, Recipe.timestamp, Recipe.id,
+                          current_app.config['COOKZILLA_FOLLOWERS_PER_PAGE'], total=user.recipe_count)
     recipes = [{'user': item.member, 'recipe': item.recipe, 'timestamp': item.timestamp}
                for item in pagination.items]
     return render_template('recipes/recipe.html', user=user,
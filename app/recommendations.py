@@ -0,0 +1,215 @@
+import time
+
+import sqlalchemy as sa
+
+#: the log_events op recorded when a recipe page is viewed
+BROWSE = 'browse'
+
+# rows fetched from the database per round trip while building the matrices
+FETCH_SIZE = 100000
+
+
+def similar_recipes(browse, tags, k, tag_weight=0.5, rows=None, batch=2048, pool=2000):
+    """
+    Find the ``k`` recipes most similar to each row index in ``rows`` (every
+    row by default).
+
+    ``browse`` is a sparse recipes x users matrix of browse counts and
+    ``tags`` a sparse recipes x tags matrix with the same rows. The score is
+    the cosine similarity of the log damped browse counts, which is
+    co-browsing, plus ``tag_weight`` times the cosine similarity of the
+    tags. Candidates are the co-browsed recipes, plus the best tag matches
+    among the ``pool`` most browsed recipes, so new and unbrowsed recipes
+    get recommendations too. Pairs with nothing in common are left out.
+
+    Rows are scored ``batch`` at a time with one sparse product each, and
+    every batch yields (row, related row, score, rank) arrays.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    n = browse.shape[0]
+    counts = sparse.csr_matrix(browse, dtype=np.float32)
+    counts.data = np.log1p(counts.data)
+    norms = np.sqrt(np.asarray(counts.multiply(counts).sum(axis=1)).ravel())
+    normalized = sparse.diags(np.where(norms > 0, 1 / np.maximum(norms, 1e-12), 0)) @ counts
+    normalized = normalized.tocsr()
+    transposed = normalized.T.tocsr()
+
+    # recipes with the same tags share a signature, so the tag similarity of
+    # any pair is one lookup in a signatures x signatures table
+    present = sparse.csr_matrix(tags, dtype=np.float32)
+    present.eliminate_zeros()
+    present.sort_indices()
+    present.data[:] = 1
+    seen = {}
+    signature = np.array([seen.setdefault(present.indices[a:b].tobytes(), len(seen))
+                          for a, b in zip(present.indptr[:-1], present.indptr[1:])], dtype=np.int64)
+    vectors = present[np.unique(signature, return_index=True)[1]]
+    lengths = np.sqrt(np.diff(vectors.indptr)).astype(np.float32)
+    vectors = sparse.diags(np.where(lengths > 0, 1 / np.maximum(lengths, 1e-12), 0)) @ vectors
+    tag_similarity = tag_weight * (vectors @ vectors.T).toarray().astype(np.float32)
+
+    # the fallback candidates of each signature, popularity breaks the ties
+    popularity = np.asarray(browse.sum(axis=1)).ravel().astype(np.float32)
+    candidates = np.argsort(-popularity, kind='stable')[:pool]
+    fallback_scores = tag_similarity[:, signature[candidates]]
+    fallback_scores += 1e-3 * popularity[candidates] / max(popularity.max(), 1)
+    width = min(k + 1, len(candidates))
+    best = np.argpartition(-fallback_scores, width - 1, axis=1)[:, :width] \
+        if width < len(candidates) else np.tile(np.arange(len(candidates)), (len(seen), 1))
+    fallback = candidates[best]
+    fallback_scores = np.take_along_axis(fallback_scores, best, axis=1).astype(np.float32)
+
+    rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.int64)
+    for start in range(0, len(rows), batch):
+        chunk = rows[start:start + batch]
+        product = (normalized[chunk] @ transposed).tocoo()
+        product.data += tag_similarity[signature[chunk][product.row], signature[product.col]]
+        candidates = sparse.csr_matrix((fallback_scores[signature[chunk]].ravel(),
+                                        (np.repeat(np.arange(len(chunk)), fallback.shape[1]),
+                                         fallback[signature[chunk]].ravel())), shape=product.shape)
+        # a fallback may also be co-browsed, keep the better score of a pair
+        scored = product.tocsr().maximum(candidates).tocoo()
+        local, related, score = scored.row, scored.col, scored.data
+        # nothing in common is no recommendation
+        keep = (related != chunk[local]) & (score > 0)
+        local, related, score = local[keep], related[keep], score[keep]
+
+        # by row, best score first, with one sort of a float key
+        order = np.argsort(local + (1 - score / (score.max(initial=0) + 1)), kind='stable')
+        local, related, score = local[order], related[order], score[order]
+        rank = np.arange(len(local)) - np.searchsorted(local, np.arange(len(chunk)))[local]
+        keep = rank < k
+        yield chunk[local[keep]], related[keep], score[keep], rank[keep]
+
+
+class Recommender(object):
+    """
+    "You might also like" recipes, precomputed offline into the
+    related_recipes table so a recipe page reads them with one indexed
+    lookup.
+
+    rebuild() scores every recipe; refresh() rescores the recipes browsed or
+    posted since a given time, which is what a periodic job runs. Both load
+    the whole recipe x user browse matrix and recipe x tag matrix, see
+    similar_recipes(). Each recipe keeps COOKZILLA_RELATED_RECIPES
+    neighbours, and COOKZILLA_RELATED_TAG_WEIGHT weighs shared tags against
+    co-browsing.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['recommender'] = self
+
+    def related(self, recipe_id):
+        """The related recipes of ``recipe_id``, best first."""
+        from .models import Recipe, RelatedRecipe
+
+        return Recipe.query.join(RelatedRecipe, RelatedRecipe.related_id == Recipe.id) \
+            .filter(RelatedRecipe.recipe_id == recipe_id) \
+            .order_by(RelatedRecipe.rank) \
+            .limit(self.app.config['COOKZILLA_RELATED_RECIPES']).all()
+
+    def rebuild(self):
+        """Score every recipe, return timing stats."""
+        return self._update(None)
+
+    def refresh(self, since):
+        """Score the recipes browsed or posted since ``since``, return timing stats."""
+        from . import db
+        from .models import LogEvent, Recipe
+
+        browsed = sa.select([LogEvent.recipe_id]).where(
+            sa.and_(LogEvent.logged_at >= since, LogEvent.op == BROWSE))
+        posted = sa.select([Recipe.id]).where(Recipe.timestamp >= since)
+        with db.engine.connect() as conn:
+            recipe_ids = set(row[0] for row in conn.execute(sa.union(browsed, posted)))
+        recipe_ids.discard(None)
+        return self._update(recipe_ids)
+
+    def _update(self, recipe_ids):
+        import numpy as np
+        from . import db
+        from .models import RelatedRecipe
+
+        config = self.app.config
+        table = RelatedRecipe.__table__
+        stats = dict(recipes=0, pairs=0)
+        start = time.time()
+        with db.engine.connect() as conn:
+            ids, browse, tags = self._matrices(conn)
+        stats['load'] = time.time() - start
+        rows = wanted = None
+        if recipe_ids is not None:
+            wanted = np.array(sorted(recipe_ids), dtype=np.int64)
+            rows = np.searchsorted(ids, wanted)
+            rows = rows[(rows < len(ids)) & (ids[np.minimum(rows, len(ids) - 1)] == wanted)] \
+                if len(ids) else rows[:0]
+        stats['recipes'] = len(ids) if rows is None else len(rows)
+
+        # score everything before writing, so the write lock is only held
+        # while the old rows are swapped for the new ones
+        mark = time.time()
+        pairs = []
+        if len(ids) and stats['recipes']:
+            for row, related, score, rank in similar_recipes(browse, tags, config['COOKZILLA_RELATED_RECIPES'],
+                                                             config['COOKZILLA_RELATED_TAG_WEIGHT'], rows):
+                pairs.append([dict(recipe_id=a, related_id=b, score=c, rank=d) for a, b, c, d in
+                              zip(ids[row].tolist(), ids[related].tolist(), score.tolist(), rank.tolist())])
+                stats['pairs'] += len(row)
+        stats['compute'] = time.time() - mark
+
+        mark = time.time()
+        with db.engine.begin() as conn:
+            if wanted is not None:
+                for i in range(0, len(wanted), 500):
+                    conn.execute(table.delete().where(table.c.recipe_id.in_(wanted[i:i + 500].tolist())))
+            else:
+                conn.execute(table.delete())
+            for batch in pairs:
+                conn.execute(table.insert(), batch)
+        stats['write'] = time.time() - mark
+        stats['total'] = time.time() - start
+        return stats
+
+    @staticmethod
+    def _matrices(conn):
+        """(sorted recipe ids, recipes x users browse counts, recipes x tags) of the database."""
+        import numpy as np
+        from scipy import sparse
+        from .models import LogEvent, Recipe, recipe_tags
+
+        ids = np.array([row[0] for row in conn.execute(sa.select([Recipe.id]).order_by(Recipe.id))],
+                       dtype=np.int64)
+
+        def fetch(query, columns):
+            result = conn.execute(query)
+            chunks = []
+            while True:
+                rows = result.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                chunks.append(np.array(rows, dtype=np.int64).reshape(-1, columns))
+            return np.concatenate(chunks) if chunks else np.zeros((0, columns), dtype=np.int64)
+
+        def matrix(pairs, values):
+            # rows of recipes deleted since are dropped
+            rows = np.searchsorted(ids, pairs[:, 0])
+            keep = rows < len(ids)
+            keep[keep] = ids[rows[keep]] == pairs[keep, 0]
+            columns, column = np.unique(pairs[keep, 1], return_inverse=True)
+            return sparse.csr_matrix((values[keep], (rows[keep], column.ravel())),
+                                     shape=(len(ids), len(columns)))
+
+        logs = fetch(sa.select([LogEvent.recipe_id, LogEvent.user_id, sa.func.coalesce(LogEvent.ct, 1)]).where(
+            sa.and_(LogEvent.op == BROWSE, LogEvent.recipe_id.isnot(None), LogEvent.user_id.isnot(None))), 3)
+        tagged = fetch(sa.select([recipe_tags.c.recipe_id, recipe_tags.c.tag_id]).where(
+            sa.and_(recipe_tags.c.recipe_id.isnot(None), recipe_tags.c.tag_id.isnot(None))), 2)
+        return ids, matrix(logs[:, :2], logs[:, 2].astype(np.float32)), \
+            matrix(tagged, np.ones(len(tagged), dtype=np.float32))
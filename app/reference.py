@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import namedtuple
+
+import sqlalchemy as sa
+
+from .signals import model_committed
+
+RoleInfo = namedtuple('RoleInfo', 'id name default permissions')
+TagInfo = namedtuple('TagInfo', 'id tag')
+
+
+class ReferenceData(object):
+    """
+    Per-worker snapshot of the small, rarely changing tables: roles, tags
+    and the ingredient unit conversions.
+
+    The snapshot is loaded with one query per table on first use and
+    reused until a commit touches a role or tag, the tables are created or
+    dropped, or COOKZILLA_REFERENCE_TTL seconds have passed (which bounds
+    how long edits made through another worker stay invisible). ``version``
+    grows with every reload.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.version = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+
+        self.app = app
+        app.extensions['reference_data'] = self
+        model_committed.connect(self._on_model_committed, sender=app)
+        for event in ('after_create', 'after_drop'):
+            if not sa.event.contains(db.metadata, event, self._on_ddl):
+                sa.event.listen(db.metadata, event, self._on_ddl)
+
+    @property
+    def roles(self):
+        """Every role, ordered by name."""
+        return self._get()['roles']
+
+    @property
+    def tags(self):
+        """Every tag, ordered by id."""
+        return self._get()['tags']
+
+    @property
+    def units(self):
+        """{unit name: amount per kilogram} of the ingredient units."""
+        return self.app.config['INGREDIENT_CONVERSION']
+
+    def role(self, role_id):
+        return self._get()['roles_by_id'].get(role_id)
+
+    def tag(self, tag_id):
+        return self._get()['tags_by_id'].get(tag_id)
+
+    @property
+    def default_role(self):
+        return next((role for role in self.roles if role.default), None)
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _get(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot['expires'] < time.time():
+            snapshot = self._load()
+        return snapshot
+
+    def _load(self):
+        from . import db
+        from .models import Role, Tag
+
+        with db.get_engine(self.app).connect() as conn:
+            roles = [RoleInfo(*row) for row in conn.execute(
+                sa.select([Role.id, Role.name, Role.default, Role.permissions]).order_by(Role.name))]
+            tags = [TagInfo(*row) for row in conn.execute(
+                sa.select([Tag.id, Tag.tag]).order_by(Tag.id))]
+        with self._lock:
+            self.version += 1
+            self._snapshot = dict(roles=roles, roles_by_id=dict((r.id, r) for r in roles),
+                                  tags=tags, tags_by_id=dict((t.id, t) for t in tags),
+                                  expires=time.time() + self.app.config['COOKZILLA_REFERENCE_TTL'])
+            return self._snapshot
+
+    def _on_model_committed(self, app, changes):
+        from .models import Role, Tag
+
+        if any(isinstance(change.instance, (Role, Tag)) for change in changes):
+            self.invalidate()
+
+    def _on_ddl(self, target, connection, **kw):
+        self.invalidate()
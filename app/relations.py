@@ -0,0 +1,89 @@
+from flask import _request_ctx_stack
+
+
+class RelationState(object):
+    """
+    Follow, membership and RSVP state of one user towards other rows.
+
+    Each map goes from the other row's id to the answer (True/False, or the
+    RSVP status, None when there is no RSVP). Missing ids are loaded with one
+    query per relation, so preloading a page of users, groups or events
+    makes every later per-row check free. Use relations(user) to get the
+    state, it lives as long as the current request.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.following = {}
+        self.followed_by = {}
+        self.member_of = {}
+        self.rsvps = {}
+
+    def load(self, users=(), groups=(), events=()):
+        from . import db
+        from .models import Follow, GroupMember, RSVP
+
+        users, groups, events = list(users), list(groups), list(events)
+        _flush_pending(users + groups + events)
+        user_ids = _missing(users, self.following)
+        if user_ids:
+            self.following.update(dict.fromkeys(user_ids, False))
+            self.following.update((i, True) for i, in db.session.query(Follow.followed_id).filter(
+                Follow.follower_id == self.user_id, Follow.followed_id.in_(user_ids)))
+        user_ids = _missing(users, self.followed_by)
+        if user_ids:
+            self.followed_by.update(dict.fromkeys(user_ids, False))
+            self.followed_by.update((i, True) for i, in db.session.query(Follow.follower_id).filter(
+                Follow.followed_id == self.user_id, Follow.follower_id.in_(user_ids)))
+        group_ids = _missing(groups, self.member_of)
+        if group_ids:
+            self.member_of.update(dict.fromkeys(group_ids, False))
+            self.member_of.update((i, True) for i, in db.session.query(GroupMember.group_id).filter(
+                GroupMember.member_id == self.user_id, GroupMember.group_id.in_(group_ids)))
+        event_ids = _missing(events, self.rsvps)
+        if event_ids:
+            self.rsvps.update(dict.fromkeys(event_ids))
+            self.rsvps.update(db.session.query(RSVP.event_id, RSVP.status).filter(
+                RSVP.member_id == self.user_id, RSVP.event_id.in_(event_ids)))
+        return self
+
+    def is_following(self, user):
+        return self.load(users=[user]).following.get(user.id, False)
+
+    def is_followed_by(self, user):
+        return self.load(users=[user]).followed_by.get(user.id, False)
+
+    def is_member(self, group):
+        return self.load(groups=[group]).member_of.get(group.id, False)
+
+    def rsvp(self, event):
+        return self.load(events=[event]).rsvps.get(event.id)
+
+
+def _flush_pending(rows):
+    # the dynamic relationship queries these checks replace autoflushed
+    # pending rows, keep doing that so new rows get their ids
+    if any(row.id is None for row in rows):
+        from . import db
+        if db.session.autoflush:
+            db.session.flush()
+
+
+def _missing(rows, known):
+    return sorted(set(row.id for row in rows if row.id is not None and row.id not in known))
+
+
+def relations(user):
+    """Return the RelationState of ``user`` for the current request."""
+    _flush_pending([user])
+    ctx = _request_ctx_stack.top
+    if ctx is None or user.id is None:
+        # outside a request nothing is cached, every check queries
+        return RelationState(user.id)
+    states = getattr(ctx, 'cookzilla_relations', None)
+    if states is None:
+        states = ctx.cookzilla_relations = {}
+    state = states.get(user.id)
+    if state is None:
+        state = states[user.id] = RelationState(user.id)
+    return state
@@ -0,0 +1,223 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+from .signals import model_committed
+
+# cached bodies are shared between visitors, their CSRF token is filled in
+# per response
+CSRF_PLACEHOLDER = '__cookzilla_csrf_token__'
+
+Entry = namedtuple('Entry', 'etag last_modified body mimetype render_time entity expires')
+
+
+class ResponseCache(object):
+    """
+    Conditional GET and rendered-page cache for anonymous traffic.
+
+    A cached view declares the entity it renders (e.g. ('recipe', 7)) and a
+    validator, a cheap query returning the newest relevant timestamp and a
+    fingerprint (counts, ids) of what the page shows. From these it gets a
+    strong ETag and a Last-Modified header, an If-None-Match hit is answered
+    with 304 before the view runs, and otherwise a body rendered for the
+    same ETag is served from a per-worker LRU of COOKZILLA_RESPONSE_CACHE_SIZE
+    pages.
+
+    Pages are rendered with a placeholder CSRF token that is replaced by the
+    visitor's own token whenever the body is sent. Entries are purged by
+    entity when a commit changes the rows behind them.
+    Validators roll over every COOKZILLA_RESPONSE_CACHE_TTL seconds, which
+    bounds how long an edit committed through another worker, and not
+    visible in the fingerprint, can go unnoticed.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['response_cache'] = self
+        model_committed.connect(self._on_model_committed, sender=app)
+        app.context_processor(lambda: dict(csrf_token=self._csrf_token))
+
+    def reset_stats(self):
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+        self.saved_time = 0.0
+        self.render_time = 0.0
+
+    @property
+    def hit_ratio(self):
+        served = self.hits + self.not_modified
+        return served / float(served + self.misses) if served + self.misses else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def cached(self, kind, validator, key=None):
+        """
+        Decorate a view rendering the entity (kind, view_args[key]).
+
+        ``validator`` is called with the view arguments and returns
+        (last modified datetime, fingerprint), or None when the page should
+        not be cached, e.g. for a missing entity.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not self._cacheable():
+                    return f(*args, **kwargs)
+                validators = validator(**kwargs)
+                if validators is None:
+                    return f(*args, **kwargs)
+                last_modified, fingerprint = validators
+                entity = (kind, kwargs[key]) if key else (kind,)
+                etag = self._etag(last_modified, fingerprint)
+                entry = self._get(request.full_path)
+                if entry is not None and entry.etag != etag:
+                    entry = None
+                if request.if_none_match.contains(etag):
+                    self.not_modified += 1
+                    self.saved_time += entry.render_time if entry else 0.0
+                    rv = current_app.response_class(status=304)
+                elif entry is not None:
+                    self.hits += 1
+                    self.saved_time += entry.render_time
+                    rv = current_app.response_class(self._personalize(entry.body), mimetype=entry.mimetype)
+                else:
+                    start = time.time()
+                    g.response_cache_rendering = True
+                    try:
+                        rv = make_response(f(*args, **kwargs))
+                    finally:
+                        g.response_cache_rendering = False
+                    render_time = time.time() - start
+                    self.misses += 1
+                    self.render_time += render_time
+                    body = rv.get_data()
+                    rv.set_data(self._personalize(body))
+                    if rv.status_code != 200:
+                        return rv
+                    self._put(request.full_path, Entry(etag, last_modified, body, rv.mimetype,
+                                                       render_time, entity, None))
+                rv.set_etag(etag)
+                rv.last_modified = last_modified
+                rv.cache_control.no_cache = True
+                rv.vary.add('Cookie')
+                return rv
+            return decorated_function
+        return decorator
+
+    def purge(self, kind, ident=None):
+        """Drop the pages of one entity, or of every entity of ``kind``."""
+        with self._lock:
+            for path in [path for path, entry in self._entries.items()
+                         if entry.entity[0] == kind and (ident is None or entry.entity[1:] == (ident,))]:
+                del self._entries[path]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _cacheable(self):
+        # flashed messages are rendered once, into one user's page
+        return request.method in ('GET', 'HEAD') and not current_user.is_authenticated \
+            and '_flashes' not in session
+
+    @staticmethod
+    def _csrf_token():
+        if g.get('response_cache_rendering'):
+            return CSRF_PLACEHOLDER
+        return generate_csrf()
+
+    @staticmethod
+    def _personalize(body):
+        placeholder = CSRF_PLACEHOLDER.encode('ascii')
+        if placeholder not in body:
+            return body
+        return body.replace(placeholder, generate_csrf().encode('ascii'))
+
+    def _etag(self, last_modified, fingerprint):
+        ttl = self.app.config['COOKZILLA_RESPONSE_CACHE_TTL']
+        generation = int(time.time() // ttl) if ttl else 0
+        value = repr((request.full_path, last_modified, fingerprint, generation))
+        return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+    def _get(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return None
+            if entry.expires < time.time():
+                del self._entries[path]
+                return None
+            self._entries.move_to_end(path)
+            return entry
+
+    def _put(self, path, entry):
+        size = self.app.config['COOKZILLA_RESPONSE_CACHE_SIZE']
+        if size <= 0:
+            return
+        ttl = self.app.config['COOKZILLA_RESPONSE_CACHE_TTL']
+        with self._lock:
+            self._entries[path] = entry._replace(expires=time.time() + ttl)
+            self._entries.move_to_end(path)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def _on_model_committed(self, app, changes):
+        from .models import Follow, GroupMember, Ingredient, Recipe, Review, Tag, User
+
+        recipes, authors, purge_lists = set(), set(), False
+        for change in changes:
+            instance, values = change.instance, change.values
+            if isinstance(instance, (User, Tag)):
+                # names and tags appear on every page
+                self.clear()
+                return
+            elif isinstance(instance, (Recipe, Review)):
+                recipes.add(values['id'] if isinstance(instance, Recipe) else values['recipe_id'])
+                authors.add(values['author_id'])
+                purge_lists = True
+            elif isinstance(instance, Ingredient):
+                recipes.add(values['recipe_id'])
+            elif isinstance(instance, Follow):
+                authors.update([values['follower_id'], values['followed_id']])
+            elif isinstance(instance, GroupMember):
+                authors.add(values['member_id'])
+        if purge_lists:
+            self.purge('index')
+            self.purge('tag')
+        for recipe_id in recipes - set([None]):
+            self.purge('recipe', recipe_id)
+        authors.discard(None)
+        if authors:
+            from . import db
+            with db.get_engine(app).connect() as conn:
+                for username, in conn.execute(
+                        User.__table__.select().with_only_columns([User.username])
+                        .where(User.id.in_(authors))):
+                    self.purge('user', username)
+
+
+def recipe_list_validator(query, per_page):
+    """Validators of a page of ``query``'s recipes: newest timestamp, ids and review counts."""
+    from .models import Recipe
+    from .pagination import page_query
+
+    query, backwards = page_query(query, Recipe.timestamp, Recipe.id, per_page)
+    rows = query.with_entities(Recipe.id, Recipe.timestamp, Recipe.review_count).all()
+    timestamps = [row.timestamp for row in rows if row.timestamp is not None]
+    return max(timestamps) if timestamps else None, tuple((row.id, row.review_count) for row in rows)
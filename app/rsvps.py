@@ -0,0 +1,102 @@
+"""
+RSVP writes as one upsert, with the going / not going / maybe tallies of the
+event adjusted in the same transaction, and the attendee lists of an event
+page read with one query.
+"""
+from collections import namedtuple
+
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from .log_writer import supports_upsert
+from .signals import record_change
+
+UPSERT = text("""
+INSERT INTO rsvps (member_id, event_id, timestamp, status)
+VALUES (:member_id, :event_id, :timestamp, :status)
+ON CONFLICT (member_id, event_id) DO UPDATE SET status = excluded.status
+""")
+
+UPDATE = text("""
+UPDATE rsvps SET status = :status
+WHERE member_id = :member_id AND event_id = :event_id
+""")
+
+INSERT = text("""
+INSERT INTO rsvps (member_id, event_id, timestamp, status)
+VALUES (:member_id, :event_id, :timestamp, :status)
+""")
+
+Attendee = namedtuple('Attendee', 'member status timestamp')
+
+
+def set_rsvp(session, member_id, event_id, status):
+    """
+    Make ``status`` the RSVP of the member to the event, inside the
+    session's transaction.
+
+    The event's row is locked first, so concurrent RSVPs to one event queue
+    up until the commit, and the previous status is read only then: under
+    READ COMMITTED that read sees what the transaction ahead committed, so
+    two first RSVPs of one member cannot both count. The tallies move from
+    the previous status to the new one after the RSVP is written.
+    """
+    from datetime import datetime
+    from .models import Event, RSVP, RSVP_TALLIES
+
+    # pending ORM rows go first, a pending RSVP would collide with the upsert
+    session.flush()
+    conn = session.connection()
+    events = Event.__table__
+    if conn.dialect.name != 'sqlite':
+        # SQLite has no row locks, its writers already queue on the database lock
+        conn.execute(sa.select([events.c.id]).where(events.c.id == event_id).with_for_update())
+    previous = conn.execute(sa.select([RSVP.status]).where(
+        sa.and_(RSVP.member_id == member_id, RSVP.event_id == event_id))).first()
+    previous = None if previous is None else previous[0]
+    if previous == status:
+        return
+    row = dict(member_id=member_id, event_id=event_id, timestamp=datetime.utcnow(), status=status)
+    if supports_upsert(conn):
+        conn.execute(UPSERT, row)
+    elif previous is None:
+        conn.execute(INSERT, row)
+    else:
+        conn.execute(UPDATE, row)
+    tallies = dict((counter.column, counter.column + (1 if status == counter.match_value else -1))
+                   for counter in RSVP_TALLIES if counter.match_value in (status, previous))
+    if tallies:
+        conn.execute(events.update().where(events.c.id == event_id).values(tallies))
+
+    # loaded copies are stale now
+    event = session.identity_map.get(sa.orm.util.identity_key(Event, event_id))
+    if event is not None:
+        session.expire(event, [counter.key for counter in RSVP_TALLIES])
+    rsvp = session.identity_map.get(sa.orm.util.identity_key(RSVP, (member_id, event_id)))
+    if rsvp is not None:
+        session.expire(rsvp, ['status'])
+    record_change(session, RSVP(member_id=member_id, event_id=event_id, status=status), 'update',
+                  dict(member_id=member_id, event_id=event_id, status=status), ['status'])
+
+
+def attendees(event_id, limit):
+    """
+    {status: [Attendee]} of the event, the first ``limit`` members to RSVP
+    with each status, their users loaded by the same query.
+    """
+    from . import db
+    from .models import RSVP, User
+
+    ranked = db.session.query(
+        RSVP.member_id.label('member_id'), RSVP.status.label('status'), RSVP.timestamp.label('timestamp'),
+        sa.func.row_number().over(partition_by=RSVP.status,
+                                  order_by=(RSVP.timestamp, RSVP.member_id)).label('rank')) \
+        .filter(RSVP.event_id == event_id).subquery()
+    rows = db.session.query(User, ranked.c.status, ranked.c.timestamp) \
+        .join(ranked, ranked.c.member_id == User.id) \
+        .filter(ranked.c.rank <= limit) \
+        .order_by(ranked.c.status, ranked.c.rank)
+    lists = {}
+    for user, status, timestamp in rows:
+        lists.setdefault(status, []).append(Attendee(user, status, timestamp))
+    return lists
@@ -0,0 +1,213 @@
+import re
+
+import sqlalchemy as sa
+from flask_sqlalchemy import Pagination
+
+from .signals import model_committed
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# the index lives outside the ORM: an FTS5 virtual table on SQLite and a
+# tsvector table with a GIN index on Postgres, keyed by recipe id
+SQLITE_CREATE = ("CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search "
+                 "USING fts5(title, body, ingredients, tags, tokenize='porter unicode61')")
+SQLITE_DROP = "DROP TABLE IF EXISTS recipe_search"
+POSTGRES_CREATE = ("CREATE TABLE IF NOT EXISTS recipe_search ("
+                   "recipe_id INTEGER PRIMARY KEY REFERENCES recipes(id) ON DELETE CASCADE, "
+                   "document TSVECTOR NOT NULL); "
+                   "CREATE INDEX IF NOT EXISTS ix_recipe_search_document "
+                   "ON recipe_search USING gin(document)")
+POSTGRES_DROP = "DROP TABLE IF EXISTS recipe_search"
+
+SQLITE_INDEX = """
+INSERT INTO recipe_search (rowid, title, body, ingredients, tags)
+SELECT r.id, r.title, r.body,
+       (SELECT group_concat(i.name, ' ') FROM ingredients i WHERE i.recipe_id = r.id),
+       (SELECT group_concat(t.tag, ' ') FROM recipe_tags rt JOIN tags t ON t.id = rt.tag_id
+        WHERE rt.recipe_id = r.id)
+FROM recipes r {where}
+"""
+
+POSTGRES_INDEX = """
+INSERT INTO recipe_search (recipe_id, document)
+SELECT r.id,
+       setweight(to_tsvector('english', coalesce(r.title, '')), 'A') ||
+       setweight(to_tsvector('english', coalesce(
+           (SELECT string_agg(t.tag, ' ') FROM recipe_tags rt JOIN tags t ON t.id = rt.tag_id
+            WHERE rt.recipe_id = r.id), '')), 'B') ||
+       setweight(to_tsvector('english', coalesce(
+           (SELECT string_agg(i.name, ' ') FROM ingredients i WHERE i.recipe_id = r.id), '')), 'B') ||
+       setweight(to_tsvector('english', coalesce(r.body, '')), 'D')
+FROM recipes r {where}
+ON CONFLICT (recipe_id) DO UPDATE SET document = excluded.document
+"""
+
+SQLITE_SEARCH = """
+SELECT s.rowid FROM recipe_search s JOIN recipes r ON r.id = s.rowid
+WHERE recipe_search MATCH :query
+ORDER BY bm25(recipe_search, 10.0, 1.0, 4.0, 4.0)
+         - :boost / (1.0 + julianday('now') - julianday(r.timestamp))
+LIMIT :limit OFFSET :offset
+"""
+
+SQLITE_COUNT = "SELECT count(*) FROM recipe_search WHERE recipe_search MATCH :query"
+
+POSTGRES_SEARCH = """
+SELECT s.recipe_id FROM recipe_search s JOIN recipes r ON r.id = s.recipe_id,
+       to_tsquery('english', :query) query
+WHERE s.document @@ query
+ORDER BY ts_rank_cd(s.document, query)
+         + :boost / (1.0 + extract(epoch FROM now() - r.timestamp) / 86400.0) DESC
+LIMIT :limit OFFSET :offset
+"""
+
+POSTGRES_COUNT = ("SELECT count(*) FROM recipe_search "
+                  "WHERE document @@ to_tsquery('english', :query)")
+
+
+def install_ddl(metadata):
+    """Create and drop the index together with db.create_all/db.drop_all."""
+    sa.event.listen(metadata, 'after_create',
+                    sa.DDL(SQLITE_CREATE).execute_if(dialect='sqlite'))
+    sa.event.listen(metadata, 'after_create',
+                    sa.DDL(POSTGRES_CREATE).execute_if(dialect='postgresql'))
+    sa.event.listen(metadata, 'before_drop',
+                    sa.DDL(SQLITE_DROP).execute_if(dialect='sqlite'))
+    sa.event.listen(metadata, 'before_drop',
+                    sa.DDL(POSTGRES_DROP).execute_if(dialect='postgresql'))
+
+
+class SearchIndex(object):
+    """
+    Full-text recipe search over title, body, ingredient names and tag names.
+
+    Results are ranked by relevance (bm25 on SQLite, ts_rank_cd on Postgres)
+    plus an optional recency boost, COOKZILLA_SEARCH_RECENCY_BOOST, that
+    decays with the age of the recipe in days. Other databases fall back to
+    a LIKE scan ordered by time.
+
+    Recipes are reindexed after every commit that touched them, their tags or
+    their ingredients.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['search_index'] = self
+        model_committed.connect(self._on_model_committed, sender=app)
+
+    @property
+    def engine(self):
+        from . import db
+        return db.get_engine(self.app)
+
+    @property
+    def dialect(self):
+        return self.engine.dialect.name
+
+    def search(self, query, page, per_page, within=None, excluding=None):
+        """
+        Return a Pagination of the recipes matching ``query``, only among
+        the recipe ids of ``within`` and not among those of ``excluding``
+        when given.
+        """
+        from .models import Recipe
+
+        tokens = TOKEN.findall(query.lower())
+        if not tokens or page < 1:
+            return Pagination(None, page, per_page, 0, [])
+        if self.dialect == 'sqlite':
+            match = ' '.join('"{}"*'.format(t) for t in tokens)
+            search_sql, count_sql = SQLITE_SEARCH, SQLITE_COUNT
+        elif self.dialect == 'postgresql':
+            match = ' & '.join('{}:*'.format(t) for t in tokens)
+            search_sql, count_sql = POSTGRES_SEARCH, POSTGRES_COUNT
+        else:
+            return self._like(query, page, per_page, within, excluding)
+
+        from . import db
+        params = dict(query=match, limit=per_page, offset=(page - 1) * per_page,
+                      boost=float(self.app.config['COOKZILLA_SEARCH_RECENCY_BOOST']))
+        total = db.session.execute(sa.text(count_sql), params).scalar()
+        if within is None and excluding is None:
+            ids = [row[0] for row in db.session.execute(sa.text(search_sql), params)]
+        else:
+            # rank every match, then filter
+            import numpy as np
+            ranked = np.array([row[0] for row in db.session.execute(
+                sa.text(search_sql), dict(params, limit=max(total, 1), offset=0))], dtype=np.int64)
+            if within is not None:
+                ranked = ranked[np.isin(ranked, np.asarray(within, dtype=np.int64))]
+            if excluding is not None:
+                ranked = ranked[~np.isin(ranked, np.asarray(excluding, dtype=np.int64))]
+            total = len(ranked)
+            ids = ranked[(page - 1) * per_page:page * per_page].tolist()
+        items = []
+        if ids:
+            recipes = dict((r.id, r) for r in Recipe.query.filter(Recipe.id.in_(ids)))
+            items = [recipes[i] for i in ids if i in recipes]
+        return Pagination(None, page, per_page, total, items)
+
+    def _like(self, query, page, per_page, within=None, excluding=None):
+        from .models import Recipe
+
+        recipes = Recipe.query.filter(sa.or_(Recipe.title.contains(query), Recipe.body.contains(query)))
+        if within is not None:
+            recipes = recipes.filter(Recipe.id.in_([int(i) for i in within]))
+        if excluding is not None and len(excluding):
+            recipes = recipes.filter(~Recipe.id.in_([int(i) for i in excluding]))
+        return recipes.order_by(Recipe.timestamp.desc()).paginate(page, per_page, error_out=False)
+
+    def reindex(self, recipe_ids):
+        """Refresh the index entries of the given recipes in one transaction."""
+        recipe_ids = sorted(set(int(i) for i in recipe_ids))
+        if not recipe_ids or self.dialect not in ('sqlite', 'postgresql'):
+            return
+        ids = ','.join(str(i) for i in recipe_ids)
+        with self.engine.begin() as conn:
+            if self.dialect == 'sqlite':
+                conn.execute('DELETE FROM recipe_search WHERE rowid IN ({})'.format(ids))
+                conn.execute(SQLITE_INDEX.format(where='WHERE r.id IN ({})'.format(ids)))
+            else:
+                conn.execute('DELETE FROM recipe_search WHERE recipe_id IN ({})'.format(ids))
+                conn.execute(POSTGRES_INDEX.format(where='WHERE r.id IN ({})'.format(ids)))
+
+    def rebuild(self):
+        """Recreate the whole index from the recipes table, return its size."""
+        with self.engine.begin() as conn:
+            if self.dialect == 'sqlite':
+                conn.execute(SQLITE_DROP)
+                conn.execute(SQLITE_CREATE)
+                conn.execute(SQLITE_INDEX.format(where=''))
+            elif self.dialect == 'postgresql':
+                for statement in POSTGRES_CREATE.split(';'):
+                    conn.execute(statement)
+                conn.execute('TRUNCATE recipe_search')
+                conn.execute(POSTGRES_INDEX.format(where=''))
+            else:
+                return 0
+            return conn.execute('SELECT count(*) FROM recipe_search').scalar()
+
+    def _on_model_committed(self, app, changes):
+        from .models import Ingredient, Recipe
+
+        stale, deleted = set(), set()
+        for change in changes:
+            if isinstance(change.instance, Recipe):
+                if change.operation == 'delete':
+                    deleted.add(change.values['id'])
+                elif change.changed & set(['title', 'body', 'tags']):
+                    stale.add(change.values['id'])
+            elif isinstance(change.instance, Ingredient):
+                stale.add(change.values['recipe_id'])
+        stale -= deleted
+        stale.discard(None)
+        self.reindex(stale)
+        if deleted and self.dialect == 'sqlite':
+            with self.engine.begin() as conn:
+                conn.execute('DELETE FROM recipe_search WHERE rowid IN ({})'.format(
+                    ','.join(str(int(i)) for i in deleted)))
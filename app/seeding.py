@@ -0,0 +1,305 @@
+"""
+Deterministic bulk seeding of the database for development and load tests.
+
+Rows are generated table by table in NumPy batches from a fixed seed and
+written with Core executemany inserts inside a single transaction. Primary
+keys are assigned up front, so foreign keys are drawn as random id arrays
+instead of looking rows up one by one.
+"""
+import os
+import sqlite3
+import subprocess
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from . import db, search_index, password_hasher
+from .counters import reconcile_counters
+
+PRESETS = {
+    'small': dict(users=100, follows=500, recipes=500, ingredients=1000, recipe_tags=1000,
+                  reviews=1000, groups=10, group_members=100, events=100, rsvps=300,
+                  reports=1000, log_events=1000),
+    'users-100k': dict(users=100000, follows=1000000, recipes=200000, ingredients=1000000,
+                       recipe_tags=400000, reviews=500000, groups=5000, group_members=300000,
+                       events=50000, rsvps=300000, reports=100000, log_events=1000000),
+    'logs-10m': dict(users=100000, follows=1000000, recipes=200000, ingredients=1000000,
+                     recipe_tags=400000, reviews=500000, groups=5000, group_members=300000,
+                     events=50000, rsvps=300000, reports=100000, log_events=10000000),
+}
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+         'incididunt ut labore et dolore magna aliqua tomato basil garlic onion pepper '
+         'chicken beef pork tofu noodle rice bean soup stew curry salad bread cake pie '
+         'roast grill bake fry steam spicy sweet sour smoky fresh creamy crispy lemon '
+         'ginger chili mushroom potato carrot cheese butter cream egg flour sugar honey').split()
+
+CITIES = ('New York', 'Boston', 'Chicago', 'Seattle', 'Austin', 'Denver', 'Portland',
+          'Atlanta', 'Miami', 'San Diego')
+
+LOG_OPS = ('browse', 'soup', 'spicy', 'Italian', 'Chinese', 'Vegan')
+
+
+class Seeder(object):
+    """
+    Fill the database with ``counts`` rows per table, see PRESETS.
+
+    The same seed always produces the same rows. Existing rows are kept and
+    new ids start after the current maximum of each table; the association
+    tables are expected to hold nothing but self follows.
+    """
+
+    def __init__(self, seed=0, batch=20000):
+        import numpy as np
+
+        self.np = np
+        self.rng = np.random.RandomState(seed)
+        self.batch = batch
+        self.now = datetime.utcnow().replace(microsecond=0)
+        # titles and names fit in the 64 character columns
+        self.titles = [' '.join(self.rng.choice(WORDS, n)) for n in self.rng.randint(2, 6, 2000)]
+        self.sentences = [' '.join(self.rng.choice(WORDS, n))
+                          for n in self.rng.randint(4, 12, 2000)]
+        self.paragraphs = [' '.join(self.rng.choice(self.sentences, n))
+                           for n in self.rng.randint(1, 10, 500)]
+
+    def run(self, counts, report=print):
+        """Insert the rows and return {table name: rows inserted}."""
+        from .models import Role, Tag
+
+        if not isinstance(counts, dict):
+            counts = PRESETS[counts]
+        self.counts = counts
+        self.role_id = Role.query.filter_by(default=True).first().id
+        self.tag_ids = self.np.array([t.id for t in Tag.query.all()])
+        self.units = sorted(current_app.config['INGREDIENT_CONVERSION'])
+        self.password_hash = password_hasher.hash('cat')
+        db.session.commit()
+        steps = ('users', 'follows', 'recipes', 'ingredients', 'recipe_tags', 'reviews',
+                 'groups', 'group_members', 'events', 'rsvps', 'reports', 'log_events')
+        inserted = {}
+        with db.engine.begin() as conn:
+            self.conn = conn
+            for name in steps:
+                start = time.time()
+                inserted[name] = getattr(self, '_' + name)(counts.get(name, 0))
+                report('{:<14} {:>10} rows {:>8.1f}s'.format(name, inserted[name], time.time() - start))
+        # Core inserts bypass the session events, refresh derived data in bulk
+        reconcile_counters(db.engine)
+        search_index.rebuild()
+        return inserted
+
+    # helpers
+    def _table(self, name):
+        return db.metadata.tables[name]
+
+    def _next_id(self, name):
+        return (self.conn.execute(db.select([db.func.max(self._table(name).c.id)])).scalar() or 0) + 1
+
+    def _ids(self, name):
+        return self.np.array([row[0] for row in self.conn.execute(db.select([self._table(name).c.id]))])
+
+    def _pick(self, pool, n):
+        return self.np.asarray(pool, dtype=object)[self.rng.randint(0, len(pool), n)]
+
+    def _timestamps(self, n, days=365):
+        np = self.np
+        offsets = self.rng.randint(0, days * 86400, n).astype('timedelta64[s]')
+        return (np.datetime64(self.now) - offsets).astype('datetime64[us]')
+
+    def _pairs(self, left, right, n, extra=None):
+        """Up to n distinct (left, right) pairs drawn from two id arrays."""
+        np = self.np
+        if n == 0 or len(left) == 0 or len(right) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        a = left[self.rng.randint(0, len(left), n)].astype(np.int64)
+        b = right[self.rng.randint(0, len(right), n)].astype(np.int64)
+        if extra is not None:
+            a = np.concatenate([a, np.asarray(extra[0], dtype=np.int64)])
+            b = np.concatenate([b, np.asarray(extra[1], dtype=np.int64)])
+        width = int(b.max()) + 1
+        keys = np.unique(a * width + b)
+        return keys // width, keys % width
+
+    def _insert(self, table_name, **columns):
+        names = list(columns)
+        n = len(columns[names[0]])
+        table = self._table(table_name)
+        for start in range(0, n, self.batch):
+            chunk = [columns[c][start:start + self.batch] for c in names]
+            chunk = [c.tolist() if hasattr(c, 'tolist') else list(c) for c in chunk]
+            self.conn.execute(table.insert(), [dict(zip(names, row)) for row in zip(*chunk)])
+        return n
+
+    # tables
+    def _users(self, n):
+        import hashlib
+
+        first = self._next_id('users')
+        ids = self.np.arange(first, first + n)
+        emails = ['user{}@example.com'.format(i) for i in ids]
+        self.new_user_ids = ids
+        self.user_ids = self.np.concatenate([self._ids('users'), ids]) if first > 1 else ids
+        return self._insert('users', id=ids, email=emails,
+                            username=['user{}'.format(i) for i in ids],
+                            name=self._pick(self.titles, n),
+                            role_id=[self.role_id] * n,
+                            password_hash=[self.password_hash] * n,
+                            confirmed=[True] * n,
+                            about_me=self._pick(self.sentences, n),
+                            joined_since=self._timestamps(n),
+                            last_seen=self._timestamps(n, days=30),
+                            avatar_hash=[hashlib.md5(e.encode('utf-8')).hexdigest() for e in emails])
+
+    def _follows(self, n):
+        np = self.np
+        follower, followed = self._pairs(self.user_ids, self.user_ids, n)
+        keep = follower != followed
+        # new users follow themselves, see User.add_self_follows
+        follower = np.concatenate([follower[keep], self.new_user_ids])
+        followed = np.concatenate([followed[keep], self.new_user_ids])
+        return self._insert('follows', follower_id=follower, followed_id=followed,
+                            timestamp=self._timestamps(len(follower)))
+
+    def _recipes(self, n):
+        first = self._next_id('recipes')
+        ids = self.np.arange(first, first + n)
+        self.recipe_ids = self.np.concatenate([self._ids('recipes'), ids]) if first > 1 else ids
+        authors = self._pick(self.user_ids, n)
+        return self._insert('recipes', id=ids, author_id=authors,
+                            photos=['http://www.gravatar.com/avatar/{}?s=200&d=identicon&r=g'.format(a)
+                                    for a in authors],
+                            title=self._pick(self.titles, n),
+                            serving=self.rng.randint(1, 6, n),
+                            body=self._pick(self.paragraphs, n),
+                            timestamp=self._timestamps(n))
+
+    def _ingredients(self, n):
+        recipe, word = self._pairs(self.recipe_ids, self.np.arange(len(WORDS)), n)
+        return self._insert('ingredients', recipe_id=recipe,
+                            name=self.np.asarray(WORDS, dtype=object)[word],
+                            unit=self._pick(self.units, len(recipe)),
+                            quantity=(self.rng.randint(0, 1000, len(recipe)) + 1).astype(float))
+
+    def _recipe_tags(self, n):
+        recipe, tag = self._pairs(self.recipe_ids, self.tag_ids, n)
+        return self._insert('recipe_tags', recipe_id=recipe, tag_id=tag)
+
+    def _reviews(self, n):
+        first = self._next_id('reviews')
+        return self._insert('reviews', id=self.np.arange(first, first + n),
+                            title=self._pick(self.titles, n),
+                            body=self._pick(self.paragraphs, n),
+                            rating=self.rng.randint(1, 6, n),
+                            suggestion=self._pick(self.sentences, n),
+                            timestamp=self._timestamps(n),
+                            author_id=self._pick(self.user_ids, n),
+                            recipe_id=self._pick(self.recipe_ids, n))
+
+    def _groups(self, n):
+        first = self._next_id('groups')
+        ids = self.np.arange(first, first + n)
+        self.group_ids = self.np.concatenate([self._ids('groups'), ids]) if first > 1 else ids
+        self.group_creators = self.user_ids[self.rng.randint(0, len(self.user_ids), n)]
+        return self._insert('groups', id=ids, creator_id=self.group_creators,
+                            title=self._pick(self.titles, n),
+                            about_group=self._pick(self.paragraphs, n),
+                            grouped_since=self._timestamps(n))
+
+    def _group_members(self, n):
+        # creators are members of their groups
+        created = self.group_ids[len(self.group_ids) - len(self.group_creators):]
+        member, group = self._pairs(self.user_ids, self.group_ids, n,
+                                    extra=(self.group_creators, created))
+        self.memberships = (member, group)
+        return self._insert('group_members', member_id=member, group_id=group,
+                            member_since=self._timestamps(len(member)))
+
+    def _events(self, n):
+        if not len(self.memberships[0]):
+            n = 0
+        first = self._next_id('events')
+        ids = self.np.arange(first, first + n)
+        # creators are members of the group the event belongs to
+        rows = self.rng.randint(0, max(len(self.memberships[0]), 1), n)
+        self.event_ids = ids
+        self.event_groups = self.memberships[1][rows]
+        # half of the events are upcoming
+        timestamps = self._timestamps(n, days=180) + \
+            self.np.where(self.rng.rand(n) < 0.5, 180 * 86400, 0).astype('timedelta64[s]')
+        return self._insert('events', id=ids, group_id=self.event_groups,
+                            creator_id=self.memberships[0][rows],
+                            title=self._pick(self.titles, n),
+                            timestamp=timestamps,
+                            location=self._pick(CITIES, n),
+                            about_event=self._pick(self.paragraphs, n))
+
+    def _rsvps(self, n):
+        member, event = self._pairs(self.user_ids, self.event_ids, n)
+        return self._insert('rsvps', member_id=member, event_id=event,
+                            timestamp=self._timestamps(len(member)),
+                            # NOT_GOING, GOING or MAYBE of RSVPStatus
+                            status=self.rng.randint(0, 3, len(member)))
+
+    def _reports(self, n):
+        first = self._next_id('reports')
+        return self._insert('reports', id=self.np.arange(first, first + n),
+                            event_id=self._pick(self.event_ids, n),
+                            author_id=self._pick(self.user_ids, n),
+                            title=self._pick(self.titles, n),
+                            timestamp=self._timestamps(n),
+                            body=self._pick(self.paragraphs, n))
+
+    def _log_events(self, n):
+        np = self.np
+        user, recipe = self._pairs(self.user_ids, self.recipe_ids, n)
+        ops = self.rng.randint(0, len(LOG_OPS), len(user))
+        return self._insert('log_events', user_id=user,
+                            op=np.asarray(LOG_OPS, dtype=object)[ops],
+                            recipe_id=recipe,
+                            ct=self.rng.geometric(0.3, len(user)),
+                            logged_at=self._timestamps(len(user), days=90))
+
+
+def _postgres_url(engine):
+    return 'postgresql://' + str(engine.url).split('://', 1)[1]
+
+
+def save_snapshot(path):
+    """Copy the whole database into the snapshot file at ``path``."""
+    engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        raw = engine.raw_connection()
+        try:
+            dest = sqlite3.connect(path)
+            raw.connection.backup(dest)
+            dest.close()
+        finally:
+            raw.close()
+    elif engine.dialect.name == 'postgresql':
+        subprocess.check_call(['pg_dump', '--format=custom', '--file', path, _postgres_url(engine)])
+    else:
+        raise ValueError('snapshots are not supported on {}'.format(engine.dialect.name))
+
+
+def load_snapshot(path):
+    """Replace the database content with the snapshot file at ``path``."""
+    if not os.path.exists(path):
+        raise ValueError('no snapshot at {}'.format(path))
+    db.session.remove()
+    engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        raw = engine.raw_connection()
+        try:
+            src = sqlite3.connect(path)
+            src.backup(raw.connection)
+            src.close()
+        finally:
+            raw.close()
+    elif engine.dialect.name == 'postgresql':
+        subprocess.check_call(['pg_restore', '--clean', '--if-exists', '--no-owner',
+                               '--dbname', _postgres_url(engine), path])
+    else:
+        raise ValueError('snapshots are not supported on {}'.format(engine.dialect.name))
+    engine.dispose()
@@ -0,0 +1,61 @@
+from collections import namedtuple
+
+import sqlalchemy as sa
+from blinker import Namespace
+from flask_sqlalchemy import SignallingSession
+
+_signals = Namespace()
+
+#: Sent by the session's app after every successful commit with ``changes``,
+#: a list of :class:`ModelChange` for the rows written in that transaction.
+model_committed = _signals.signal('model-committed')
+
+#: ``values`` holds the column values as flushed (readable after the commit
+#: expired the instance), ``changed`` the attribute names that were modified.
+ModelChange = namedtuple('ModelChange', 'instance operation values changed')
+
+
+def _snapshot(obj, operation):
+    state = sa.inspect(obj)
+    mapper = state.mapper
+    values = dict((attr.key, state.dict.get(attr.key)) for attr in mapper.column_attrs)
+    if operation == 'update':
+        changed = frozenset(attr.key for attr in state.attrs if attr.history.has_changes())
+        if not changed:
+            return None
+    else:
+        changed = frozenset(values)
+    return ModelChange(obj, operation, values, changed)
+
+
+@sa.event.listens_for(SignallingSession, 'after_flush')
+def _record_changes(session, flush_context):
+    changes = session.info.setdefault('model_changes', [])
+    for targets, operation in ((session.new, 'insert'), (session.dirty, 'update'),
+                               (session.deleted, 'delete')):
+        for obj in targets:
+            change = _snapshot(obj, operation)
+            if change is not None:
+                changes.append(change)
+
+
+@sa.event.listens_for(SignallingSession, 'after_commit')
+def _send_changes(session):
+    changes = session.info.pop('model_changes', None)
+    if changes:
+        model_committed.send(session.app, changes=changes)
+
+
+@sa.event.listens_for(SignallingSession, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('model_changes', None)
+
+
+def record_change(session, instance, operation, values, changed=None):
+    """
+    Queue a ModelChange for a row written past the unit of work, by a Core
+    statement on the session's connection, to be sent with the others once
+    the session commits. ``instance`` only needs to be of the right class.
+    """
+    changed = frozenset(values if changed is None else changed)
+    session.info.setdefault('model_changes', []).append(ModelChange(instance, operation, values, changed))
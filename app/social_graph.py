@@ -0,0 +1,417 @@
+import logging
+import threading
+import time
+
+import sqlalchemy as sa
+
+from .signals import model_committed
+
+logger = logging.getLogger(__name__)
+
+# rows fetched from the database per round trip while loading the graph
+FETCH_SIZE = 100000
+
+#: the adjacency lists of a snapshot: following and followers are indexed by
+#: user id, groups by member id and members by group id
+FOLLOWING, FOLLOWERS, GROUPS, MEMBERS = 'following', 'followers', 'groups', 'members'
+KINDS = (FOLLOWING, FOLLOWERS, GROUPS, MEMBERS)
+
+
+def _scan(conn, query):
+    """The two integer columns of ``query`` as int64 arrays, read a chunk at a time."""
+    import numpy as np
+    from itertools import chain
+
+    result, chunks = conn.execute(query), []
+    while True:
+        rows = result.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        chunks.append(np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * 2))
+    flat = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64)
+    return flat[0::2], flat[1::2]
+
+
+def _csr(src, dst, size):
+    """
+    The edges ``src[i] -> dst[i]`` as compressed sparse rows: ``offsets``
+    of ``size + 1`` entries and the sorted, distinct ``targets`` of node
+    ``n`` at ``targets[offsets[n]:offsets[n + 1]]``.
+    """
+    import numpy as np
+
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    width = int(dst.max()) + 1 if len(dst) else 1
+    # one sort of the combined keys orders the rows and the targets within
+    # them; done in place, the arrays of 50M edges take 400 MB each
+    keys = src * width
+    keys += dst
+    keys.sort()
+    if len(keys):
+        distinct = np.empty(len(keys), dtype=bool)
+        distinct[0] = True
+        np.not_equal(keys[1:], keys[:-1], out=distinct[1:])
+        if not distinct.all():
+            keys = keys[distinct]
+        del distinct
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // width, minlength=size), out=offsets[1:])
+    np.remainder(keys, width, out=keys)
+    targets = keys.astype(np.uint32) if width <= 2 ** 32 else keys
+    return offsets, targets
+
+
+def build_graph(follower, followed, member, group):
+    """
+    The snapshot of the follows ``follower[i] -> followed[i]`` and the
+    memberships of ``member[i]`` in ``group[i]``. Self follows are left out.
+    """
+    import numpy as np
+
+    follower = np.asarray(follower, dtype=np.int64)
+    followed = np.asarray(followed, dtype=np.int64)
+    member = np.asarray(member, dtype=np.int64)
+    group = np.asarray(group, dtype=np.int64)
+    keep = follower != followed
+    if not keep.all():
+        follower, followed = follower[keep], followed[keep]
+    del keep
+    users = int(max([0] + [a.max() + 1 for a in (follower, followed, member) if len(a)]))
+    groups = int(group.max()) + 1 if len(group) else 0
+    return {FOLLOWING: _csr(follower, followed, users), FOLLOWERS: _csr(followed, follower, users),
+            GROUPS: _csr(member, group, users), MEMBERS: _csr(group, member, groups),
+            'pending': dict((kind, {}) for kind in KINDS)}
+
+
+def _row(snapshot, kind, node):
+    """The sorted neighbours of ``node``."""
+    changed = snapshot['pending'][kind].get(node)
+    if changed is not None:
+        return changed
+    offsets, targets = snapshot[kind]
+    if node < 0 or node >= len(offsets) - 1:
+        return targets[:0]
+    return targets[offsets[node]:offsets[node + 1]]
+
+
+def _gather(snapshot, kind, nodes, fanout=None):
+    """
+    The neighbours of all of ``nodes`` as one int64 array, repeats kept,
+    at most the first ``fanout`` of each node.
+    """
+    import numpy as np
+
+    offsets, targets = snapshot[kind]
+    pending = snapshot['pending'][kind]
+    nodes = np.asarray(nodes, dtype=np.int64)
+    changed = [pending[n] for n in nodes.tolist() if n in pending] if pending else []
+    if changed:
+        nodes = nodes[~np.isin(nodes, np.array(list(pending), dtype=np.int64))]
+    nodes = nodes[(nodes >= 0) & (nodes < len(offsets) - 1)]
+    starts = offsets[nodes]
+    lengths = offsets[nodes + 1] - starts
+    if fanout is not None:
+        lengths = np.minimum(lengths, fanout)
+    # position of every neighbour: its row's start plus its rank in the row
+    ends = np.cumsum(lengths)
+    positions = np.arange(ends[-1] if len(ends) else 0, dtype=np.int64)
+    positions += np.repeat(starts - (ends - lengths), lengths)
+    parts = [targets[positions].astype(np.int64)]
+    parts.extend(row[:fanout].astype(np.int64) for row in changed)
+    return np.concatenate(parts)
+
+
+def _top(ids, scores, limit):
+    """The ``limit`` best (id, score) pairs, highest score first, then lowest id."""
+    import numpy as np
+
+    if len(ids) > limit > 0:
+        # everything tied with the last place stays in, so the order is exact
+        cut = -np.partition(-scores, limit - 1)[limit - 1]
+        keep = scores >= cut
+        ids, scores = ids[keep], scores[keep]
+    order = np.lexsort((ids, -scores))[:limit]
+    return list(zip(ids[order].tolist(), scores[order].tolist()))
+
+
+def _apply(snapshot, kind, node, target, add):
+    """A snapshot with ``node -> target`` added or removed, kept aside in pending."""
+    import numpy as np
+
+    row = _row(snapshot, kind, node)
+    position = int(np.searchsorted(row, target))
+    present = position < len(row) and row[position] == target
+    if add == present:
+        return snapshot
+    if add:
+        row = np.insert(row, position, target)
+    else:
+        row = np.delete(row, position)
+    pending = dict(snapshot['pending'])
+    pending[kind] = dict(pending[kind])
+    pending[kind][node] = row
+    return dict(snapshot, pending=pending)
+
+
+def _merge(csr, pending):
+    """The compressed sparse rows ``csr`` with the rows of ``pending`` replacing theirs."""
+    import numpy as np
+
+    offsets, targets = csr
+    rows = len(offsets) - 1
+    size = max(rows, max(pending) + 1)
+    lengths = np.zeros(size, dtype=np.int64)
+    lengths[:rows] = np.diff(offsets)
+    changed = sorted(pending)
+    lengths[changed] = [len(pending[node]) for node in changed]
+    merged_offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(lengths, out=merged_offsets[1:])
+    merged = np.empty(merged_offsets[-1], dtype=targets.dtype)
+    # the unchanged rows between two changed ones move as one block
+    previous = 0
+    for node in changed + [size]:
+        stop = min(node, rows)
+        if stop > previous:
+            merged[merged_offsets[previous]:merged_offsets[stop]] = targets[offsets[previous]:offsets[stop]]
+        if node < size:
+            merged[merged_offsets[node]:merged_offsets[node + 1]] = pending[node]
+        previous = node + 1
+    return merged_offsets, merged
+
+
+class SocialGraph(object):
+    """
+    Per-worker follow and group membership graphs as integer arrays, for
+    mutual follows, "people you may know" and group suggestions.
+
+    Each graph is kept in both directions as compressed sparse rows: an
+    offsets array indexed by user or group id and one array of the sorted
+    neighbour ids of every node, four bytes each. A million users following
+    fifty on average take about 400 MB for the two follow directions, and a
+    suggestion is a gather of the followed users' rows, a sort and a count,
+    with no query.
+
+    The graphs are loaded with one scan of follows and group_members on
+    first use, or as the worker starts with COOKZILLA_SOCIAL_GRAPH_PRELOAD,
+    and reloaded in the background after COOKZILLA_SOCIAL_GRAPH_TTL seconds,
+    which bounds how long follows made through another worker stay
+    invisible; the old graphs answer meanwhile. Follows and memberships
+    committed in this worker apply at once: the changed rows are kept aside
+    and merged into the arrays once COOKZILLA_SOCIAL_GRAPH_PENDING of them
+    pile up.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._loading = threading.Lock()
+        self._reloading = False
+        self._replay = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+
+        self.app = app
+        app.extensions['social_graph'] = self
+        self.invalidate()
+        model_committed.connect(self._on_model_committed, sender=app)
+        for event in ('after_create', 'after_drop'):
+            if not sa.event.contains(db.metadata, event, self._on_ddl):
+                sa.event.listen(db.metadata, event, self._on_ddl)
+        if app.config['COOKZILLA_SOCIAL_GRAPH_PRELOAD']:
+            app.before_first_request(self._preload)
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    @property
+    def size(self):
+        """(follows, memberships, bytes of arrays) of the loaded graphs."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return 0, 0, 0
+        return len(snapshot[FOLLOWING][1]), len(snapshot[GROUPS][1]), sum(
+            array.nbytes for kind in KINDS for array in snapshot[kind])
+
+    @property
+    def pending(self):
+        """Rows changed since the arrays were built."""
+        snapshot = self._snapshot
+        return 0 if snapshot is None else sum(len(rows) for rows in snapshot['pending'].values())
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def following(self, user_id):
+        """The sorted ids of the users ``user_id`` follows, not themselves."""
+        return _row(self._get(), FOLLOWING, user_id)
+
+    def followers(self, user_id):
+        """The sorted ids of the users following ``user_id``, not themselves."""
+        return _row(self._get(), FOLLOWERS, user_id)
+
+    def groups_of(self, user_id):
+        """The sorted ids of the groups of ``user_id``."""
+        return _row(self._get(), GROUPS, user_id)
+
+    def members_of(self, group_id):
+        """The sorted ids of the members of ``group_id``."""
+        return _row(self._get(), MEMBERS, group_id)
+
+    def is_following(self, user_id, other_id):
+        import numpy as np
+
+        row = self.following(user_id)
+        position = np.searchsorted(row, other_id)
+        return bool(position < len(row) and row[position] == other_id)
+
+    def mutual(self, user_id):
+        """The sorted ids of the users following ``user_id`` back."""
+        import numpy as np
+
+        snapshot = self._get()
+        return np.intersect1d(_row(snapshot, FOLLOWING, user_id), _row(snapshot, FOLLOWERS, user_id),
+                              assume_unique=True)
+
+    def known_followers(self, viewer_id, user_id):
+        """The sorted ids of the users ``viewer_id`` follows who follow ``user_id``."""
+        import numpy as np
+
+        snapshot = self._get()
+        known = np.intersect1d(_row(snapshot, FOLLOWING, viewer_id), _row(snapshot, FOLLOWERS, user_id),
+                               assume_unique=True)
+        return known[known != user_id]
+
+    def suggest_people(self, user_id, limit=10):
+        """
+        "People you may know": the users followed by the most of the users
+        ``user_id`` follows, who ``user_id`` does not follow yet.
+
+        Returns [(user id, followed users following them)]. Only the first
+        COOKZILLA_SOCIAL_GRAPH_FANOUT follows of each followed user count,
+        so following a celebrity costs no more than following anyone.
+        """
+        import numpy as np
+
+        snapshot = self._get()
+        followed = _row(snapshot, FOLLOWING, user_id)
+        candidates = _gather(snapshot, FOLLOWING, followed, self.app.config['COOKZILLA_SOCIAL_GRAPH_FANOUT'])
+        ids, counts = np.unique(candidates, return_counts=True)
+        keep = (ids != user_id) & ~np.isin(ids, followed, assume_unique=True)
+        return _top(ids[keep], counts[keep], limit)
+
+    def suggest_groups(self, user_id, limit=10):
+        """
+        The groups with the most members among the users ``user_id``
+        follows, that ``user_id`` is not in: [(group id, followed members)].
+        """
+        import numpy as np
+
+        snapshot = self._get()
+        candidates = _gather(snapshot, GROUPS, _row(snapshot, FOLLOWING, user_id))
+        ids, counts = np.unique(candidates, return_counts=True)
+        keep = ~np.isin(ids, _row(snapshot, GROUPS, user_id), assume_unique=True)
+        return _top(ids[keep], counts[keep], limit)
+
+    def load(self):
+        """Scan the graphs from the database now, replacing the loaded ones."""
+        return self._load(self._snapshot)
+
+    def _get(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._load(None)
+        elif snapshot['expires'] < time.time():
+            self._reload_in_background(snapshot)
+        return snapshot
+
+    def _preload(self):
+        if self._snapshot is None:
+            self._reload_in_background(None)
+
+    def _reload_in_background(self, stale):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+
+        def reload():
+            try:
+                self._load(stale)
+            except Exception:
+                logger.exception('reloading the social graph failed')
+            finally:
+                self._reloading = False
+
+        thread = threading.Thread(target=reload, name='social-graph-load')
+        thread.daemon = True
+        thread.start()
+
+    def _load(self, stale):
+        """
+        Load the graphs unless another thread replaced ``stale`` while this
+        one waited. Changes committed during the scan are replayed onto it.
+        """
+        from . import db
+        from .models import Follow, GroupMember
+
+        with self._loading:
+            if self._snapshot is not stale and self._snapshot is not None:
+                return self._snapshot
+            with self._lock:
+                self._replay = []
+            try:
+                with db.get_engine(self.app).connect() as conn:
+                    follower, followed = _scan(conn, sa.select([Follow.follower_id, Follow.followed_id]))
+                    member, group = _scan(conn, sa.select([GroupMember.member_id, GroupMember.group_id]))
+                snapshot = build_graph(follower, followed, member, group)
+                snapshot['expires'] = time.time() + self.app.config['COOKZILLA_SOCIAL_GRAPH_TTL']
+                with self._lock:
+                    for edge in self._replay:
+                        snapshot = _apply(snapshot, *edge)
+                    self._snapshot = snapshot
+            finally:
+                with self._lock:
+                    self._replay = None
+        return snapshot
+
+    def _on_model_committed(self, app, changes):
+        from .models import Follow, GroupMember
+
+        edges = []
+        for change in changes:
+            if change.operation not in ('insert', 'delete'):
+                continue
+            add = change.operation == 'insert'
+            if isinstance(change.instance, Follow):
+                follower, followed = change.values['follower_id'], change.values['followed_id']
+                if follower is not None and followed is not None and follower != followed:
+                    edges.extend([(FOLLOWING, follower, followed, add), (FOLLOWERS, followed, follower, add)])
+            elif isinstance(change.instance, GroupMember):
+                member, group = change.values['member_id'], change.values['group_id']
+                if member is not None and group is not None:
+                    edges.extend([(GROUPS, member, group, add), (MEMBERS, group, member, add)])
+        if not edges:
+            return
+        with self._lock:
+            if self._replay is not None:
+                self._replay.extend(edges)
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            for edge in edges:
+                snapshot = _apply(snapshot, *edge)
+            if sum(len(rows) for rows in snapshot['pending'].values()) > \
+                    self.app.config['COOKZILLA_SOCIAL_GRAPH_PENDING']:
+                snapshot = dict(snapshot, pending=dict((kind, {}) for kind in KINDS), **dict(
+                    (kind, _merge(snapshot[kind], rows)) for kind, rows in snapshot['pending'].items() if rows))
+            self._snapshot = snapshot
+
+    def _on_ddl(self, target, connection, **kw):
+        self.invalidate()
@@ -1,20 +1,87 @@
-from flask import render_template, request, current_app
+from flask import render_template, current_app, request, url_for, jsonify, abort
 from flask_login import current_user
+from flask_sqlalchemy import Pagination
 
 from . import tags
+from .. import response_cache, reference_data, facets
+from ..facets import SERVING_BUCKETS, RATING_BUCKETS
 from ..models import Tag, Recipe, LogEvent
+from ..pagination import paginate
+from ..response_cache import recipe_list_validator
+
+
+def _tag_validator(id):
+    tag = Tag.query.get(id)
+    if tag is None:
+        return None
+    return recipe_list_validator(tag.recipes, current_app.config['COOKZILLA_COMMENTS_PER_PAGE'])
 
 
 @tags.route('/<int:id>', methods=['GET', 'POST'])
+@response_cache.cached('tag', _tag_validator, key='id')
 def tag(id):
     tag = Tag.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = tag.recipes.order_by(Recipe.timestamp.desc()).paginate(
-        page, per_page=current_app.config['COOKZILLA_COMMENTS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(tag.recipes, Recipe.timestamp, Recipe.id,
+                          current_app.config['COOKZILLA_COMMENTS_PER_PAGE'], total='cached')
     recipes = pagination.items
-    tags = Tag.query.all()
+    tags = reference_data.tags
     # log
     for r in recipes:
         LogEvent.log(current_user, tag.tag, r)
     return render_template('tags/tag.html', recipes=recipes, pagination=pagination, tags=tags)
+
+
+@tags.route('/browse')
+def browse():
+    """
+    Recipes by any combination of tags: ``tag`` all of, ``any`` one of,
+    ``not`` none of, narrowed to a ``serving`` and ``rating`` bucket, with
+    the number of recipes each further choice would leave.
+    """
+    selected = dict(tag=request.args.getlist('tag', type=int),
+                    any=request.args.getlist('any', type=int),
+                    not_=request.args.getlist('not', type=int),
+                    serving=request.args.get('serving'), rating=request.args.get('rating'))
+    if selected['serving'] not in [None] + [key for key, low, high in SERVING_BUCKETS] or \
+            selected['rating'] not in [None] + [key for key, low in RATING_BUCKETS]:
+        abort(400)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['COOKZILLA_COMMENTS_PER_PAGE']
+    result = facets.browse(selected['tag'], selected['any'], selected['not_'],
+                           selected['serving'], selected['rating'])
+    shown = result.ids[(page - 1) * per_page:page * per_page].tolist()
+    found = dict((r.id, r) for r in Recipe.query.filter(Recipe.id.in_(shown))) if shown else {}
+    recipes = [found[id] for id in shown if id in found]
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        return jsonify({'total': len(result.ids), 'page': page,
+                        'recipes': [{'id': r.id, 'title': r.title} for r in recipes],
+                        'facets': dict(('{}:{}'.format(*label), count)
+                                       for label, count in result.counts.items())})
+
+    def link(page=None, **changes):
+        args = dict(selected, **changes)
+        return url_for('.browse', tag=args['tag'], any=args['any'], page=page, **{
+            'not': args['not_'], 'serving': args['serving'], 'rating': args['rating']})
+
+    tag_facets = []
+    for tag in reference_data.tags:
+        chosen = tag.id in selected['tag'] or tag.id in selected['not_'] or tag.id in selected['any']
+        tag_facets.append(dict(
+            tag=tag, count=result.counts.get(('tag', tag.id), 0), chosen=chosen,
+            excluded=tag.id in selected['not_'],
+            add=link(tag=selected['tag'] + [tag.id]), either=link(any=selected['any'] + [tag.id]),
+            exclude=link(not_=selected['not_'] + [tag.id]),
+            remove=link(tag=[t for t in selected['tag'] if t != tag.id],
+                        any=[t for t in selected['any'] if t != tag.id],
+                        not_=[t for t in selected['not_'] if t != tag.id])))
+    buckets = [(name, [dict(key=key, count=result.counts[(name, key)], chosen=selected[name] == key,
+                            add=link(**{name: key}), remove=link(**{name: None}))
+                       for key in keys])
+               for name, keys in (('serving', [b[0] for b in SERVING_BUCKETS]),
+                                  ('rating', [b[0] for b in RATING_BUCKETS]))]
+    pagination = Pagination(None, page, per_page, len(result.ids), recipes)
+    # the pagination macro would keep only the first of repeated arguments
+    pagination.prev_url = link(page=page - 1) if pagination.has_prev else None
+    pagination.next_url = link(page=page + 1) if pagination.has_next else None
+    return render_template('tags/browse.html', recipes=recipes, pagination=pagination,
+                           tag_facets=tag_facets, buckets=buckets, clear=url_for('.browse'))
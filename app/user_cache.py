@@ -0,0 +1,109 @@
+import threading
+import time
+
+import sqlalchemy as sa
+
+from .signals import model_committed
+
+
+class UserCache(object):
+    """
+    Per-worker snapshot of the column values of recently active users, so
+    loading the logged in user costs no query.
+
+    A miss loads the user with its role joined in one query. The snapshot is
+    reused for COOKZILLA_USER_CACHE_TTL seconds, which bounds how long a
+    profile, role or confirmation change made through another worker stays
+    invisible, and dropped as soon as a commit in this worker touches the
+    user or one of its counters. At most COOKZILLA_USER_CACHE_SIZE users are
+    kept.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._users = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+
+        self.app = app
+        app.extensions['user_cache'] = self
+        self.invalidate()
+        self.hits = self.misses = 0
+        model_committed.connect(self._on_model_committed, sender=app)
+        for event in ('after_create', 'after_drop'):
+            if not sa.event.contains(db.metadata, event, self._on_ddl):
+                sa.event.listen(db.metadata, event, self._on_ddl)
+
+    def __len__(self):
+        return len(self._users)
+
+    def get(self, user_id):
+        """The user as a persistent instance of the current session, or None."""
+        from . import db
+        from .models import User
+
+        entry = self._users.get(user_id)
+        if entry is None or entry[0] < time.time():
+            with self._lock:
+                self.misses += 1
+            user = User.query.options(sa.orm.joinedload(User.role)).get(user_id)
+            if user is not None:
+                self._store(user)
+            return user
+        with self._lock:
+            self.hits += 1
+        key = sa.orm.util.identity_key(User, user_id)
+        user = db.session.identity_map.get(key)
+        if user is None:
+            user = sa.inspect(User).class_manager.new_instance()
+            for name, value in entry[1].items():
+                sa.orm.attributes.set_committed_value(user, name, value)
+            sa.orm.make_transient_to_detached(user)
+            db.session.add(user)
+        return user
+
+    def seen(self, user_id, last_seen):
+        """Keep the cached last_seen in step with User.ping()."""
+        entry = self._users.get(user_id)
+        if entry is not None:
+            entry[1]['last_seen'] = last_seen
+
+    def discard(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._users = {}
+
+    def _store(self, user):
+        state = sa.inspect(user)
+        values = dict((attr.key, state.dict.get(attr.key)) for attr in state.mapper.column_attrs)
+        size = self.app.config['COOKZILLA_USER_CACHE_SIZE']
+        if size <= 0:
+            return
+        with self._lock:
+            if user.id not in self._users and len(self._users) >= size:
+                # drop the entry closest to expiring
+                del self._users[min(self._users, key=lambda k: self._users[k][0])]
+            self._users[user.id] = (time.time() + self.app.config['COOKZILLA_USER_CACHE_TTL'], values)
+
+    def _on_model_committed(self, app, changes):
+        from .counters import _counters
+        from .models import User
+
+        counters = [c for c in _counters if c.parent is User]
+        for change in changes:
+            if isinstance(change.instance, User):
+                self.discard(change.values.get('id'))
+            for counter in counters:
+                if isinstance(change.instance, counter.child):
+                    self.discard(change.values.get(counter.foreign_key))
+
+    def _on_ddl(self, target, connection, **kw):
+        self.invalidate()
@@ -1,24 +1,60 @@
 import base64
+import http.client
 import json
-from urllib import parse, request
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import parse
+
+from ..exceptions import ImgurError
+
+# read the image in multiples of 3 bytes so the base64 chunks concatenate
+CHUNK_SIZE = 3 * 16 * 1024
+
+#: statuses worth another attempt
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
 
 class Imgur(object):
     """
     Simple class for handling Imgur image upload, and deletion
+
+    Requests reuse keep-alive connections from a pool of ``pool_size`` per
+    client. Each attempt gets ``connect_timeout`` seconds to connect and
+    ``read_timeout`` seconds per socket read. Connection errors, timeouts
+    and 429/5xx answers are retried up to ``retries`` times, waiting
+    ``backoff``, 2 * ``backoff``, ... seconds in between. Images are
+    base64-encoded while they are sent, never held in memory whole.
+    submit_image() runs uploads on a pool of ``workers`` threads and
+    returns a future.
     """
 
     API_URL = "https://api.imgur.com/3/image"
 
-    def __init__(self):  # app=None, client_id=None, **kwargs):
-        # if not client_id: # and not app.config.get("IMGUR_ID", None):
-        #     raise Exception("Missing client id")
-        self.client_id = '5b2af5db85fc9a1'  # or app.config.get("IMGUR_ID")
-        # if 'api' in kwargs:
-        #     self.API_URL = kwargs["api"]
+    def __init__(self, client_id=None, api=None, connect_timeout=3.0, read_timeout=20.0,
+                 retries=2, backoff=0.5, pool_size=4, workers=4):
+        self.client_id = client_id or '5b2af5db85fc9a1'
+        if api:
+            self.API_URL = api
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.workers = workers
+        url = parse.urlsplit(self.API_URL)
+        self._connection_class = http.client.HTTPSConnection if url.scheme == 'https' \
+            else http.client.HTTPConnection
+        self._host = url.netloc
+        self._path = url.path
+        self._pool = queue.LifoQueue(pool_size)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.connections_opened = 0
 
     def _get_api(self):
-        return self.API_URL
+        return self._path
 
     def _add_authorization_header(self, additional=dict()):
         """
@@ -33,36 +69,47 @@ class Imgur(object):
 
     def _build_send_request(self, image=None, params=dict()):
         """
-        Build request for sending an image
+        Build request for sending an image, as an iterable of url encoded
+        chunks
         """
 
         if not image:
             raise Exception("Missing image object")
 
-        b64 = base64.b64encode(image.read())
-
-        data = dict(
-            image=b64,
-            type='base64',
-        )
-
+        data = dict(type='base64')
         data.update(params)
-        return parse.urlencode(data).encode("utf-8")
+        yield (parse.urlencode(data) + '&image=').encode('utf-8')
+        while True:
+            chunk = image.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield parse.quote(base64.b64encode(chunk), safe='').encode('ascii')
 
     def send_image(self, image, send_params=dict(), additional_headers=dict()):
         """
         Main handler for sending images
 
-            :params image -- Image object
+            :params image -- Image object, seekable so it can be sent again
+            on a retry
             :params send_params -- additional info to be sent to imgur
             :params additional_headers -- additional headers to be added to request
         """
-        req = request.Request(url=self._get_api(),
-                              data=self._build_send_request(image, send_params),
-                              headers=self._add_authorization_header(additional_headers)
-                              )
-        data = request.urlopen(req)
-        return json.loads(data.read().decode("utf-8"))
+        headers = self._add_authorization_header(additional_headers)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        start = image.tell()
+
+        def body():
+            image.seek(start)
+            return self._build_send_request(image, send_params)
+
+        return self._request('POST', self._get_api(), body, headers)
+
+    def submit_image(self, image, send_params=dict(), additional_headers=dict()):
+        """send_image() on the worker pool; returns a future of its result."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers)
+        return self._executor.submit(self.send_image, image, send_params, additional_headers)
 
     def delete_image(self, delete_hash, additional_headers=dict()):
         """
@@ -72,9 +119,85 @@ class Imgur(object):
             image hash optained when sending an image
             :params additional_headers -- aditional headers to be addd to request
         """
-        opener = request.build_opener(request.HTTPHandler)
-        req = request.Request(url=self._get_api() + "/" + delete_hash,
-                              headers=self._add_authorization_header(additional_headers))
-        req.get_method = lambda: "DELETE"
-        data = request.urlopen(req)
-        return json.loads(data.read().decode("utf-8"))
+        return self._request('DELETE', self._get_api() + "/" + delete_hash, None,
+                             self._add_authorization_header(additional_headers))
+
+    def close(self):
+        """Wait for submitted uploads and close the pooled connections."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _connection(self, reuse=True):
+        if reuse:
+            try:
+                return self._pool.get_nowait(), True
+            except queue.Empty:
+                pass
+        conn = self._connection_class(self._host, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        self.connections_opened += 1
+        return conn, False
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _request(self, method, path, body, headers):
+        attempt, reuse = 0, True
+        while True:
+            conn = None
+            try:
+                conn, reused = self._connection(reuse)
+                conn.request(method, path, body=body() if body else None, headers=headers,
+                             encode_chunked=body is not None)
+                response = conn.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                if conn is not None:
+                    conn.close()
+                if conn is not None and reused and not isinstance(e, socket.timeout):
+                    # the server closed an idle keep-alive connection, try
+                    # again on a fresh one without counting an attempt
+                    reuse = False
+                    continue
+                error = ImgurError('{} {} failed: {}'.format(method, path, e))
+                if not self._backoff(attempt):
+                    raise error
+                attempt += 1
+                continue
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            if response.status in RETRY_STATUSES:
+                if not self._backoff(attempt):
+                    raise ImgurError('{} {} answered {}'.format(method, path, response.status),
+                                     response.status)
+                attempt += 1
+                continue
+            try:
+                result = json.loads(data.decode("utf-8"))
+            except ValueError:
+                raise ImgurError('{} {} answered {} with invalid JSON'.format(method, path, response.status),
+                                 response.status)
+            if response.status >= 400:
+                raise ImgurError('{} {} answered {}'.format(method, path, response.status),
+                                 response.status, result)
+            return result
+
+    def _backoff(self, attempt):
+        """Sleep before retry ``attempt`` + 1, or return False when out of retries."""
+        if attempt >= self.retries:
+            return False
+        time.sleep(self.backoff * 2 ** attempt)
+        return True
@@ -0,0 +1,72 @@
+"""
+Micro benchmarks for Cookzilla, run through the bench_* commands in manage.py.
+
+Every benchmark builds its own throwaway SQLite database so it never touches
+the development data.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+
+from app import create_app, db, log_writer, last_seen_writer
+from app.models import Role, Tag, User
+
+
+@contextmanager
+def bench_app(**config):
+    """
+    Yield a testing app bound to a fresh temporary database.
+
+    No application context is left pushed, so every test client request gets
+    its own context and commits on teardown exactly like a real worker.
+    """
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    app.config['SQLALCHEMY_RECORD_QUERIES'] = True
+    app.config.update(config)
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        Tag.insert_tags()
+    try:
+        yield app
+    finally:
+        log_writer.flush()
+        last_seen_writer.flush()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+        os.remove(path)
+
+
+class CommitCounter(object):
+    """Count COMMITs issued on the engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.commits = 0
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+    def __enter__(self):
+        sa.event.listen(self.engine, 'commit', self._on_commit)
+        return self
+
+    def __exit__(self, *exc):
+        sa.event.remove(self.engine, 'commit', self._on_commit)
+
+
+def login(client, email, password):
+    return client.post('/auth/login', data={'email': email, 'password': password})
+
+
+def add_user(email, username, password='cat'):
+    u = User(email=email, username=username, password=password, confirmed=True)
+    db.session.add(u)
+    db.session.commit()
+    return u
@@ -0,0 +1,265 @@
+"""
+Latency and throughput of the main pages on a seeded database, driven
+through the real app by concurrent test clients.
+
+Each scenario runs ``requests`` requests on each of ``clients`` threads and
+reports the p50/p95/p99 latency, requests per second and SQL statements per
+request. Results are saved as a JSON baseline with --save; any later run at
+the same scale and concurrency is compared against it and flags a scenario
+whose p95 or throughput got more than ``tolerance`` worse, or that runs more
+queries per request.
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import sqlalchemy as sa
+
+from app import db
+from app.models import Recipe, Tag, GroupMember, Event, User
+from app.seeding import Seeder, PRESETS, WORDS
+from . import bench_app, login
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def _photo():
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new('RGB', (800, 600), 'orange').save(out, 'JPEG')
+    return out.getvalue()
+
+
+PHOTO = None
+
+
+def anonymous_index(client, data, i):
+    return client.get('/')
+
+
+def followed_feed(client, data, i):
+    client.set_cookie('localhost', 'show_followed', '1')
+    return client.get('/')
+
+
+def recipe_detail(client, data, i):
+    return client.get('/recipes/{}'.format(data['recipes'][i % len(data['recipes'])]))
+
+
+def search(client, data, i):
+    return client.get('/search_results/{}'.format(WORDS[i % len(WORDS)]))
+
+
+def tag_page(client, data, i):
+    return client.get('/tags/{}'.format(data['tags'][i % len(data['tags'])]))
+
+
+def group_page(client, data, i):
+    return client.get('/groups/{}'.format(data['groups'][i % len(data['groups'])]))
+
+
+def event_rsvp(client, data, i):
+    # go and change one's mind, in turns
+    event = data['events'][i // 2 % len(data['events'])]
+    return client.get('/events/{}/{}'.format('go' if i % 2 == 0 else 'ungo', event))
+
+
+def login_form(client, data, i):
+    return login(client, data['email'], 'cat')
+
+
+def recipe_create(client, data, i):
+    form = dict(title='bench soup {}'.format(i), serving='2', body='hot soup',
+                photo=(io.BytesIO(PHOTO), 'soup.jpg'), tags=[str(tag) for tag in data['tags'][:2]])
+    for n in range(4):
+        form.update({'ingredients_optical-{}-name'.format(n): WORDS[(i + n) % len(WORDS)],
+                     'ingredients_optical-{}-unit'.format(n): 'gram(g)',
+                     'ingredients_optical-{}-quantity'.format(n): str(100 + n)})
+    for n, recipe in enumerate(data['recipes'][:2]):
+        form['links-{}-link'.format(n)] = 'http://localhost/recipes/{}'.format(recipe)
+    return client.post('/recipes/create', data=form)
+
+
+def recipe_import(client, data, i):
+    # a batch of 20 recipes, each with a few ingredients, links and tags
+    return client.post('/recipes/import', content_type='application/json', data=json.dumps({'recipes': [
+        dict(title='bench stew {} {}'.format(i, n), serving=4, body='slow cooked',
+             ingredients=[dict(name=WORDS[(i + n + k) % len(WORDS)], unit='gram(g)', quantity=100 + k)
+                          for k in range(5)],
+             links=data['recipes'][n % len(data['recipes']):][:2], tags=data['tags'][:2])
+        for n in range(20)]}))
+
+
+#: name -> (logged in, request), in the order they run
+SCENARIOS = OrderedDict([
+    ('anonymous_index', (False, anonymous_index)),
+    ('followed_feed', (True, followed_feed)),
+    ('recipe_detail', (True, recipe_detail)),
+    ('search', (True, search)),
+    ('tag_page', (False, tag_page)),
+    ('group_page', (True, group_page)),
+    ('event_rsvp', (True, event_rsvp)),
+    ('login', (False, login_form)),
+    ('recipe_create', (True, recipe_create)),
+    ('recipe_import', (True, recipe_import)),
+])
+
+
+class QueryCounter(object):
+    """Count the statements run on the engine while active, from any thread."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.queries += 1
+
+    def __enter__(self):
+        sa.event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        sa.event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def _client_data(index, users, shared):
+    """What client ``index`` requests: the shared ids and pages of its own user."""
+    user_id = users[index % len(users)]
+    groups = [group_id for group_id, in db.session.query(GroupMember.group_id)
+              .filter_by(member_id=user_id).limit(50)]
+    return dict(shared, user_id=user_id, email=User.query.get(user_id).email,
+                groups=groups or shared['all_groups'])
+
+
+def _percentile(latencies, q):
+    return latencies[min(len(latencies) - 1, int(round(q * (len(latencies) - 1))))]
+
+
+def _measure(app, name, datas, requests):
+    logged_in, request = SCENARIOS[name]
+    clients = []
+    for data in datas:
+        client = app.test_client(use_cookies=True)
+        if logged_in:
+            login(client, data['email'], 'cat')
+        clients.append(client)
+    latencies, errors = [], []
+
+    def worker(client, data):
+        timings = []
+        for i in range(requests):
+            start = time.perf_counter()
+            response = request(client, data, i)
+            timings.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        latencies.extend(timings)
+
+    threads = [threading.Thread(target=worker, args=(client, data)) for client, data in zip(clients, datas)]
+    with QueryCounter(db.get_engine(app)) as counter:
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return OrderedDict([
+        ('p50', _percentile(latencies, 0.5) * 1000),
+        ('p95', _percentile(latencies, 0.95) * 1000),
+        ('p99', _percentile(latencies, 0.99) * 1000),
+        ('rps', len(latencies) / elapsed),
+        ('queries', counter.queries / len(latencies)),
+        ('errors', len(errors)),
+    ])
+
+
+def compare(results, baseline, tolerance):
+    """The scenarios of ``results`` that regressed against ``baseline``, with the reasons."""
+    regressions = OrderedDict()
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        reasons = []
+        if result['p95'] > base['p95'] * (1 + tolerance):
+            reasons.append('p95 {:.1f}ms > {:.1f}ms'.format(result['p95'], base['p95']))
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            reasons.append('{:.1f} req/s < {:.1f} req/s'.format(result['rps'], base['rps']))
+        # statement counts are deterministic, any growth is a new query
+        if result['queries'] > base['queries'] + 0.5:
+            reasons.append('{:.1f} queries > {:.1f}'.format(result['queries'], base['queries']))
+        if result['errors'] > base.get('errors', 0):
+            reasons.append('{} errors'.format(result['errors']))
+        if reasons:
+            regressions[name] = reasons
+    return regressions
+
+
+def run(scale=1.0, clients=4, requests=50, scenarios=None, baseline=DEFAULT_BASELINE,
+        save=False, tolerance=0.2):
+    """Run the scenarios, print the report and return the regressions found."""
+    global PHOTO
+    PHOTO = PHOTO or _photo()
+    scenarios = scenarios or list(SCENARIOS)
+    counts = dict((table, max(1, int(round(rows * scale)))) for table, rows in PRESETS['small'].items())
+    static = tempfile.mkdtemp()
+    os.mkdir(os.path.join(static, 'upload'))
+    try:
+        with bench_app() as app:
+            # uploads of the create scenario land in a throwaway folder
+            app.static_url_path = '/static'
+            app.static_folder = static
+            with app.app_context():
+                Seeder(0).run(counts, report=lambda line: None)
+                shared = dict(
+                    recipes=[id for id, in db.session.query(Recipe.id)
+                             .order_by(Recipe.review_count.desc()).limit(50)],
+                    tags=[id for id, in db.session.query(Tag.id)],
+                    all_groups=[id for id, in db.session.query(GroupMember.group_id).distinct().limit(50)],
+                    events=[id for id, in db.session.query(Event.id).limit(200)])
+                # the busiest members, so group pages and feeds have content
+                users = [id for id, in db.session.query(User.id)
+                         .order_by(User.group_count.desc(), User.followed_count.desc()).limit(clients)]
+                datas = [_client_data(i, users, shared) for i in range(clients)]
+            results = OrderedDict((name, _measure(app, name, datas, requests)) for name in scenarios)
+    finally:
+        shutil.rmtree(static)
+
+    previous = None
+    if os.path.exists(baseline):
+        with open(baseline) as f:
+            previous = json.load(f)
+        if (previous['scale'], previous['clients']) != (scale, clients):
+            print('baseline {} was taken at scale {} with {} clients, not comparing'.format(
+                baseline, previous['scale'], previous['clients']))
+            previous = None
+    regressions = compare(results, previous['scenarios'], tolerance) if previous else {}
+
+    print('{:<16} {:>8} {:>8} {:>8} {:>9} {:>8} {:>6}'.format(
+        'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries', 'errors'))
+    for name, r in results.items():
+        line = '{:<16} {:>8.1f} {:>8.1f} {:>8.1f} {:>9.1f} {:>8.1f} {:>6}'.format(
+            name, r['p50'], r['p95'], r['p99'], r['rps'], r['queries'], r['errors'])
+        if previous and name in previous['scenarios']:
+            base = previous['scenarios'][name]
+            line += '   p95 {:+.0%} req/s {:+.0%}'.format(r['p95'] / base['p95'] - 1, r['rps'] / base['rps'] - 1)
+        if name in regressions:
+            line += '   REGRESSION: ' + ', '.join(regressions[name])
+        print(line)
+
+    if save:
+        with open(baseline, 'w') as f:
+            json.dump(OrderedDict([('scale', scale), ('clients', clients), ('requests', requests),
+                                   ('scenarios', results)]), f, indent=2)
+        print('baseline saved to {}'.format(baseline))
+    return regressions
@@ -0,0 +1,51 @@
+"""
+Latency of a user's upcoming events across their groups: the calendar's
+single query against the membership-by-membership loop it replaced, and the
+cached navbar summary.
+"""
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+from flask_sqlalchemy import get_debug_queries
+
+from app import db, event_calendar
+from app.models import User, GroupMember
+from app.seeding import Seeder
+from . import bench_app
+
+
+def _loop(user):
+    """The events as User.get_all_available_events used to find them."""
+    return [e for g in user.groups.all() for e in g.group.events.all() if e.timestamp > datetime.utcnow()]
+
+
+def _time(fn, repeat):
+    queries = len(get_debug_queries())
+    start = time.time()
+    for _ in range(repeat):
+        db.session.expire_all()
+        result = fn()
+    return (time.time() - start) / repeat * 1000, (len(get_debug_queries()) - queries) / float(repeat), result
+
+
+def run(users=5000, groups=500, group_members=50000, events=20000, rsvps=50000, repeat=10):
+    with bench_app() as app:
+        with app.app_context():
+            Seeder(0).run(dict(users=users, groups=groups, group_members=group_members, events=events,
+                               rsvps=rsvps), report=lambda line: None)
+            user_id, memberships = db.session.query(GroupMember.member_id, sa.func.count()) \
+                .group_by(GroupMember.member_id).order_by(sa.func.count().desc()).first()
+            user = User.query.get(user_id)
+            print('{} events in {} groups, user {} is in {} groups'.format(
+                events, groups, user_id, memberships))
+            for name, fn in (('loop over memberships', lambda: _loop(user)),
+                             ('calendar, all upcoming', lambda: event_calendar.upcoming(user_id).entries),
+                             ('calendar, first page', lambda: event_calendar.upcoming(user_id, limit=20).entries)):
+                elapsed, queries, result = _time(fn, repeat)
+                print('{:<24} {:>8.2f}ms {:>6.0f} queries {:>6} events'.format(name, elapsed, queries, len(result)))
+            event_calendar.invalidate()
+            elapsed, queries, result = _time(lambda: event_calendar.next_events(user_id), 1)
+            print('{:<24} {:>8.2f}ms {:>6.0f} queries'.format('navbar summary, miss', elapsed, queries))
+            elapsed, queries, result = _time(lambda: event_calendar.next_events(user_id), repeat * 100)
+            print('{:<24} {:>8.3f}ms {:>6.0f} queries'.format('navbar summary, hit', elapsed, queries))
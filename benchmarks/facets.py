@@ -0,0 +1,58 @@
+"""
+Latency of faceted tag queries, with the counts of every facet, on the
+bitmaps of a seeded database against the same filter in SQL.
+"""
+import time
+
+import sqlalchemy as sa
+
+from app import db, facets
+from app.models import Tag, recipe_tags
+from app.seeding import Seeder
+from . import bench_app
+
+
+def _sql(tags, not_tags):
+    """Recipes with all of ``tags`` and none of ``not_tags``, and the count per tag among them, in SQL."""
+    matching = sa.select([recipe_tags.c.recipe_id]).where(recipe_tags.c.tag_id.in_(tags)) \
+        .group_by(recipe_tags.c.recipe_id).having(sa.func.count(sa.distinct(recipe_tags.c.tag_id)) == len(tags))
+    excluded = sa.select([recipe_tags.c.recipe_id]).where(recipe_tags.c.tag_id.in_(not_tags))
+    ids = [id for id, in db.session.execute(matching.except_(excluded))]
+    counts = db.session.execute(
+        sa.select([recipe_tags.c.tag_id, sa.func.count()])
+        .where(recipe_tags.c.recipe_id.in_(matching.except_(excluded)))
+        .group_by(recipe_tags.c.tag_id)).fetchall()
+    return ids, counts
+
+
+def _time(fn, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        result = fn()
+    return (time.time() - start) / repeat * 1000, result
+
+
+def run(recipes=200000, recipe_tags=400000, reviews=200000, repeat=20):
+    with bench_app() as app:
+        with app.app_context():
+            Seeder(0).run(dict(users=1000, recipes=recipes, recipe_tags=recipe_tags, reviews=reviews),
+                          report=lambda line: None)
+            start = time.time()
+            facets.browse()
+            count, size = facets.size
+            print('{} recipes, {} tags: {} bitmaps loaded in {:.2f}s, {:.1f} MB'.format(
+                recipes, recipe_tags, count, time.time() - start, size / 2. ** 20))
+            tags = [id for id, in db.session.query(Tag.id).order_by(Tag.id)]
+            queries = [
+                ('everything', dict(), None),
+                ('1 tag', dict(tags=tags[:1]), (tags[:1], [])),
+                ('2 tags not 1', dict(tags=tags[:2], not_tags=tags[2:3]), (tags[:2], tags[2:3])),
+                ('1 of 3, 3+ stars, serves 2', dict(any_tags=tags[:3], rating='3+', serving='2'), None),
+            ]
+            for name, query, sql in queries:
+                elapsed, result = _time(lambda: facets.browse(**query), repeat)
+                line = '{:<28} {:>8.2f}ms  {:>7} recipes'.format(name, elapsed, len(result.ids))
+                if sql:
+                    sql_elapsed, (found, _) = _time(lambda: _sql(*sql), 1)
+                    line += '   SQL {:>8.1f}ms ({} recipes)'.format(sql_elapsed, len(found))
+                print(line)
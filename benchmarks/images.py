@@ -0,0 +1,68 @@
+"""
+Throughput of the recipe photo pipeline on a backlog of uploads, with one
+worker process and with one per core.
+
+Every upload is a copy of one 1600x1200 camera-sized JPEG carrying EXIF
+data, so the numbers measure decoding, resizing and encoding only.
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from app import create_app, image_pipeline
+from app.images import VARIANTS, DENSITIES, derivative_name
+
+
+def _make_upload(path):
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (1600, 1200), (230, 200, 160))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, 1600, 40):
+        draw.ellipse((i, i % 1200 / 2, i + 300, i % 1200 / 2 + 300), fill=(i % 255, 120, 255 - i % 255))
+    exif = Image.Exif()
+    exif[0x0110] = 'Bench Camera'  # Model
+    image.save(path, 'JPEG', quality=92, exif=exif)
+
+
+def _measure(label, count, workers, static):
+    upload = os.path.join(static, 'upload')
+    for name in os.listdir(upload):
+        if '-' in name:
+            os.remove(os.path.join(upload, name))
+    app = create_app('testing')
+    app.static_folder = static
+    app.config['COOKZILLA_IMAGE_WORKERS'] = workers
+    image_pipeline.init_app(app)
+    filenames = ['{}.jpg'.format(i) for i in range(count)]
+    try:
+        start = time.time()
+        written = sum(len(names) for names in image_pipeline.map(filenames))
+        elapsed = time.time() - start
+    finally:
+        image_pipeline.shutdown()
+    source = os.path.getsize(os.path.join(upload, '0.jpg'))
+    sizes = ', '.join('{} {:.1f} kB'.format(
+        derivative_name('', variant, density)[1:],
+        os.path.getsize(os.path.join(upload, derivative_name('0.jpg', variant, density))) / 1024.0)
+        for variant in sorted(VARIANTS) for density in DENSITIES)
+    print('{:<10} {:>3} workers {:>8.1f} photos/s {:>7.1f}s for {} photos, {} derivatives'.format(
+        label, workers, count / elapsed, elapsed, count, written))
+    return source, sizes
+
+
+def run(images=10000, workers=None):
+    workers = workers or os.cpu_count()
+    static = tempfile.mkdtemp()
+    try:
+        upload = os.path.join(static, 'upload')
+        os.mkdir(upload)
+        _make_upload(os.path.join(upload, '0.jpg'))
+        for i in range(1, images):
+            shutil.copyfile(os.path.join(upload, '0.jpg'), os.path.join(upload, '{}.jpg'.format(i)))
+        _measure('one core', images, 1, static)
+        source, sizes = _measure('all cores', images, workers, static)
+        print('original {:.1f} kB; {}'.format(source / 1024.0, sizes))
+    finally:
+        shutil.rmtree(static)
@@ -0,0 +1,55 @@
+"""
+Latency of ingredient queries on the inverted index of a seeded database,
+against the same queries as SQL on the ingredients table.
+"""
+import time
+
+import sqlalchemy as sa
+
+from app import db, ingredient_index
+from app.models import Ingredient
+from app.seeding import Seeder, WORDS
+from . import bench_app
+
+
+def _sql_with_all(names, without):
+    """Recipes using all of ``names`` and none of ``without``, in SQL."""
+    query = db.session.query(Ingredient.recipe_id) \
+        .filter(sa.func.lower(Ingredient.name).in_(names)) \
+        .group_by(Ingredient.recipe_id) \
+        .having(sa.func.count(sa.distinct(sa.func.lower(Ingredient.name))) == len(names))
+    excluded = db.session.query(Ingredient.recipe_id).filter(sa.func.lower(Ingredient.name).in_(without))
+    return [id for id, in query.filter(~Ingredient.recipe_id.in_(excluded))]
+
+
+def _time(fn, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        result = fn()
+    return (time.time() - start) / repeat * 1000, result
+
+
+def run(recipes=200000, ingredients=1000000, repeat=20):
+    with bench_app() as app:
+        with app.app_context():
+            Seeder(0).run(dict(users=1000, recipes=recipes, ingredients=ingredients),
+                          report=lambda line: None)
+            start = time.time()
+            ingredient_index.find(['tomato'])
+            terms, postings, size = ingredient_index.size
+            print('{} recipes, {} ingredient rows: index of {} ingredients loaded in {:.2f}s, '
+                  '{:.1f} MB of arrays'.format(recipes, postings, terms, time.time() - start, size / 2. ** 20))
+            words = sorted(set(WORDS))
+            queries = [
+                ('with 2', dict(with_all=words[:2])),
+                ('with 3 without 1', dict(with_all=words[:3], without=words[3:4])),
+                ('have 8, missing <= 1', dict(have=words[:8], missing=1)),
+                ('have 20, missing <= 2', dict(have=words[:20], missing=2)),
+            ]
+            for name, query in queries:
+                elapsed, (ids, _) = _time(lambda: ingredient_index.find(**query), repeat)
+                line = '{:<24} {:>8.2f}ms  {:>7} recipes'.format(name, elapsed, len(ids))
+                if 'with_all' in query:
+                    sql, found = _time(lambda: _sql_with_all(query['with_all'], query.get('without', [])), 1)
+                    line += '   SQL {:>8.1f}ms ({} recipes)'.format(sql, len(found))
+                print(line)
@@ -0,0 +1,45 @@
+"""
+Time to sum the shopping list of thousands of recipes at once, on a seeded
+database, against adding the ingredients up one row at a time in Python.
+"""
+import time
+
+from app import db
+from app.ingredients import shopping_list, unit_table, OTHER
+from app.models import Recipe
+from app.seeding import Seeder
+from . import bench_app
+
+
+def _per_row(servings):
+    """The totals the way a loop over the ingredients of each recipe adds them up."""
+    table = unit_table()
+    totals = {}
+    for recipe_id, wanted in servings.items():
+        recipe = Recipe.query.get(recipe_id)
+        for ingredient in recipe.ingredients:
+            ratio = float(wanted or recipe.serving or 1) / (recipe.serving or 1)
+            kind = table.kinds.get(ingredient.unit, OTHER)
+            key = ingredient.name.strip().lower(), kind if kind != OTHER else ingredient.unit
+            totals[key] = totals.get(key, 0) + \
+                ingredient.quantity * ratio * table.factors.get(ingredient.unit, 1.0)
+    return totals
+
+
+def run(recipes=20000, ingredients=100000, sizes=(10, 100, 1000, 10000)):
+    with bench_app() as app:
+        with app.app_context():
+            Seeder(0).run(dict(users=100, recipes=recipes, ingredients=ingredients),
+                          report=lambda line: None)
+            ids = [id for id, in db.session.query(Recipe.id).order_by(Recipe.id)]
+            for size in sizes:
+                servings = dict((id, 4) for id in ids[:size])
+                start = time.time()
+                items = shopping_list(servings)
+                vectorized = time.time() - start
+                db.session.expunge_all()
+                start = time.time()
+                _per_row(servings)
+                looped = time.time() - start
+                print('{:>6} recipes: {:>8.1f}ms batched, {:>8.1f}ms per row ({:.0f}x), {} items'.format(
+                    size, vectorized * 1000, looped * 1000, looped / max(vectorized, 1e-9), len(items)))
@@ -0,0 +1,61 @@
+"""
+Commits per search request with the old read-modify-write LogEvent.log and
+with the buffered log writer.
+"""
+import time
+from datetime import datetime
+
+from app import db, log_writer
+from app.models import Recipe, LogEvent, Permission
+from . import bench_app, CommitCounter, login, add_user
+
+
+def legacy_log(user, op, recipe):
+    """LogEvent.log as it was before the log writer: one commit per hit."""
+    if not user.can(Permission.WRITE_ARTICLES):
+        return
+    log = LogEvent.query.filter_by(user=user, op=op, recipe=recipe).first()
+    if log:
+        log.ct += 1
+        log.logged_at = datetime.utcnow()
+    else:
+        log = LogEvent(user=user, op=op, recipe=recipe, ct=1)
+    db.session.add(log)
+    db.session.commit()
+
+
+def _seed(count):
+    user = add_user('bench@example.com', 'bench')
+    for i in range(count):
+        db.session.add(Recipe(title='soup {}'.format(i), body='hot soup', author=user))
+    db.session.commit()
+
+
+def _measure(label, requests, log):
+    with bench_app(COOKZILLA_LOG_FLUSH_INTERVAL=0) as app:
+        with app.app_context():
+            _seed(app.config['SEARCH_RESULTS'])
+        client = app.test_client(use_cookies=True)
+        login(client, 'bench@example.com', 'cat')
+        original, LogEvent.log = LogEvent.log, staticmethod(log)
+        try:
+            with CommitCounter(db.get_engine(app)) as counter:
+                start = time.time()
+                for _ in range(requests):
+                    client.get('/search_results/soup')
+                elapsed = time.time() - start
+                request_commits = counter.commits
+                log_writer.flush()
+        finally:
+            LogEvent.log = original
+        with app.app_context():
+            total = db.session.query(db.func.sum(LogEvent.ct)).scalar()
+        print('{:<10} {:>6.2f} commits/request {:>8.1f} req/s  '
+              '{} commits incl. final flush, {} hits logged'.format(
+                  label, request_commits / float(requests), requests / elapsed,
+                  counter.commits, total))
+
+
+def run(requests=50):
+    _measure('before', requests, legacy_log)
+    _measure('after', requests, LogEvent.log)
@@ -0,0 +1,77 @@
+"""
+Messages per second for a burst of mail, sent the old way (one thread and
+one SMTP connection per message) and through the mail dispatcher, against
+a local SMTP sink that spends ``connect_delay`` on each connection like a
+TLS handshake to a remote relay would.
+"""
+import threading
+import time
+
+from flask_mail import Message
+
+from app import create_app, mail, mail_dispatcher
+from .smtp_sink import SMTPSink
+
+
+def legacy_send(app, msg):
+    """send_email as it was before the dispatcher."""
+    def send_async_email(app, msg):
+        with app.app_context():
+            mail.send(msg)
+
+    thr = threading.Thread(target=send_async_email, args=[app, msg])
+    thr.start()
+    return thr
+
+
+def _app(sink):
+    app = create_app('testing')
+    app.config.update(MAIL_SUPPRESS_SEND=False, MAIL_SERVER='127.0.0.1', MAIL_PORT=sink.port,
+                      MAIL_USE_TLS=False)
+    mail.init_app(app)
+    mail_dispatcher.init_app(app)
+    mail_dispatcher.reset_stats()
+    return app
+
+
+def _messages(count):
+    return [Message('Confirm Your Account', sender='cookzilla@example.com',
+                    recipients=['user{}@example.com'.format(i)], body='hi' * 200)
+            for i in range(count)]
+
+
+def _report(label, count, elapsed, sink, threads):
+    print('{:<10} {:>8.1f} messages/s {:>5} delivered {:>5} connections {:>5} peak threads'.format(
+        label, count / elapsed, len(sink.messages), sink.connections, threads))
+
+
+def run(messages=500, connect_delay=0.05):
+    sink = SMTPSink(connect_delay=connect_delay)
+    try:
+        app = _app(sink)
+        with app.app_context():
+            batch = _messages(messages)
+            start = time.time()
+            threads = [legacy_send(app, msg) for msg in batch]
+            peak = threading.active_count()
+            for thread in threads:
+                thread.join()
+            _report('before', messages, time.time() - start, sink, peak)
+    finally:
+        sink.stop()
+
+    sink = SMTPSink(connect_delay=connect_delay)
+    try:
+        app = _app(sink)
+        with app.app_context():
+            batch = _messages(messages)
+            start = time.time()
+            for msg in batch:
+                mail_dispatcher.send(msg)
+            peak = threading.active_count()
+            mail_dispatcher.join()
+            _report('after', messages, time.time() - start, sink, peak)
+            print('{} batches, {:.3f}s average delay, {} failed'.format(
+                mail_dispatcher.batches, mail_dispatcher.average_delay, mail_dispatcher.failed))
+    finally:
+        sink.stop()
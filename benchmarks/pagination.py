@@ -0,0 +1,71 @@
+"""
+Latency of page 1 and a deep page of the recipes and log_events lists, with
+OFFSET pagination and an exact COUNT(*) as Flask-SQLAlchemy's paginate() does
+it, and with keyset pagination and a cached total.
+"""
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.models import Recipe, LogEvent
+from app.pagination import encode_cursor, paginate
+from . import bench_app, add_user
+
+START = datetime(2016, 1, 1)
+
+
+def _seed(rows):
+    user = add_user('bench@example.com', 'bench')
+    db.session.execute(Recipe.__table__.insert(), [
+        dict(title='soup {}'.format(i), body='hot soup', author_id=user.id,
+             timestamp=START + timedelta(seconds=i // 2), review_count=0)
+        for i in range(rows)])
+    db.session.execute(LogEvent.__table__.insert(), [
+        dict(user_id=user.id, op='soup {}'.format(i), recipe_id=1, ct=1,
+             logged_at=START + timedelta(seconds=i // 2))
+        for i in range(rows)])
+    db.session.commit()
+
+
+def _best(f, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        f()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def _measure(app, model, order_column, id_column, page, per_page, repeat):
+    def offset():
+        with app.test_request_context('/?page={}'.format(page)):
+            model.query.order_by(order_column.desc(), id_column.desc()).paginate(page, per_page, False)
+
+    # the cursor a "next" link on the previous page carries
+    with app.test_request_context('/'):
+        last = model.query.order_by(order_column.desc(), id_column.desc()) \
+            .offset((page - 1) * per_page - 1).first() if page > 1 else None
+        path = '/?page={}&after={}'.format(page, encode_cursor(getattr(last, order_column.key), last.id)) \
+            if last else '/'
+
+    def keyset():
+        with app.test_request_context(path):
+            pagination = paginate(model.query, order_column, id_column, per_page, total='cached')
+            assert len(pagination.items) == per_page
+
+    return _best(offset, repeat), _best(keyset, repeat)
+
+
+def run(pages=(1, 5000), repeat=5):
+    with bench_app() as app:
+        with app.app_context():
+            per_page = current_app.config['COOKZILLA_POSTS_PER_PAGE']
+            _seed(max(pages) * per_page + per_page)
+            for name, model, order_column in (('recipes', Recipe, Recipe.timestamp),
+                                              ('log_events', LogEvent, LogEvent.logged_at)):
+                for page in pages:
+                    offset, keyset = _measure(app, model, order_column, model.id, page, per_page, repeat)
+                    print('{:<11} page {:>6}  offset+count {:>8.2f} ms  keyset {:>8.2f} ms'.format(
+                        name, page, offset * 1000, keyset * 1000))
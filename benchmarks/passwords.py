@@ -0,0 +1,39 @@
+"""
+Logins per second per core, and with every core, for a range of password
+hashing costs. A login is one verification in the password hasher's pool.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app, password_hasher
+
+METHODS = ['pbkdf2:sha1:1000', 'pbkdf2:sha256:50000', 'pbkdf2:sha256:150000', 'pbkdf2:sha512:100000']
+
+
+def _logins_per_second(app, pwhash, logins, workers):
+    app.config['COOKZILLA_PASSWORD_WORKERS'] = workers
+    password_hasher.verify(pwhash, 'cat')  # start the pool
+    try:
+        # as many request threads as there are hashing processes
+        with ThreadPoolExecutor(workers) as threads:
+            start = time.time()
+            assert all(threads.map(lambda _: password_hasher.verify(pwhash, 'cat'), range(logins)))
+            return logins / (time.time() - start)
+    finally:
+        password_hasher.shutdown()
+
+
+def run(logins=200, methods=METHODS):
+    app = create_app('testing')
+    cores = os.cpu_count()
+    with app.app_context():
+        for method in methods:
+            app.config['COOKZILLA_PASSWORD_METHOD'] = method
+            pwhash = generate_password_hash('cat', method)
+            one = _logins_per_second(app, pwhash, logins, 1)
+            every = _logins_per_second(app, pwhash, logins, cores)
+            print('{:<24} {:>8.1f} logins/s per core {:>8.1f} logins/s on {} cores'.format(
+                method, one, every, cores))
@@ -0,0 +1,91 @@
+"""
+Requests per second of concurrent GET traffic, anonymous and logged in, with
+the old per-request ping commit and with read-only GETs plus batched
+last_seen writes.
+"""
+import threading
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from app import db, last_seen_writer
+from app.models import Recipe, User
+from . import bench_app, login, add_user
+
+PATHS = ['/', '/recipes/1', '/user/bench0', '/followers/bench0']
+
+
+def legacy_ping(self):
+    """User.ping as it was before the last_seen writer: one write per request."""
+    self.last_seen = datetime.utcnow()
+    db.session.add(self)
+
+
+class WriteCounter(object):
+    """Count INSERT, UPDATE and DELETE statements issued on the engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.writes = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            self.writes += 1
+
+    def __enter__(self):
+        sa.event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        sa.event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def _worker(app, index, logged_in, requests, errors):
+    client = app.test_client(use_cookies=True)
+    if logged_in:
+        login(client, 'bench{}@example.com'.format(index), 'cat')
+    for i in range(requests):
+        if client.get(PATHS[i % len(PATHS)]).status_code != 200:
+            errors.append(1)
+
+
+def _measure(label, threads, requests, legacy):
+    config = dict(COOKZILLA_READ_ONLY_GETS=not legacy)
+    with bench_app(**config) as app:
+        with app.app_context():
+            for i in range(threads):
+                user = add_user('bench{}@example.com'.format(i), 'bench{}'.format(i))
+            for i in range(20):
+                db.session.add(Recipe(title='soup {}'.format(i), body='hot soup', author=user))
+            # everybody was last seen a while ago, so each user is written once
+            User.query.update({'last_seen': datetime(2000, 1, 1)})
+            db.session.commit()
+        original = User.ping
+        if legacy:
+            User.ping = legacy_ping
+        try:
+            for logged_in in (False, True):
+                errors = []
+                workers = [threading.Thread(target=_worker, args=(app, i, logged_in, requests, errors))
+                           for i in range(threads)]
+                with WriteCounter(db.get_engine(app)) as counter:
+                    start = time.time()
+                    for worker in workers:
+                        worker.start()
+                    for worker in workers:
+                        worker.join()
+                    elapsed = time.time() - start
+                    writes = counter.writes
+                    last_seen_writer.flush()
+                print('{:<7} {:<10} {:>8.1f} req/s {:>6} writes during requests '
+                      '{:>3} after flush {:>3} errors'.format(
+                          label, 'logged in' if logged_in else 'anonymous',
+                          threads * requests / elapsed, writes, counter.writes - writes, len(errors)))
+        finally:
+            User.ping = original
+
+
+def run(threads=8, requests=50):
+    _measure('before', threads, requests, legacy=True)
+    _measure('after', threads, requests, legacy=False)
@@ -0,0 +1,63 @@
+"""
+Time to score related recipes for every recipe, on synthetic matrices the
+size of a large site (1M recipes, 10M browse log rows by default) and end to
+end through the related_recipes table on a seeded database.
+"""
+import time
+
+from app import db, recommender
+from app.recommendations import similar_recipes
+from app.seeding import Seeder, PRESETS
+from . import bench_app
+
+
+def synthetic(recipes, logs, users, tags, seed=0):
+    """Browse counts with a long tail of recipe popularity, and 1-3 tags per recipe."""
+    import numpy as np
+    from scipy import sparse
+
+    rng = np.random.RandomState(seed)
+    # recipe popularity follows a Zipf law, users browse uniformly
+    recipe = np.minimum(rng.zipf(1.3, logs) - 1, recipes - 1)
+    recipe = rng.permutation(recipes)[recipe]
+    user = rng.randint(0, users, logs)
+    browse = sparse.csr_matrix((rng.geometric(0.3, logs).astype(np.float32), (recipe, user)),
+                               shape=(recipes, users))
+    per_recipe = rng.randint(1, 4, recipes)
+    tagged = sparse.csr_matrix((np.ones(per_recipe.sum(), dtype=np.float32),
+                                (np.repeat(np.arange(recipes), per_recipe),
+                                 rng.randint(0, tags, per_recipe.sum()))), shape=(recipes, tags))
+    return browse, tagged
+
+
+def _compute(recipes, logs, users, tags, k):
+    start = time.time()
+    browse, tagged = synthetic(recipes, logs, users, tags)
+    generated = time.time() - start
+    start = time.time()
+    pairs = 0
+    for row, related, score, rank in similar_recipes(browse, tagged, k):
+        pairs += len(row)
+    elapsed = time.time() - start
+    print('{:>9} recipes {:>10} log rows: {:>8.1f}s to score ({:.0f} recipes/s), '
+          '{} pairs, matrices built in {:.1f}s'.format(
+              recipes, logs, elapsed, recipes / elapsed, pairs, generated))
+
+
+def _end_to_end(scale):
+    counts = dict((table, int(rows * scale)) for table, rows in PRESETS['small'].items())
+    with bench_app() as app:
+        with app.app_context():
+            Seeder(0).run(counts, report=lambda line: None)
+            db.session.execute("UPDATE log_events SET op = 'browse'")
+            db.session.commit()
+            stats = recommender.rebuild()
+    print('{:>9} recipes {:>10} log rows: {:.1f}s end to end (load {:.1f}s, score {:.1f}s, '
+          'write {:.1f}s), {} pairs'.format(counts['recipes'], counts['log_events'], stats['total'],
+                                            stats['load'], stats['compute'], stats['write'],
+                                            stats['pairs']))
+
+
+def run(recipes=1000000, logs=10000000, users=100000, tags=20, k=6, scale=100):
+    _compute(recipes, logs, users, tags, k)
+    _end_to_end(scale)
@@ -0,0 +1,67 @@
+"""
+RSVP writes and event pages of an event with thousands of RSVPs: statements
+per write, and queries and time per page as the attendee count grows.
+"""
+import time
+from datetime import datetime, timedelta
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import db
+from app.counters import reconcile_counters
+from app.models import User, Group, Event, RSVP, RSVPStatus
+from . import bench_app, add_user, login
+from .endpoints import QueryCounter
+
+
+def _users(n, offset):
+    users = [User(email='rsvp{}@example.com'.format(i), username='rsvp{}'.format(i), password_hash='x',
+                  confirmed=True) for i in range(offset, offset + n)]
+    db.session.add_all(users)
+    db.session.commit()
+    return [u.id for u in users]
+
+
+def run(attendees=(1000, 5000), writes=500):
+    with bench_app() as app:
+        with app.app_context():
+            owner = add_user('owner@example.com', 'owner')
+            group = Group(title='cooks', creator=owner)
+            event = Event(title='dinner', group=group, creator=owner, timestamp=datetime.utcnow() + timedelta(days=1))
+            db.session.add_all([group, event])
+            owner.member(group)
+            db.session.commit()
+            event_id, owner_id = event.id, owner.id
+
+            # RSVP writes, alternating statuses so every one changes the tallies
+            ids = _users(writes, 0)
+            users = User.query.filter(User.id.in_(ids)).all()
+            event = Event.query.get(event_id)
+            queries = len(get_debug_queries())
+            start = time.time()
+            for i, user in enumerate(users):
+                user._rsvp(event, i % 3)
+                db.session.commit()
+            elapsed = time.time() - start
+            print('{} RSVP writes: {:.3f}ms and {:.1f} statements each'.format(
+                writes, elapsed / writes * 1000, (len(get_debug_queries()) - queries) / float(writes)))
+
+        client = app.test_client(use_cookies=True)
+        login(client, 'owner@example.com', 'cat')
+        total = writes
+        for count in attendees:
+            with app.app_context():
+                if count > total:
+                    db.session.execute(RSVP.__table__.insert(), [
+                        dict(member_id=i, event_id=event_id, status=RSVPStatus.GOING, timestamp=datetime.utcnow())
+                        for i in _users(count - total, total)])
+                    db.session.commit()
+                    reconcile_counters(db.engine)
+                    total = count
+            client.get('/events/{}'.format(event_id))
+            with QueryCounter(db.get_engine(app)) as counter:
+                start = time.time()
+                response = client.get('/events/{}'.format(event_id))
+                elapsed = time.time() - start
+            print('event page, {:>5} RSVPs: {:>7.1f}ms {:>3} queries, status {}'.format(
+                total, elapsed * 1000, counter.queries, response.status_code))
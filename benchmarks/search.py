@@ -0,0 +1,56 @@
+"""
+Search latency of the full-text index against the old LIKE scan.
+"""
+import random
+import time
+
+from app import db, search_index
+from app.models import Recipe
+from . import bench_app, add_user
+
+WORDS = ('tomato basil garlic onion pepper chicken beef pork tofu noodle rice bean '
+         'soup stew curry salad bread cake cookie pie roast grill bake fry steam '
+         'spicy sweet sour salty smoky fresh creamy crispy lemon ginger chili '
+         'mushroom potato carrot cheese butter cream egg flour sugar honey').split()
+# filler vocabulary so that most terms are selective, like real text
+FILLER = ['w{}'.format(i) for i in range(20000)]
+
+
+def _seed(count, rnd, batch=10000):
+    author = add_user('bench@example.com', 'bench')
+    table = Recipe.__table__
+    for start in range(0, count, batch):
+        rows = [dict(author_id=author.id, serving=1,
+                     title=' '.join(rnd.sample(WORDS, 3)),
+                     body=' '.join([rnd.choice(WORDS) for _ in range(5)] +
+                                   [rnd.choice(FILLER) for _ in range(35)]))
+                for _ in range(min(batch, count - start))]
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+
+def _time(fn, queries):
+    latencies = []
+    for q in queries:
+        start = time.time()
+        fn(q)
+        latencies.append(time.time() - start)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000
+
+
+def run(sizes=(100000, 1000000), queries=20):
+    rnd = random.Random(0)
+    for size in sizes:
+        with bench_app() as app:
+            with app.app_context():
+                _seed(size, rnd)
+                start = time.time()
+                search_index.rebuild()
+                build = time.time() - start
+                terms = ['{} {}'.format(rnd.choice(WORDS), rnd.choice(FILLER)) for _ in range(queries)]
+                fts = _time(lambda q: search_index.search(q, 1, 10).items, terms)
+                like = _time(lambda q: search_index._like(q, 1, 10).items, terms)
+                print('{:>9} recipes  index built in {:.1f}s  '
+                      'fts p50 {:.1f}ms max {:.1f}ms  like p50 {:.1f}ms max {:.1f}ms'.format(
+                          size, build, fts[0], fts[1], like[0], like[1]))
@@ -0,0 +1,89 @@
+"""
+A local SMTP server that accepts and counts every message, for testing and
+benchmarking mail delivery without a real relay.
+"""
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        # what a TCP + TLS handshake to a remote relay costs
+        time.sleep(sink.connect_delay)
+        self._reply('220 sink ESMTP')
+        delivered = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.wfile.write(b'250-sink\r\n250 AUTH PLAIN LOGIN\r\n')
+            elif verb == 'AUTH':
+                self._reply('235 authenticated')
+            elif verb == 'DATA':
+                self._reply('354 go ahead')
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if line in (b'.\r\n', b''):
+                        break
+                    data.append(line)
+                with sink.lock:
+                    sink.messages.append(b''.join(data))
+                self._reply('250 queued')
+                delivered += 1
+                if sink.drop_after and delivered >= sink.drop_after:
+                    # a relay hanging up on a long lived connection
+                    return
+            elif verb == 'MAIL' and sink.close_after and delivered >= sink.close_after:
+                # a relay shutting down answers the next command with 421
+                self._reply('421 closing connection')
+                return
+            elif verb == 'QUIT':
+                self._reply('221 bye')
+                return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self._reply('250 ok')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # the thread per message sender connects all at once
+    request_queue_size = 1024
+
+
+class SMTPSink(object):
+    """
+    Listens on 127.0.0.1:``port`` (0 picks a free one) until stop().
+    ``connect_delay`` seconds are spent before greeting each connection, and
+    the connection is dropped after ``drop_after`` messages if set, or
+    closed with a 421 reply to the next message after ``close_after``.
+    """
+
+    def __init__(self, port=0, connect_delay=0.0, drop_after=None, close_after=None):
+        self.connect_delay = connect_delay
+        self.drop_after = drop_after
+        self.close_after = close_after
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+        self._server = _Server(('127.0.0.1', port), _Handler)
+        self._server.sink = self
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,131 @@
+"""
+The in-memory follow and membership graphs: load time and suggestions
+against the SQL they replace on a seeded database, then memory, build time
+and latency of synthetic graphs up to a million users and 50M follows.
+"""
+import time
+
+import sqlalchemy as sa
+from flask_sqlalchemy import get_debug_queries
+
+from app import db, social_graph
+from app.models import Follow
+from app.seeding import Seeder
+from app.social_graph import build_graph, _apply, _merge, _row, _gather, _top, FOLLOWING, GROUPS
+from . import bench_app
+
+SUGGEST_SQL = sa.text("""
+SELECT f2.followed_id, count(*) AS n FROM follows f1
+JOIN follows f2 ON f2.follower_id = f1.followed_id
+WHERE f1.follower_id = :user AND f1.followed_id != :user AND f2.followed_id != :user
+AND f2.followed_id NOT IN (SELECT followed_id FROM follows WHERE follower_id = :user)
+GROUP BY f2.followed_id ORDER BY n DESC, f2.followed_id LIMIT 10
+""")
+
+
+def _time(fn, repeat):
+    """(mean ms, 99th percentile ms) of ``repeat`` calls."""
+    timings = []
+    for i in range(repeat):
+        start = time.time()
+        fn(i)
+        timings.append((time.time() - start) * 1000)
+    timings.sort()
+    return sum(timings) / repeat, timings[min(repeat - 1, int(repeat * 0.99))]
+
+
+def _synthetic(users, edges, groups, memberships, seed=0):
+    """Follows and memberships where a few users and groups are far more popular than the rest."""
+    import numpy as np
+
+    rs = np.random.RandomState(seed)
+    follower = rs.randint(1, users + 1, edges).astype(np.int64)
+    # cubing uniform draws skews the followed ids towards 1, the celebrities
+    followed = rs.random_sample(edges)
+    followed **= 3
+    followed *= users
+    followed = followed.astype(np.int64) + 1
+    member = rs.randint(1, users + 1, memberships).astype(np.int64)
+    group = (rs.random_sample(memberships) ** 2 * groups).astype(np.int64) + 1
+    return follower, followed, member, group
+
+
+def run_seeded(users=10000, follows=200000, repeat=50):
+    import numpy as np
+
+    with bench_app() as app:
+        with app.app_context():
+            Seeder(0).run(dict(users=users, follows=follows, groups=users // 50, group_members=users * 3),
+                          report=lambda line: None)
+            start = time.time()
+            social_graph.load()
+            print('load {} follows from the database: {:.0f}ms'.format(
+                social_graph.size[0], (time.time() - start) * 1000))
+            ids = np.random.RandomState(1).randint(1, users + 1, repeat).tolist()
+            queries = len(get_debug_queries())
+            elapsed, p99 = _time(lambda i: db.session.execute(SUGGEST_SQL, dict(user=ids[i])).fetchall(), repeat)
+            print('{:<28} {:>8.2f}ms p99 {:>8.2f}ms {:>4.0f} queries'.format(
+                'people you may know, SQL', elapsed, p99, (len(get_debug_queries()) - queries) / float(repeat)))
+            queries = len(get_debug_queries())
+            elapsed, p99 = _time(lambda i: social_graph.suggest_people(ids[i]), repeat)
+            print('{:<28} {:>8.2f}ms p99 {:>8.2f}ms {:>4.0f} queries'.format(
+                'people you may know, graph', elapsed, p99, (len(get_debug_queries()) - queries) / float(repeat)))
+            sql = db.session.execute(SUGGEST_SQL, dict(user=ids[0])).fetchall()
+            print('same suggestions: {}'.format(
+                [tuple(row) for row in sql] == social_graph.suggest_people(ids[0], len(sql))))
+            print('{} follows in the table'.format(Follow.query.count()))
+
+
+def run(users=1000000, edges=50000000, repeat=200, seeded=True):
+    import numpy as np
+
+    if seeded:
+        run_seeded()
+    groups, memberships = users // 100, users * 3
+    start = time.time()
+    arrays = _synthetic(users, edges, groups, memberships)
+    generated = time.time() - start
+    start = time.time()
+    snapshot = build_graph(*arrays)
+    built = time.time() - start
+    del arrays
+    follows, nbytes = len(snapshot[FOLLOWING][1]), sum(a.nbytes for k in (FOLLOWING, 'followers', GROUPS, 'members')
+                                                        for a in snapshot[k])
+    print('{} users, {} distinct follows, {} memberships: built in {:.1f}s ({:.1f}s to generate), {:.0f} MB'.format(
+        users, follows, len(snapshot[GROUPS][1]), built, generated, nbytes / 2.0 ** 20))
+
+    ids = np.random.RandomState(1).randint(1, users + 1, repeat).tolist()
+
+    def people(user, fanout=1000):
+        followed = _row(snapshot, FOLLOWING, user)
+        candidates = _gather(snapshot, FOLLOWING, followed, fanout)
+        found, counts = np.unique(candidates, return_counts=True)
+        keep = (found != user) & ~np.isin(found, followed, assume_unique=True)
+        return _top(found[keep], counts[keep], 10)
+
+    def groups_of_followed(user):
+        found, counts = np.unique(_gather(snapshot, GROUPS, _row(snapshot, FOLLOWING, user)), return_counts=True)
+        keep = ~np.isin(found, _row(snapshot, GROUPS, user), assume_unique=True)
+        return _top(found[keep], counts[keep], 10)
+
+    def mutual(user):
+        return np.intersect1d(_row(snapshot, FOLLOWING, user), _row(snapshot, 'followers', user),
+                              assume_unique=True)
+
+    for name, fn in (('mutual follows', lambda i: mutual(ids[i])),
+                     ('people you may know', lambda i: people(ids[i])),
+                     ('group suggestions', lambda i: groups_of_followed(ids[i]))):
+        elapsed, p99 = _time(fn, repeat)
+        print('{:<28} {:>8.2f}ms p99 {:>8.2f}ms'.format(name, elapsed, p99))
+
+    pending = 1000
+    rs = np.random.RandomState(2)
+    edits = list(zip(rs.randint(1, users + 1, pending).tolist(), rs.randint(1, users + 1, pending).tolist()))
+    start = time.time()
+    for follower, followed in edits:
+        snapshot = _apply(snapshot, FOLLOWING, follower, followed, True)
+    applied = (time.time() - start) / pending * 1000
+    start = time.time()
+    _merge(snapshot[FOLLOWING], snapshot['pending'][FOLLOWING])
+    print('follow applied in {:.3f}ms, {} pending rows merged in {:.0f}ms'.format(
+        applied, pending, (time.time() - start) * 1000))
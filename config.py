@@ -7,7 +7,9 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'hard to guess string'
     SSL_DISABLE = False
     SQLALCHEMY_COMMIT_ON_TEARDOWN = True
-    SQLALCHEMY_RECORD_QUERIES = True
+    # every statement of every request kept in memory, request metrics
+    # sample statements instead
+    SQLALCHEMY_RECORD_QUERIES = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     # mail
     MAIL_SERVER = 'smtp.gmail.com'
@@ -24,6 +26,52 @@ class Config:
     COOKZILLA_FOLLOWERS_PER_PAGE = 50
     COOKZILLA_COMMENTS_PER_PAGE = 10
     COOKZILLA_SLOW_DB_QUERY_TIME = 0.5
+    # request metrics per endpoint, served at /metrics and /performance
+    COOKZILLA_METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    COOKZILLA_METRICS_SAMPLE_RATE = 0.0  # fraction of requests whose statements are kept
+    COOKZILLA_METRICS_SLOW_QUERIES = 10  # slowest sampled statements listed per endpoint
+    COOKZILLA_METRICS_ALLOWED_IPS = []  # may scrape /metrics without logging in
+    COOKZILLA_METRICS_TOKEN = os.environ.get('COOKZILLA_METRICS_TOKEN')  # bearer token accepted by /metrics
+    # log events are buffered per worker and upserted in batches
+    COOKZILLA_LOG_FLUSH_INTERVAL = 5  # seconds, 0 flushes inline once full
+    COOKZILLA_LOG_FLUSH_SIZE = 500
+    COOKZILLA_LOG_FLUSH_RETRIES = 5  # failed flushes of a batch before it is dropped
+    # followed feed: ranked recipe ids cached per user
+    COOKZILLA_FEED_SIZE = 1000
+    COOKZILLA_FEED_TTL = 300  # seconds
+    COOKZILLA_FEED_CACHE_USERS = 1000
+    COOKZILLA_FEED_TABLE = False  # share feeds between workers through the feeds table
+    # GET and HEAD requests never flush or commit, last_seen is written in batches
+    COOKZILLA_READ_ONLY_GETS = True
+    COOKZILLA_LAST_SEEN_INTERVAL = 60  # seconds between two writes of one user
+    COOKZILLA_LAST_SEEN_FLUSH_INTERVAL = 10  # seconds, 0 keeps them queued until flush()
+    # rendered pages for anonymous users, validated with ETags
+    COOKZILLA_RESPONSE_CACHE_SIZE = 500  # pages per worker, 0 only answers If-None-Match
+    COOKZILLA_RESPONSE_CACHE_TTL = 60  # seconds
+    # roles and tags are cached per worker, reloaded after edits or this many seconds
+    COOKZILLA_REFERENCE_TTL = 300
+    # the logged in user is loaded from a per worker snapshot, kept this long
+    COOKZILLA_USER_CACHE_TTL = 30  # seconds
+    COOKZILLA_USER_CACHE_SIZE = 5000  # users per worker
+    # list totals that have no counter column are counted at most this often
+    COOKZILLA_COUNT_TTL = 60  # seconds
+    COOKZILLA_COUNT_CACHE_SIZE = 1000  # distinct lists per worker
+    # recipe photos are resized in this many processes, None for one per core
+    COOKZILLA_IMAGE_WORKERS = None
+    COOKZILLA_IMAGE_QUALITY = 85
+    COOKZILLA_IMAGE_MISSING_TTL = 60  # seconds before an unprocessed photo is looked for again
+    # "you might also like", rebuilt offline with manage.py related_recipes
+    COOKZILLA_RELATED_RECIPES = 6  # kept per recipe
+    COOKZILLA_RELATED_TAG_WEIGHT = 0.5  # of shared tags against co-browsing
+    # outgoing mail is queued and sent over persistent SMTP connections
+    COOKZILLA_MAIL_WORKERS = 2
+    COOKZILLA_MAIL_QUEUE_SIZE = 1000
+    COOKZILLA_MAIL_BATCH = 50  # messages per connection checkout
+    COOKZILLA_MAIL_IDLE_TIMEOUT = 30  # seconds before an idle connection is closed
+    COOKZILLA_MAIL_ENQUEUE_TIMEOUT = 5  # seconds send_email() waits on a full queue
+    # werkzeug hash method and cost; older hashes are upgraded on login
+    COOKZILLA_PASSWORD_METHOD = 'pbkdf2:sha256:50000'
+    COOKZILLA_PASSWORD_WORKERS = None  # hashing processes, None for one per core
     # the number of Ingredient
     INGREDIENT_NUMBER = 5
     # unit
@@ -40,6 +88,29 @@ class Config:
                              'liter(l)': 2.381,
                              'deciliter(dl)': 23.81,
                              'milliliter(ml)': 2381}
+    # the units of INGREDIENT_CONVERSION that measure volume, by the volume of a kilogram of water
+    INGREDIENT_VOLUME_UNITS = ['pint(pt)', 'fluid ounce(fl oz)', 'cup', 'tablespoon', 'dessert spoon',
+                               'teaspoon', 'liter(l)', 'deciliter(dl)', 'milliliter(ml)']
+    COOKZILLA_MAX_SERVINGS = 1000
+    COOKZILLA_SHOPPING_LIST_MAX_RECIPES = 10000  # recipes per shopping list request
+    COOKZILLA_IMPORT_MAX_RECIPES = 1000  # recipes per /recipes/import request
+    COOKZILLA_INGREDIENT_INDEX_TTL = 600  # seconds before reloading the ingredient index
+    COOKZILLA_INGREDIENT_INDEX_PENDING = 1000  # changed recipes kept aside before merging them in
+    COOKZILLA_FACETS_TTL = 600  # seconds before reloading the tag, serving and rating bitmaps
+    # upcoming events of a user's groups, at /events/calendar and in the navbar
+    COOKZILLA_EVENT_DURATION = 120  # minutes an event is taken to last when looking for overlaps
+    COOKZILLA_CALENDAR_DAYS = 30  # default window of the calendar
+    COOKZILLA_CALENDAR_MAX_DAYS = 366
+    COOKZILLA_CALENDAR_SUMMARY = 5  # next events in the navbar, cached per user
+    COOKZILLA_CALENDAR_SUMMARY_TTL = 300  # seconds
+    COOKZILLA_CALENDAR_CACHE_USERS = 5000  # users per worker
+    COOKZILLA_ATTENDEES_SHOWN = 50  # members listed per RSVP status on an event page
+    # follow and membership graphs kept in memory for suggestions
+    COOKZILLA_SOCIAL_GRAPH_TTL = 3600  # seconds before reloading them in the background
+    COOKZILLA_SOCIAL_GRAPH_PENDING = 1000  # changed rows kept aside before merging them in
+    COOKZILLA_SOCIAL_GRAPH_FANOUT = 1000  # follows of each followed user counted per suggestion
+    COOKZILLA_SOCIAL_GRAPH_PRELOAD = True  # load as the worker starts instead of on first use
+    COOKZILLA_SUGGESTIONS = 10  # people and groups suggested
     # tags
     RECIPE_TAGS = ['Italian', 'Chinese', 'American', 'French',
                    'Vegan', 'Soup', 'Spicy']
@@ -48,6 +119,7 @@ class Config:
     CLIENT_SECRET = 'fadb6addc1f2d5f8e09e4bf7dc5780e5071b9de6'
     # search
     SEARCH_RESULTS = 10
+    COOKZILLA_SEARCH_RECENCY_BOOST = 0.0  # added to the relevance score, decays per day of age
     # WHOOSHEE_DIR = os.path.join(basedir, 'search.db')
     # WHOSHEE_MIN_STRING_LEN = 3
     # WHOOSHEE_WRITER_TIMEOUT = 2
@@ -69,6 +141,13 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
                               'sqlite:///' + os.path.join(basedir, 'data-test.sqlite')
     WTF_CSRF_ENABLED = False
+    SQLALCHEMY_RECORD_QUERIES = True
+    COOKZILLA_LOG_FLUSH_INTERVAL = 0
+    COOKZILLA_LAST_SEEN_FLUSH_INTERVAL = 0
+    COOKZILLA_IMAGE_WORKERS = 0
+    COOKZILLA_PASSWORD_METHOD = 'pbkdf2:sha256:1000'
+    COOKZILLA_PASSWORD_WORKERS = 0
+    COOKZILLA_SOCIAL_GRAPH_PRELOAD = False
 
 
 class ProductionConfig(Config):
@@ -69,6 +69,166 @@ def profile(length=25, profile_dir=None):
     app.run()
 
 
+@manager.option('--scale', dest='scale', default=1.0, type=float, help='multiple of the small seed preset')
+@manager.option('-c', '--clients', dest='clients', default=4, type=int)
+@manager.option('-n', '--requests', dest='requests', default=50, type=int, help='per client and scenario')
+@manager.option('--scenarios', dest='scenarios', default=None, help='comma separated, all by default')
+@manager.option('--baseline', dest='baseline', default=None, help='JSON file to compare against')
+@manager.option('--save', dest='save', action='store_true', help='write the results as the new baseline')
+@manager.option('--tolerance', dest='tolerance', default=0.2, type=float)
+def bench(scale, clients, requests, scenarios, baseline, save, tolerance):
+    """Measure the main pages under concurrent clients and flag regressions against a baseline."""
+    from benchmarks import endpoints
+    regressions = endpoints.run(scale, clients, requests, scenarios.split(',') if scenarios else None,
+                                baseline or endpoints.DEFAULT_BASELINE, save, tolerance)
+    if regressions:
+        raise SystemExit(1)
+
+
+@manager.command
+def bench_logs(requests=50):
+    """Compare commits per request with and without log buffering."""
+    from benchmarks import logs
+    logs.run(int(requests))
+
+
+@manager.command
+def bench_reads(threads=8, requests=50):
+    """Compare GET throughput with per-request pings and with read-only GETs."""
+    from benchmarks import reads
+    reads.run(int(threads), int(requests))
+
+
+@manager.command
+def bench_pagination(pages='1,5000', repeat=5):
+    """Time shallow and deep pages with OFFSET and with keyset pagination."""
+    from benchmarks import pagination
+    pagination.run([int(n) for n in pages.split(',')], int(repeat))
+
+
+@manager.command
+def bench_images(images=10000, workers=None):
+    """Time resizing a backlog of uploads on one process and on every core."""
+    from benchmarks import images as bench
+    bench.run(int(images), int(workers) if workers else None)
+
+
+@manager.command
+def bench_mail(messages=500, connect_delay=0.05):
+    """Deliver a burst of mail to a local SMTP sink with and without the dispatcher."""
+    from benchmarks import mail
+    mail.run(int(messages), float(connect_delay))
+
+
+@manager.command
+def bench_passwords(logins=200, methods=None):
+    """Time password verification per core for each hashing cost."""
+    from benchmarks import passwords
+    passwords.run(int(logins), methods.split(',') if methods else passwords.METHODS)
+
+
+@manager.command
+def bench_search(sizes='100000,1000000', queries=20):
+    """Time full-text search against the LIKE scan at the given sizes."""
+    from benchmarks import search
+    search.run([int(n) for n in sizes.split(',')], int(queries))
+
+
+@manager.command
+def bench_recommendations(recipes=1000000, logs=10000000):
+    """Time scoring related recipes on synthetic matrices and end to end on a seeded database."""
+    from benchmarks import recommendations
+    recommendations.run(int(recipes), int(logs))
+
+
+@manager.command
+def bench_ingredients(recipes=20000, ingredients=100000):
+    """Time summing shopping lists of thousands of recipes against a per row loop."""
+    from benchmarks import ingredients as bench
+    bench.run(int(recipes), int(ingredients))
+
+
+@manager.command
+def bench_ingredient_index(recipes=200000, ingredients=1000000):
+    """Time ingredient queries on the inverted index against SQL."""
+    from benchmarks import ingredient_index
+    ingredient_index.run(int(recipes), int(ingredients))
+
+
+@manager.command
+def bench_facets(recipes=200000, recipe_tags=400000):
+    """Time faceted tag queries on the bitmaps against SQL."""
+    from benchmarks import facets
+    facets.run(int(recipes), int(recipe_tags))
+
+
+@manager.command
+def bench_event_calendar(events=20000, group_members=50000):
+    """Time a user's upcoming events through the calendar against the per-membership loop."""
+    from benchmarks import event_calendar
+    event_calendar.run(events=int(events), group_members=int(group_members))
+
+
+@manager.command
+def bench_rsvps(writes=500):
+    """Time RSVP upserts and event pages with thousands of RSVPs."""
+    from benchmarks import rsvps
+    rsvps.run(writes=int(writes))
+
+
+@manager.command
+def bench_social_graph(users=1000000, edges=50000000):
+    """Time suggestions on the in-memory follow graph, and its memory at a million users."""
+    from benchmarks import social_graph
+    social_graph.run(users=int(users), edges=int(edges))
+
+
+@manager.command
+def related_recipes(hours=None):
+    """Rebuild "you might also like", or refresh the recipes active in the last hours."""
+    from datetime import datetime, timedelta
+    from app import recommender
+    if hours:
+        stats = recommender.refresh(datetime.utcnow() - timedelta(hours=float(hours)))
+    else:
+        stats = recommender.rebuild()
+    print('{recipes} recipes, {pairs} pairs in {total:.1f}s (load {load:.1f}s, '
+          'score {compute:.1f}s, write {write:.1f}s)'.format(**stats))
+
+
+@manager.command
+def rebuild_search():
+    """Rebuild the full-text recipe search index."""
+    from app import search_index
+    print('indexed %d recipes' % search_index.rebuild())
+
+
+@manager.command
+def resize_photos():
+    """Make the missing list and detail derivatives of uploaded recipe photos."""
+    from app import image_pipeline
+    from app.images import VARIANTS, derivative_name
+    prefix = app.static_url_path + '/upload/'
+    filenames = [photos[len(prefix):] for photos, in db.session.query(Recipe.photos)
+                 if photos and photos.startswith(prefix)]
+    filenames = [f for f in filenames if os.path.exists(os.path.join(image_pipeline.upload_folder, f)) and
+                 not all(os.path.exists(os.path.join(image_pipeline.upload_folder, derivative_name(f, v, 2)))
+                         for v in VARIANTS)]
+    for count, written in enumerate(image_pipeline.map(filenames), 1):
+        if count % 1000 == 0:
+            print('%d / %d photos' % (count, len(filenames)))
+    image_pipeline.shutdown()
+    print('resized %d photos' % len(filenames))
+
+
+@manager.command
+def reconcile_counters():
+    """Recompute the denormalized counter columns from the child tables."""
+    from app.counters import reconcile_counters
+    for column, fixed in sorted(reconcile_counters(db.engine).items()):
+        print('{:<22} {:>8} rows fixed'.format(column, fixed))
+
+
 @manager.command
 def deploy():
     """Run deployment tasks."""
@@ -92,29 +252,39 @@ def deploy():
     db.session.add(u2)
     db.session.add(u3)
     db.session.commit()
-    User.generate_fake()
-    print("user good")
+    print("users good")
 
-    Recipe.generate_fake()
-    Ingredient.generate_fake()
-    Tag.generate_fake()
-    print("recipe good")
-    Review.generate_fake()
-    print("review good")
+    # fake
+    from app.seeding import Seeder
+    Seeder().run('small')
+    print("fake data ready")
 
-    # create self-follows for all users
-    User.add_self_follows()
-    print("self follow")
 
-    # group
-    Group.generate_fake()
-    print("group ready")
+@manager.option('-p', '--preset', dest='preset', default='small',
+                help='small, users-100k or logs-10m')
+@manager.option('-s', '--seed', dest='seed', default=0, type=int)
+@manager.option('--save', dest='save', default=None, help='write a snapshot file afterwards')
+def seed(preset, seed, save):
+    """Bulk seed the database with deterministic fake data."""
+    from app.seeding import Seeder, save_snapshot
+    Seeder(seed).run(preset)
+    if save:
+        save_snapshot(save)
+        print('snapshot saved to %s' % save)
 
-    Event.generate_fake()
-    print("event ready")
 
-    Report.generate_fake()
-    print("report ready")
+@manager.command
+def snapshot(path):
+    """Save the database to a snapshot file."""
+    from app.seeding import save_snapshot
+    save_snapshot(path)
+
+
+@manager.command
+def restore(path):
+    """Replace the database with a snapshot file."""
+    from app.seeding import load_snapshot
+    load_snapshot(path)
 
 
 if __name__ == '__main__':
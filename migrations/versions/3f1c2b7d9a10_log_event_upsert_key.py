@@ -0,0 +1,33 @@
+"""log event upsert key
+
+Revision ID: 3f1c2b7d9a10
+Revises: fdb71bb9267b
+Create Date: 2026-10-18 09:12:41.203518
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2b7d9a10'
+down_revision = 'fdb71bb9267b'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# rows of the same key as log_events, NULLs never collide in a unique index
+SAME_KEY = ('FROM log_events d WHERE d.user_id = log_events.user_id AND d.op = log_events.op '
+            'AND d.recipe_id = log_events.recipe_id')
+
+
+def upgrade():
+    # the read-then-insert logging could race into duplicate keys: fold them
+    # into the first row of each key before the index forbids them
+    op.execute('UPDATE log_events SET ct = (SELECT SUM(d.ct) {0}), logged_at = (SELECT MAX(d.logged_at) {0}) '
+               'WHERE EXISTS (SELECT 1 {0} AND d.id > log_events.id) '
+               'AND NOT EXISTS (SELECT 1 {0} AND d.id < log_events.id)'.format(SAME_KEY))
+    op.execute('DELETE FROM log_events WHERE EXISTS (SELECT 1 {0} AND d.id < log_events.id)'.format(SAME_KEY))
+    op.create_index('ix_log_events_user_op_recipe', 'log_events', ['user_id', 'op', 'recipe_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_log_events_user_op_recipe', table_name='log_events')
@@ -0,0 +1,34 @@
+"""recipe search
+
+Revision ID: 5c0d83e1f4b2
+Revises: a41e6f0c5d27
+Create Date: 2026-10-18 14:05:52.730186
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5c0d83e1f4b2'
+down_revision = 'a41e6f0c5d27'
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.search import SQLITE_CREATE, SQLITE_DROP, SQLITE_INDEX, POSTGRES_CREATE, POSTGRES_DROP, POSTGRES_INDEX
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(SQLITE_CREATE)
+        op.execute(SQLITE_INDEX.format(where=''))
+    elif dialect == 'postgresql':
+        op.execute(POSTGRES_CREATE)
+        op.execute(POSTGRES_INDEX.format(where=''))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(SQLITE_DROP)
+    elif dialect == 'postgresql':
+        op.execute(POSTGRES_DROP)
@@ -0,0 +1,28 @@
+"""feeds
+
+Revision ID: a41e6f0c5d27
+Revises: 3f1c2b7d9a10
+Create Date: 2026-10-18 11:40:07.518224
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a41e6f0c5d27'
+down_revision = '3f1c2b7d9a10'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('feeds',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('recipe_ids', sa.Text(), nullable=True),
+    sa.Column('computed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('feeds')
@@ -0,0 +1,24 @@
+"""events (group_id, timestamp) index for the calendar
+
+Revision ID: a94c7e21d5f8
+Revises: f3b8d26a7c41
+Create Date: 2026-10-18 21:42:09.318274
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a94c7e21d5f8'
+down_revision = 'f3b8d26a7c41'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('ix_events_group_id_timestamp', 'events', ['group_id', 'timestamp'], unique=False)
+    op.drop_index(op.f('ix_events_group_id'), table_name='events')
+
+
+def downgrade():
+    op.create_index(op.f('ix_events_group_id'), 'events', ['group_id'], unique=False)
+    op.drop_index('ix_events_group_id_timestamp', table_name='events')
@@ -0,0 +1,26 @@
+"""recipe child indexes
+
+Revision ID: b7e25a9c3d18
+Revises: 5c0d83e1f4b2
+Create Date: 2026-10-18 16:22:19.044310
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b7e25a9c3d18'
+down_revision = '5c0d83e1f4b2'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index(op.f('ix_ingredients_recipe_id'), 'ingredients', ['recipe_id'], unique=False)
+    op.create_index(op.f('ix_recipe_tags_recipe_id'), 'recipe_tags', ['recipe_id'], unique=False)
+    op.create_index(op.f('ix_recipe_tags_tag_id'), 'recipe_tags', ['tag_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_recipe_tags_tag_id'), table_name='recipe_tags')
+    op.drop_index(op.f('ix_recipe_tags_recipe_id'), table_name='recipe_tags')
+    op.drop_index(op.f('ix_ingredients_recipe_id'), table_name='ingredients')
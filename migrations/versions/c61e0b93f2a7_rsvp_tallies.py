@@ -0,0 +1,38 @@
+"""going / not going / maybe tallies on events
+
+Revision ID: c61e0b93f2a7
+Revises: a94c7e21d5f8
+Create Date: 2026-10-18 22:31:55.204716
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c61e0b93f2a7'
+down_revision = 'a94c7e21d5f8'
+
+from alembic import op
+import sqlalchemy as sa
+
+# (column, status)
+TALLIES = [
+    ('going_count', 1),
+    ('not_going_count', 0),
+    ('maybe_count', 2),
+]
+
+
+def upgrade():
+    # anything but going or not going was "not sure", it is maybe from now on
+    op.execute('UPDATE rsvps SET status = 2 WHERE status IS NULL OR status NOT IN (0, 1)')
+    op.create_index('ix_rsvps_event_id_status', 'rsvps', ['event_id', 'status'], unique=False)
+    for column, status in TALLIES:
+        op.add_column('events', sa.Column(column, sa.Integer(), server_default='0', nullable=False))
+        op.execute('UPDATE events SET {0} = (SELECT count(*) FROM rsvps '
+                   'WHERE rsvps.event_id = events.id AND rsvps.status = {1})'.format(column, status))
+
+
+def downgrade():
+    for column, status in reversed(TALLIES):
+        with op.batch_alter_table('events') as batch_op:
+            batch_op.drop_column(column)
+    op.drop_index('ix_rsvps_event_id_status', table_name='rsvps')
@@ -0,0 +1,54 @@
+"""counter caches
+
+Revision ID: d2f84a6b1c73
+Revises: b7e25a9c3d18
+Create Date: 2026-10-18 17:05:41.518902
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd2f84a6b1c73'
+down_revision = 'b7e25a9c3d18'
+
+from alembic import op
+import sqlalchemy as sa
+
+# (table, column, child table, child foreign key)
+COUNTERS = [
+    ('users', 'follower_count', 'follows', 'followed_id'),
+    ('users', 'followed_count', 'follows', 'follower_id'),
+    ('users', 'recipe_count', 'recipes', 'author_id'),
+    ('users', 'review_count', 'reviews', 'author_id'),
+    ('users', 'group_count', 'group_members', 'member_id'),
+    ('recipes', 'review_count', 'reviews', 'recipe_id'),
+    ('groups', 'member_count', 'group_members', 'group_id'),
+    ('groups', 'event_count', 'events', 'group_id'),
+    ('events', 'report_count', 'reports', 'event_id'),
+]
+
+INDEXES = [
+    ('follows', 'followed_id'),
+    ('recipes', 'author_id'),
+    ('reviews', 'author_id'),
+    ('reviews', 'recipe_id'),
+    ('group_members', 'group_id'),
+    ('events', 'group_id'),
+    ('reports', 'event_id'),
+]
+
+
+def upgrade():
+    for table, column in INDEXES:
+        op.create_index(op.f('ix_{}_{}'.format(table, column)), table, [column], unique=False)
+    for table, column, child, key in COUNTERS:
+        op.add_column(table, sa.Column(column, sa.Integer(), server_default='0', nullable=False))
+        op.execute('UPDATE {0} SET {1} = (SELECT count(*) FROM {2} WHERE {2}.{3} = {0}.id)'.format(
+            table, column, child, key))
+
+
+def downgrade():
+    for table, column, child, key in reversed(COUNTERS):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column(column)
+    for table, column in reversed(INDEXES):
+        op.drop_index(op.f('ix_{}_{}'.format(table, column)), table_name=table)
@@ -0,0 +1,22 @@
+"""index log_events.logged_at for keyset pagination
+
+Revision ID: e5a1c9f04b27
+Revises: d2f84a6b1c73
+Create Date: 2026-10-18 18:42:10.204117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1c9f04b27'
+down_revision = 'd2f84a6b1c73'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index(op.f('ix_log_events_logged_at'), 'log_events', ['logged_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_log_events_logged_at'), table_name='log_events')
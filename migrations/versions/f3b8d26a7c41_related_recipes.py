@@ -0,0 +1,30 @@
+"""related_recipes table of precomputed recommendations
+
+Revision ID: f3b8d26a7c41
+Revises: e5a1c9f04b27
+Create Date: 2026-10-18 19:20:37.512903
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d26a7c41'
+down_revision = 'e5a1c9f04b27'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('related_recipes',
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.SmallInteger(), autoincrement=False, nullable=False),
+    sa.Column('related_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.id'], ),
+    sa.ForeignKeyConstraint(['related_id'], ['recipes.id'], ),
+    sa.PrimaryKeyConstraint('recipe_id', 'rank')
+    )
+
+
+def downgrade():
+    op.drop_table('related_recipes')
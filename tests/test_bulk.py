@@ -0,0 +1,112 @@
+import io
+import json
+import shutil
+import tempfile
+import os
+import unittest
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db, ingredient_index
+from app.bulk import create_recipes
+from app.exceptions import ValidationError
+from app.models import User, Role, Recipe, Tag, Ingredient
+
+
+class BulkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        Tag.insert_tags()
+        self.user = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        self.soup = Recipe(title='soup', author=self.user)
+        db.session.add_all([self.user, self.soup])
+        db.session.commit()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_create_recipes(self):
+        vegan, soup_tag = Tag.query.filter_by(tag='Vegan').first().id, Tag.query.filter_by(tag='Soup').first().id
+        ingredient_index.find(['leek'])
+        entries = [
+            dict(title='leek soup', serving=4, links=[self.soup.id, 9999], tags=[vegan, soup_tag, 9999],
+                 ingredients=[dict(name='leek', unit='gram(g)', quantity='300'),
+                              dict(name='water', unit='liter(l)', quantity=1)]),
+            dict(title='toast', ingredients=[dict(name='bread', quantity=None)])]
+        queries = len(get_debug_queries())
+        created = create_recipes(self.user, entries)
+        statements = [q.statement for q in get_debug_queries()[queries:]]
+        # one lookup per kind of id, one executemany per kind of row
+        for table in ('recipes', 'tags'):
+            self.assertTrue(len([s for s in statements if s.startswith('SELECT {}.id '.format(table))]) == 1)
+        for table in ('ingredients', 'relates', 'recipe_tags'):
+            self.assertTrue(len([s for s in statements if s.startswith('INSERT INTO {} '.format(table))]) == 1)
+
+        leek, toast = [Recipe.query.get(r.id) for r in created]
+        self.assertTrue([r.id for r in leek.links] == [self.soup.id])
+        self.assertTrue(sorted(t.id for t in leek.tags) == sorted([vegan, soup_tag]))
+        self.assertTrue(Ingredient.query.filter_by(recipe=leek, name='leek').first().quantity == 300)
+        self.assertTrue((toast.serving, toast.tags.count(), toast.ingredients.count()) == (1, 0, 1))
+        self.assertTrue(User.query.get(self.user.id).recipe_count == 3)
+        # commit listeners see the rows written past the session
+        self.assertTrue(ingredient_index.recipes_with('leek').tolist() == [leek.id])
+
+        with self.assertRaises(ValidationError):
+            create_recipes(self.user, [dict(title='fine'), dict(title='')])
+        self.assertTrue(Recipe.query.filter_by(title='fine').count() == 0)
+        for entry in (dict(title=5), dict(title='x', links='12'), dict(title='x', tags=3),
+                      dict(title='x', body=['b']), dict(title='x', ingredients=[dict(name=1)]),
+                      dict(title='x', ingredients=[dict(name='egg', unit=2)]), dict(title='x', ingredients='egg')):
+            with self.assertRaises(ValidationError):
+                create_recipes(self.user, [entry])
+
+    def test_import_and_form(self):
+        response = self.client.post('/recipes/import', data=json.dumps({'recipes': [{'title': 'x'}]}),
+                                    content_type='application/json')
+        self.assertTrue(response.status_code == 302)
+        self.client.post('/auth/login', data=dict(email='john@example.com', password='cat'))
+
+        response = self.client.post('/recipes/import', data=json.dumps({'recipes': [
+            {'title': 'pie', 'links': [self.soup.id], 'ingredients': [{'name': 'apple', 'quantity': 3}]},
+            {'title': 'tart'}]}), content_type='application/json')
+        self.assertTrue(response.status_code == 201)
+        ids = [r['id'] for r in json.loads(response.get_data(as_text=True))['recipes']]
+        self.assertTrue([r.title for r in Recipe.query.filter(Recipe.id.in_(ids)).order_by(Recipe.id)] ==
+                        ['pie', 'tart'])
+        response = self.client.post('/recipes/import', data=json.dumps({'recipes': [
+            {'title': 'cake', 'ingredients': [{'name': 'flour', 'quantity': 'lots'}]}]}),
+            content_type='application/json')
+        self.assertTrue(response.status_code == 400)
+        self.assertTrue(b'flour' in response.data)
+        response = self.client.post('/recipes/import', data=json.dumps({'recipes': [{'title': 5}]}),
+                                    content_type='application/json')
+        self.assertTrue(response.status_code == 400)
+
+        from PIL import Image
+        photo = io.BytesIO()
+        Image.new('RGB', (40, 30), 'orange').save(photo, 'JPEG')
+        static = tempfile.mkdtemp()
+        os.mkdir(os.path.join(static, 'upload'))
+        self.app.static_folder = static
+        try:
+            response = self.client.post('/recipes/create', data={
+                'title': 'chowder', 'serving': '2', 'body': 'hot',
+                'photo': (io.BytesIO(photo.getvalue()), 'chowder.jpg'),
+                'tags': [str(Tag.query.filter_by(tag='Soup').first().id)],
+                'links-0-link': 'http://localhost/recipes/{}'.format(self.soup.id),
+                'ingredients_optical-0-name': 'clam', 'ingredients_optical-0-unit': 'gram(g)',
+                'ingredients_optical-0-quantity': '200'})
+        finally:
+            shutil.rmtree(static)
+        self.assertTrue(response.status_code == 302)
+        chowder = Recipe.query.filter_by(title='chowder').first()
+        self.assertTrue([t.tag for t in chowder.tags] == ['Soup'])
+        self.assertTrue([r.id for r in chowder.links] == [self.soup.id])
+        self.assertTrue([i.name for i in chowder.ingredients] == ['clam'])
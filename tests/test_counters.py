@@ -0,0 +1,72 @@
+import unittest
+
+from app import create_app, db
+from app.counters import reconcile_counters
+from app.models import User, Role, Recipe, Review, Group, GroupMember, Event, Report
+
+
+class CounterCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_follows(self):
+        u1 = User(email='john@example.com', password='cat')
+        u2 = User(email='susan@example.org', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        # everybody follows themselves
+        self.assertTrue(u1.followed_count == 1 and u1.follower_count == 1)
+        u1.follow(u2)
+        db.session.commit()
+        self.assertTrue(u1.followed_count == 2)
+        self.assertTrue(u2.follower_count == 2)
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertTrue(u1.followed_count == 1)
+        self.assertTrue(u2.follower_count == 1)
+
+    def test_children(self):
+        u = User(email='john@example.com', password='cat')
+        r1 = Recipe(title='a', author=u)
+        r2 = Recipe(title='b', author=u)
+        g = Group(title='g', creator=u)
+        e = Event(title='e', group=g, creator=u)
+        review = Review(body='good', recipe=r1, author=u)
+        db.session.add_all([u, r1, r2, g, e, review, GroupMember(member=u, group=g),
+                            Report(body='fun', event=e, author=u)])
+        db.session.commit()
+        self.assertTrue(u.recipe_count == 2 and u.review_count == 1 and u.group_count == 1)
+        self.assertTrue(r1.review_count == 1 and r2.review_count == 0)
+        self.assertTrue(g.member_count == 1 and g.event_count == 1)
+        self.assertTrue(e.report_count == 1)
+        # moving a child updates both parents
+        review.recipe = r2
+        db.session.commit()
+        self.assertTrue(r1.review_count == 0 and r2.review_count == 1)
+        db.session.delete(review)
+        db.session.commit()
+        self.assertTrue(r2.review_count == 0 and u.review_count == 0)
+
+    def test_reconcile(self):
+        u = User(email='john@example.com', password='cat')
+        r = Recipe(title='a', author=u)
+        db.session.add_all([u, r, Review(body='good', recipe=r, author=u)])
+        db.session.commit()
+        self.assertTrue(set(reconcile_counters(db.engine).values()) == set([0]))
+        # bulk writes bypass the session events
+        Review.query.delete()
+        db.session.commit()
+        fixed = reconcile_counters(db.engine)
+        self.assertTrue(fixed['Recipe.review_count'] == 1)
+        self.assertTrue(fixed['User.review_count'] == 1)
+        db.session.expire_all()
+        self.assertTrue(r.review_count == 0)
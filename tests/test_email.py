@@ -0,0 +1,75 @@
+import unittest
+
+from flask_mail import Message
+
+from app import create_app, mail, mail_dispatcher
+from app.exceptions import MailQueueFull
+from benchmarks.smtp_sink import SMTPSink
+
+
+class MailDispatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sink = SMTPSink()
+
+    def tearDown(self):
+        mail_dispatcher.join(5)
+        self.app_context.pop()
+        self.sink.stop()
+
+    def _app(self, **config):
+        self.app = create_app('testing')
+        self.app.config.update(MAIL_SUPPRESS_SEND=False, MAIL_SERVER='127.0.0.1', MAIL_PORT=self.sink.port,
+                               MAIL_USE_TLS=False, **config)
+        mail.init_app(self.app)
+        mail_dispatcher.init_app(self.app)
+        mail_dispatcher.reset_stats()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def _message(self, i):
+        return Message('hello {}'.format(i), sender='cookzilla@example.com',
+                       recipients=['user{}@example.com'.format(i)], body='hi')
+
+    def test_burst(self):
+        self._app(COOKZILLA_MAIL_WORKERS=2)
+        for i in range(50):
+            mail_dispatcher.send(self._message(i))
+        self.assertTrue(mail_dispatcher.join(10))
+        self.assertTrue(len(self.sink.messages) == 50)
+        self.assertTrue(mail_dispatcher.sent == 50 and mail_dispatcher.failed == 0)
+        # one authenticated connection per worker, reused for every message
+        self.assertTrue(self.sink.connections <= 2 and mail_dispatcher.connections <= 2)
+
+    def test_reconnect(self):
+        self.sink.drop_after = 3
+        self._app(COOKZILLA_MAIL_WORKERS=1)
+        for i in range(10):
+            mail_dispatcher.send(self._message(i))
+        self.assertTrue(mail_dispatcher.join(10))
+        self.assertTrue(len(self.sink.messages) == 10 and mail_dispatcher.sent == 10)
+        self.assertTrue(self.sink.connections == 4)
+
+    def test_closing(self):
+        # a 421 is not a refusal: the message goes out on a new connection
+        self.sink.close_after = 3
+        self._app(COOKZILLA_MAIL_WORKERS=1)
+        for i in range(10):
+            mail_dispatcher.send(self._message(i))
+        self.assertTrue(mail_dispatcher.join(10))
+        self.assertTrue(len(self.sink.messages) == 10 and mail_dispatcher.failed == 0)
+        self.assertTrue(self.sink.connections == 4)
+
+    def test_backpressure(self):
+        self.sink.connect_delay = 0.5
+        self._app(COOKZILLA_MAIL_WORKERS=1, COOKZILLA_MAIL_QUEUE_SIZE=2,
+                  COOKZILLA_MAIL_ENQUEUE_TIMEOUT=0.05)
+        mail_dispatcher.send(self._message(0))
+        while mail_dispatcher.pending:
+            pass  # taken by the worker, which is stuck connecting
+        mail_dispatcher.send(self._message(1))
+        mail_dispatcher.send(self._message(2))
+        with self.assertRaises(MailQueueFull):
+            mail_dispatcher.send(self._message(3))
+        self.assertTrue(mail_dispatcher.rejected == 1)
+        self.assertTrue(mail_dispatcher.join(10))
+        self.assertTrue(len(self.sink.messages) == 3)
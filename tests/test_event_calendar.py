@@ -0,0 +1,97 @@
+import json
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app, db, event_calendar
+from app.models import User, Role, Group, Event
+
+
+class EventCalendarTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        self.other = User(email='susan@example.com', username='susan', password='dog', confirmed=True)
+        self.cooks, self.bakers, self.strangers = Group(title='cooks'), Group(title='bakers'), Group(title='x')
+        db.session.add_all([self.user, self.other, self.cooks, self.bakers, self.strangers])
+        self.user.member(self.cooks)
+        self.user.member(self.bakers)
+        self.other.member(self.strangers)
+        soon = datetime.utcnow() + timedelta(days=1)
+        self.events = dict(
+            past=Event(title='past', group=self.cooks, timestamp=soon - timedelta(days=3)),
+            dinner=Event(title='dinner', group=self.cooks, timestamp=soon),
+            bread=Event(title='bread', group=self.bakers, timestamp=soon + timedelta(hours=1)),
+            cake=Event(title='cake', group=self.bakers, timestamp=soon + timedelta(days=2)),
+            party=Event(title='party', group=self.strangers, timestamp=soon))
+        db.session.add_all(self.events.values())
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def titles(self, page):
+        return [entry.event.title for entry in page.entries]
+
+    def test_upcoming(self):
+        self.assertTrue(self.titles(event_calendar.upcoming(self.user.id)) == ['dinner', 'bread', 'cake'])
+        self.assertTrue(sorted(e.title for e in self.user.get_all_events()) == ['bread', 'cake', 'dinner', 'past'])
+        self.assertTrue([e.title for e in self.bakers.get_available_events()] == ['bread', 'cake'])
+
+        # keyset pages and windows
+        page = event_calendar.upcoming(self.user.id, limit=2)
+        self.assertTrue(self.titles(page) == ['dinner', 'bread'] and page.more)
+        last = page.entries[-1].event
+        page = event_calendar.upcoming(self.user.id, after=(last.timestamp, last.id), limit=2)
+        self.assertTrue(self.titles(page) == ['cake'] and not page.more)
+        page = event_calendar.upcoming(self.user.id, end=datetime.utcnow() + timedelta(days=2))
+        self.assertTrue(self.titles(page) == ['dinner', 'bread'])
+
+    def test_conflicts(self):
+        self.user.go(self.events['dinner'])
+        self.user.go(self.events['cake'])
+        db.session.commit()
+        entries = dict((entry.event.title, entry) for entry in event_calendar.upcoming(self.user.id).entries)
+        self.assertTrue(entries['dinner'].status == 1 and entries['dinner'].conflicts == [])
+        self.assertTrue(entries['bread'].status is None)
+        self.assertTrue(entries['bread'].conflicts == [self.events['dinner'].id])
+        self.assertTrue(entries['cake'].conflicts == [])
+
+        self.user.go(self.events['bread'])
+        db.session.commit()
+        entries = dict((entry.event.title, entry) for entry in event_calendar.upcoming(self.user.id).entries)
+        self.assertTrue(entries['dinner'].conflicts == [self.events['bread'].id])
+        self.app.config['COOKZILLA_EVENT_DURATION'] = 30
+        self.assertTrue(event_calendar.upcoming(self.user.id).entries[0].conflicts == [])
+
+    def test_next_events(self):
+        self.assertTrue([e.title for e in event_calendar.next_events(self.user.id)] == ['dinner', 'bread', 'cake'])
+        misses = event_calendar.misses
+        event_calendar.next_events(self.user.id)
+        self.assertTrue(event_calendar.misses == misses)
+
+        # a new event of one of the user's groups drops the summary
+        db.session.add(Event(title='brunch', group=self.cooks, timestamp=datetime.utcnow() + timedelta(hours=2)))
+        db.session.commit()
+        self.assertTrue(event_calendar.next_events(self.user.id)[0].title == 'brunch')
+        self.user.unmember(self.bakers)
+        db.session.commit()
+        self.assertTrue([e.title for e in event_calendar.next_events(self.user.id)] == ['brunch', 'dinner'])
+        self.user.go(self.events['dinner'])
+        db.session.commit()
+        self.assertTrue(event_calendar.next_events(self.user.id)[1].status == 1)
+
+    def test_calendar_page(self):
+        client = self.app.test_client(use_cookies=True)
+        client.post('/auth/login', data=dict(email='john@example.com', password='cat'))
+        response = client.get('/events/calendar?days=1', headers={'Accept': 'application/json'})
+        data = json.loads(response.get_data(as_text=True))
+        self.assertTrue([e['title'] for e in data['events']] == ['dinner'] and data['next'] is None)
+        response = client.get('/events/calendar')
+        self.assertTrue(b'bread' in response.data and b'party' not in response.data and b'past' not in response.data)
+        self.assertTrue(client.get('/events/calendar?from=tomorrow').status_code == 400)
@@ -0,0 +1,85 @@
+import json
+import unittest
+
+from app import create_app, db, facets
+from app.models import User, Role, Recipe, Tag, Review
+
+
+class FacetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        Tag.insert_tags()
+        self.user = User(email='john@example.com', username='john', password='cat')
+        self.tags = dict((t.tag, t) for t in Tag.query.all())
+        self.recipes = {}
+        for title, serving, tags in (('minestrone', 4, ['Italian', 'Soup', 'Vegan']),
+                                     ('hot and sour soup', 2, ['Chinese', 'Soup', 'Spicy']),
+                                     ('vegan chili', 6, ['Vegan', 'Spicy']),
+                                     ('gazpacho', 4, ['Soup', 'Vegan'])):
+            recipe = Recipe(title=title, serving=serving, author=self.user)
+            for tag in tags:
+                recipe.tag(self.tags[tag])
+            self.recipes[title] = recipe
+        db.session.add_all([self.user] + list(self.recipes.values()))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def titles(self, result):
+        return set(Recipe.query.get(id).title for id in result.ids.tolist())
+
+    def test_browse(self):
+        vegan, soup, spicy = self.tags['Vegan'].id, self.tags['Soup'].id, self.tags['Spicy'].id
+        result = facets.browse([vegan, soup], not_tags=[spicy])
+        self.assertTrue(self.titles(result) == set(['minestrone', 'gazpacho']))
+        self.assertTrue(result.counts[('tag', self.tags['Italian'].id)] == 1)
+        self.assertTrue(result.counts[('tag', spicy)] == 0)
+        self.assertTrue(result.counts[('serving', '3-4')] == 2)
+
+        result = facets.browse(any_tags=[self.tags['Italian'].id, self.tags['Chinese'].id])
+        self.assertTrue(self.titles(result) == set(['minestrone', 'hot and sour soup']))
+        self.assertTrue(self.titles(facets.browse(serving='5-6')) == set(['vegan chili']))
+        # highest id first
+        self.assertTrue(facets.browse().ids.tolist() == sorted((r.id for r in self.recipes.values()),
+                                                               reverse=True))
+
+    def test_updates(self):
+        vegan, spicy = self.tags['Vegan'].id, self.tags['Spicy'].id
+        self.assertTrue(len(facets.browse([vegan, spicy]).ids) == 1)
+        chili, gazpacho = self.recipes['vegan chili'], self.recipes['gazpacho']
+        chili.untag(self.tags['Spicy'])
+        gazpacho.tag(self.tags['Spicy'])
+        db.session.add(Review(title='yum', body='yum', rating=5, recipe=gazpacho, author=self.user))
+        soup = Recipe(title='pho', serving=8, author=self.user)
+        soup.tag(self.tags['Soup'])
+        db.session.add(soup)
+        db.session.commit()
+        self.assertTrue(self.titles(facets.browse([vegan, spicy])) == set(['gazpacho']))
+        self.assertTrue(self.titles(facets.browse(rating='4+')) == set(['gazpacho']))
+        self.assertTrue(self.titles(facets.browse([self.tags['Soup'].id], serving='7+')) == set(['pho']))
+
+        # the published matrix is replaced, not changed under a reader
+        published = facets._snapshot['matrix']
+        before = published.copy()
+        db.session.delete(soup)
+        db.session.commit()
+        self.assertTrue(facets.browse([self.tags['Soup'].id]).counts[('serving', '7+')] == 0)
+        self.assertTrue(facets._snapshot['matrix'] is not published and (published == before).all())
+
+    def test_endpoint(self):
+        client = self.app.test_client()
+        response = client.get('/tags/browse?tag={}&not={}'.format(self.tags['Soup'].id, self.tags['Spicy'].id),
+                              headers={'Accept': 'application/json'})
+        data = json.loads(response.get_data(as_text=True))
+        self.assertTrue(data['total'] == 2)
+        self.assertTrue(data['facets']['tag:{}'.format(self.tags['Vegan'].id)] == 2)
+        response = client.get('/tags/browse?tag={}'.format(self.tags['Vegan'].id))
+        self.assertTrue(b'gazpacho' in response.data and b'hot and sour soup' not in response.data)
+        self.assertTrue(client.get('/tags/browse?serving=9').status_code == 400)
@@ -0,0 +1,75 @@
+import unittest
+
+from app import create_app, db, feed_cache, log_writer
+from app.models import User, Role, Recipe, LogEvent
+
+
+class FeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        feed_cache.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_ranking(self):
+        u1 = User(email='john@example.com', password='cat')
+        u2 = User(email='susan@example.org', password='dog')
+        u3 = User(email='david@example.net', password='dog')
+        r1 = Recipe(title='a', author=u1)
+        r2 = Recipe(title='b', author=u2)
+        r3 = Recipe(title='c', author=u3)
+        db.session.add_all([u1, u2, u3, r1, r2, r3])
+        db.session.commit()
+        # own recipes through the self follow, r3 through the logs
+        self.assertTrue(feed_cache.get(u1.id) == [r1.id])
+        LogEvent.log(u1, 'browse', r3)
+        LogEvent.log(u1, 'browse', r3)
+        log_writer.flush()
+        # browsing reorders the feed once the entry expires
+        self.assertTrue(feed_cache.get(u1.id) == [r1.id])
+        feed_cache.clear()
+        self.assertTrue(feed_cache.get(u1.id) == [r3.id, r1.id])
+        u1.follow(u2)
+        db.session.commit()
+        self.assertTrue(feed_cache.get(u1.id) == [r3.id, r2.id, r1.id])
+        pagination = feed_cache.paginate(u1.id, 2, 2)
+        self.assertTrue(pagination.total == 3)
+        self.assertTrue(pagination.items == [r1])
+
+    def test_invalidation(self):
+        u1 = User(email='john@example.com', password='cat')
+        u2 = User(email='susan@example.org', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        u1.follow(u2)
+        db.session.commit()
+        self.assertTrue(feed_cache.get(u1.id) == [])
+        misses = feed_cache.misses
+        feed_cache.get(u1.id)
+        self.assertTrue(feed_cache.misses == misses)
+        r = Recipe(title='a', author=u2)
+        db.session.add(r)
+        db.session.commit()
+        self.assertTrue(feed_cache.get(u1.id) == [r.id])
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertTrue(feed_cache.get(u1.id) == [])
+
+    def test_feed_table(self):
+        self.app.config['COOKZILLA_FEED_TABLE'] = True
+        u = User(email='john@example.com', password='cat')
+        r = Recipe(title='a', author=u)
+        db.session.add_all([u, r])
+        db.session.commit()
+        self.assertTrue(feed_cache.get(u.id) == [r.id])
+        feed_cache.clear()
+        self.assertTrue(feed_cache._load(u.id) == [r.id])
+        feed_cache.invalidate(u.id)
+        self.assertTrue(feed_cache._load(u.id) is None)
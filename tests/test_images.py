@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from app import create_app, image_pipeline
+from app.images import make_derivatives
+
+
+class ImagePipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        self.upload = os.path.join(self.static, 'upload')
+        os.mkdir(self.upload)
+        self.app = create_app('testing')
+        self.app.static_url_path = '/static'
+        self.app.static_folder = self.static
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        shutil.rmtree(self.static)
+
+    def test_derivatives(self):
+        exif = Image.Exif()
+        exif[0x0110] = 'Camera'
+        Image.new('RGB', (1200, 900), 'red').save(os.path.join(self.upload, 'soup.jpg'), exif=exif)
+        written = make_derivatives(os.path.join(self.upload, 'soup.jpg'))
+        self.assertTrue(sorted(written) == ['soup-detail-2x.jpg', 'soup-detail.jpg',
+                                            'soup-thumb-2x.jpg', 'soup-thumb.jpg'])
+        with Image.open(os.path.join(self.upload, 'soup-thumb.jpg')) as thumb:
+            self.assertTrue(thumb.size == (267, 200))
+            self.assertTrue(thumb.info.get('progressive'))
+            self.assertTrue('exif' not in thumb.info)
+        with Image.open(os.path.join(self.upload, 'soup-detail-2x.jpg')) as detail:
+            self.assertTrue(detail.size == (1067, 800))
+
+    def test_srcset(self):
+        url = '/static/upload/soup.png'
+        self.assertTrue(image_pipeline.srcset(url, 'thumb') == (url, ''))
+        self.assertTrue(image_pipeline.srcset('http://example.com/a.jpg', 'thumb') ==
+                        ('http://example.com/a.jpg', ''))
+        Image.new('RGBA', (300, 300)).save(os.path.join(self.upload, 'soup.png'))
+        # processed elsewhere: the missing derivatives are not looked for again until the TTL
+        make_derivatives(os.path.join(self.upload, 'soup.png'))
+        self.assertTrue(image_pipeline.srcset(url, 'thumb') == (url, ''))
+        image_pipeline.submit('soup.png')
+        self.assertTrue(image_pipeline.srcset(url, 'thumb') ==
+                        ('/static/upload/soup-thumb.jpg',
+                         '/static/upload/soup-thumb.jpg 1x, /static/upload/soup-thumb-2x.jpg 2x'))
+        # never upscaled
+        with Image.open(os.path.join(self.upload, 'soup-detail-2x.jpg')) as detail:
+            self.assertTrue(detail.size == (300, 300))
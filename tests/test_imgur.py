@@ -0,0 +1,125 @@
+import base64
+import io
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib import parse
+
+from app.exceptions import ImgurError
+from app.utils.Imgur import Imgur, CHUNK_SIZE
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Imgur stand-in: answers the scripted statuses in turn, then 200."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+                if size == 0:
+                    return body
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _answer(self, data):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path, self.client_address, data))
+            status = server.statuses.pop(0) if server.statuses else 200
+        time.sleep(server.latency)
+        payload = json.dumps(dict(success=status == 200, status=status,
+                                  data=dict(deletehash='abc', size=len(data)))).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        self._answer(self._body())
+
+    def do_DELETE(self):
+        self._answer(b'')
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients hanging up on a slow answer
+        pass
+
+
+class ImgurTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(('127.0.0.1', 0), StandInHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.statuses = []
+        self.server.latency = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = Imgur(api='http://127.0.0.1:{}/3/image'.format(self.server.server_address[1]),
+                            read_timeout=0.5, backoff=0.01)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_streamed_upload_and_keep_alive(self):
+        image = bytes(range(256)) * (CHUNK_SIZE // 100)
+        result = self.client.send_image(io.BytesIO(image), dict(title='soup'))
+        self.assertTrue(result['success'])
+        method, path, address, body = self.server.requests[0]
+        fields = parse.parse_qs(body.decode('ascii'))
+        self.assertTrue(fields['type'] == ['base64'] and fields['title'] == ['soup'])
+        self.assertTrue(base64.b64decode(fields['image'][0]) == image)
+
+        self.assertTrue(self.client.delete_image('abc')['success'])
+        self.assertTrue(self.server.requests[1][:2] == ('DELETE', '/3/image/abc'))
+        # both requests went over one connection
+        self.assertTrue(self.client.connections_opened == 1)
+        self.assertTrue(self.server.requests[0][2] == self.server.requests[1][2])
+
+    def test_retries(self):
+        self.server.statuses = [503, 500]
+        self.assertTrue(self.client.send_image(io.BytesIO(b'soup'))['success'])
+        self.assertTrue(len(self.server.requests) == 3)
+        # the image is sent whole on every attempt
+        self.assertTrue(len(set(body for _, _, _, body in self.server.requests)) == 1)
+
+        self.server.statuses = [503, 503, 503]
+        with self.assertRaises(ImgurError) as cm:
+            self.client.send_image(io.BytesIO(b'soup'))
+        self.assertTrue(cm.exception.status == 503)
+
+        self.server.statuses = [400]
+        with self.assertRaises(ImgurError) as cm:
+            self.client.send_image(io.BytesIO(b'soup'))
+        self.assertTrue(cm.exception.status == 400)
+        self.assertTrue(len(self.server.requests) == 7)
+
+    def test_read_timeout(self):
+        self.server.latency = 1
+        start = time.time()
+        with self.assertRaises(ImgurError):
+            self.client.delete_image('abc')
+        # three attempts of 0.5s each, not three of 1s
+        self.assertTrue(time.time() - start < 2.5)
+
+    def test_submit(self):
+        self.server.latency = 0.2
+        start = time.time()
+        futures = [self.client.submit_image(io.BytesIO(b'soup')) for _ in range(4)]
+        self.assertTrue(all(future.result()['success'] for future in futures))
+        # ran side by side on the worker pool
+        self.assertTrue(time.time() - start < 0.6)
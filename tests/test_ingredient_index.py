@@ -0,0 +1,87 @@
+import json
+import unittest
+
+from app import create_app, db, ingredient_index
+from app.models import User, Role, Recipe, Ingredient
+
+
+class IngredientIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='john@example.com', username='john', password='cat')
+        db.session.add(self.user)
+        self.recipes = {}
+        for title, names in (('omelette', ['Egg', 'butter', 'salt']),
+                             ('fried rice', ['rice', 'egg', 'onion', 'pork']),
+                             ('risotto', ['rice', 'onion', 'butter', 'cheese']),
+                             ('salad', ['lettuce', 'onion'])):
+            self.recipes[title] = self.add(title, names)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add(self, title, names):
+        recipe = Recipe(title=title, author=self.user)
+        db.session.add(recipe)
+        db.session.add_all([Ingredient(name=name, unit='cup', quantity=1, recipe=recipe) for name in names])
+        return recipe
+
+    def titles(self, ids):
+        return set(Recipe.query.get(id).title for id in ids.tolist())
+
+    def test_find(self):
+        ids, _ = ingredient_index.find(['onion', 'RICE '])
+        self.assertTrue(self.titles(ids) == set(['fried rice', 'risotto']))
+        ids, _ = ingredient_index.find(['onion'], without=['pork'])
+        self.assertTrue(self.titles(ids) == set(['risotto', 'salad']))
+        self.assertTrue(len(ingredient_index.find(['egg', 'cheese'])[0]) == 0)
+
+        # with what I have, short of one ingredient at most
+        ids, missing = ingredient_index.find(have=['egg', 'butter', 'onion', 'rice'], missing=1)
+        self.assertTrue(self.titles(ids) == set(['omelette', 'fried rice', 'risotto', 'salad']))
+        self.assertTrue(missing.tolist() == [1, 1, 1, 1])
+        ids, missing = ingredient_index.find(have=['egg', 'butter', 'onion', 'rice'], missing=0)
+        self.assertTrue(len(ids) == 0)
+        ids, missing = ingredient_index.find(have=['lettuce', 'onion'])
+        self.assertTrue((self.titles(ids), missing.tolist()) == (set(['salad']), [0]))
+
+    def test_updates(self):
+        self.assertTrue(len(ingredient_index.recipes_with('cheese')) == 1)
+        pizza = self.add('pizza', ['cheese', 'tomato'])
+        db.session.commit()
+        self.assertTrue(self.titles(ingredient_index.recipes_with('cheese')) == set(['risotto', 'pizza']))
+        ids, missing = ingredient_index.find(have=['tomato', 'cheese'])
+        self.assertTrue(ids.tolist() == [pizza.id] and missing.tolist() == [0])
+
+        db.session.delete(Ingredient.query.filter_by(recipe=pizza, name='tomato').first())
+        db.session.delete(Ingredient.query.filter_by(recipe=self.recipes['risotto'], name='cheese').first())
+        db.session.commit()
+        self.assertTrue(self.titles(ingredient_index.recipes_with('cheese')) == set(['pizza']))
+        self.assertTrue(len(ingredient_index.recipes_with('tomato')) == 0)
+
+        # folding the changed recipes into the arrays gives the same answers
+        self.app.config['COOKZILLA_INGREDIENT_INDEX_PENDING'] = 0
+        self.add('toast', ['bread', 'butter'])
+        db.session.commit()
+        self.assertTrue(len(ingredient_index._snapshot['pending']) == 0)
+        self.assertTrue(self.titles(ingredient_index.recipes_with('butter')) == set(['omelette', 'risotto', 'toast']))
+        self.assertTrue(self.titles(ingredient_index.recipes_with('cheese')) == set(['pizza']))
+        self.assertTrue(len(ingredient_index.recipes_with('tomato')) == 0)
+
+    def test_endpoint(self):
+        client = self.app.test_client()
+        response = client.get('/recipes/by-ingredients?have=egg,butter,salt,rice,onion&missing=0',
+                              headers={'Accept': 'application/json'})
+        data = json.loads(response.get_data(as_text=True))
+        self.assertTrue(data['total'] == 1 and data['recipes'][0]['title'] == 'omelette')
+        response = client.get('/recipes/by-ingredients?with=onion&without=pork')
+        self.assertTrue(b'risotto' in response.data and b'fried rice' not in response.data)
+        response = client.get('/search_results/rice?without=pork')
+        self.assertTrue(b'risotto' in response.data and b'fried rice' not in response.data)
@@ -0,0 +1,82 @@
+import json
+import unittest
+
+from app import create_app, db
+from app.ingredients import scale, shopping_list
+from app.models import User, Role, Recipe, Ingredient
+
+
+class IngredientsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        user = User(email='john@example.com', username='john', password='cat')
+        self.cake = Recipe(title='cake', serving=2, author=user)
+        self.bread = Recipe(title='bread', serving=4, author=user)
+        db.session.add_all([user, self.cake, self.bread])
+        db.session.add_all([
+            Ingredient(name='Sugar', unit='cup', quantity=1, recipe=self.cake),
+            Ingredient(name='flour', unit='gram(g)', quantity=500, recipe=self.cake),
+            Ingredient(name='salt', unit='pinch', quantity=1, recipe=self.cake),
+            Ingredient(name='sugar ', unit='tablespoon', quantity=2, recipe=self.bread),
+            Ingredient(name='flour', unit='kilogram(kg)', quantity=1, recipe=self.bread),
+            Ingredient(name='salt', unit='pinch', quantity=2, recipe=self.bread),
+            Ingredient(name='Salt', unit='gram(g)', quantity=5, recipe=self.bread)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_scale(self):
+        ingredients = dict((i.name, i) for i in scale(self.cake, 6))
+        self.assertTrue(ingredients['Sugar'].quantity == 3)
+        self.assertTrue(ingredients['Sugar'].base_unit == 'milliliter(ml)')
+        self.assertAlmostEqual(ingredients['Sugar'].base_quantity, 3 * 2381 / 10.06)
+        self.assertTrue(ingredients['flour'].base_quantity == 1.5)
+        self.assertTrue(ingredients['flour'].base_unit == 'kilogram(kg)')
+        self.assertTrue((ingredients['salt'].quantity, ingredients['salt'].unit) == (3, 'pinch'))
+
+    def test_shopping_list(self):
+        # the cake for 4, the bread as written
+        items = shopping_list({self.cake.id: 4, self.bread.id: None})
+        self.assertTrue([(i.name, i.unit) for i in items] == [
+            ('flour', 'kilogram(kg)'), ('Salt', 'gram(g)'), ('salt', 'pinch'), ('Sugar', 'milliliter(ml)')])
+        flour, salt_g, salt, sugar = items
+        self.assertTrue((flour.quantity, flour.recipes) == (2, 2))
+        self.assertTrue((salt_g.quantity, salt_g.recipes) == (5, 1))
+        self.assertTrue((salt.quantity, salt.recipes) == (4, 2))
+        self.assertAlmostEqual(sugar.quantity, 2 * 2381 / 10.06 + 2 * 2381 / 161.)
+        self.assertTrue(shopping_list({}) == [])
+
+    def test_endpoint(self):
+        client = self.app.test_client()
+        response = client.get('/recipes/shopping-list?ids={},{}&servings=8'.format(self.cake.id, self.bread.id),
+                              headers={'Accept': 'application/json'})
+        self.assertTrue(response.status_code == 200)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertTrue(data['recipes'] == 2)
+        self.assertTrue({'name': 'flour', 'quantity': 4, 'unit': 'kilogram(kg)', 'recipes': 2} in data['items'])
+
+        response = client.post('/recipes/shopping-list', data=json.dumps({str(self.cake.id): 2}),
+                               content_type='application/json')
+        self.assertTrue(response.status_code == 200)
+        self.assertTrue('500' in response.get_data(as_text=True))
+
+        response = client.get('/recipes/shopping-list?ids=1&servings=0')
+        self.assertTrue(response.status_code == 400)
+
+    def test_endpoint_without_csrf_token(self):
+        self.app.config['WTF_CSRF_ENABLED'] = True
+        client = self.app.test_client()
+        response = client.post('/recipes/shopping-list', data=json.dumps({str(self.cake.id): 2}),
+                               content_type='application/json', headers={'Accept': 'application/json'})
+        self.assertTrue(response.status_code == 200)
+        self.assertTrue(json.loads(response.get_data(as_text=True))['recipes'] == 1)
+        # the other POST endpoints still want one, before even asking for a login
+        response = client.post('/recipes/import', data='[]', content_type='application/json')
+        self.assertTrue(response.status_code == 400)
@@ -0,0 +1,79 @@
+import unittest
+
+from app import create_app, db, metrics
+from app.models import User, Role
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def stats(self, endpoint):
+        return next(e for e in metrics.endpoints if e.endpoint == endpoint)
+
+    def test_endpoint_stats(self):
+        db.session.add(User(email='john@example.com', username='john', password='cat'))
+        db.session.commit()
+        for _ in range(3):
+            self.assertTrue(self.client.get('/user/john').status_code == 200)
+        self.client.get('/nowhere')
+        stats = self.stats('main.user')
+        self.assertTrue(stats.requests == 3 and stats.errors == 0)
+        self.assertTrue(sum(stats.counts) == 3 and stats.latency > 0)
+        self.assertTrue(stats.queries >= 3 and stats.db_time > 0)
+        self.assertTrue(0 < stats.render_time < stats.latency)
+        self.assertTrue(stats.response_bytes > 3000)
+        # statements are not kept unless sampled
+        self.assertTrue(stats.sampled == 0 and stats.slow_queries == [])
+        self.assertTrue(self.stats('<unmatched>').requests == 1)
+
+    def test_crashes(self):
+        @self.app.route('/crash')
+        def crash():
+            raise ValueError('boom')
+
+        self.app.config['PROPAGATE_EXCEPTIONS'] = False
+        self.assertTrue(self.client.get('/crash').status_code == 500)
+        stats = self.stats('crash')
+        self.assertTrue(stats.requests == 1 and stats.errors == 1 and sum(stats.counts) == 1)
+
+    def test_sampling(self):
+        self.app.config['COOKZILLA_METRICS_SAMPLE_RATE'] = 1.0
+        self.app.config['COOKZILLA_METRICS_SLOW_QUERIES'] = 2
+        for _ in range(3):
+            self.client.get('/')
+        stats = self.stats('main.index')
+        self.assertTrue(stats.sampled == 3)
+        self.assertTrue(len(stats.slow_queries) == 2)
+        self.assertTrue(all(statement.startswith('SELECT') for _, statement, _ in stats.slow_queries))
+
+    def test_exposition(self):
+        self.client.get('/')
+        # nobody may scrape by default, not even a reverse proxy on the same host
+        response = self.client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+        self.assertTrue(response.status_code == 403)
+        self.app.config['COOKZILLA_METRICS_TOKEN'] = 's3cret'
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+        self.assertTrue(response.status_code == 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+        self.assertTrue(response.status_code == 200)
+        text = response.get_data(as_text=True)
+        self.assertTrue('cookzilla_request_duration_seconds_bucket{endpoint="main.index",le="+Inf"} 1'
+                        in text)
+        self.assertTrue('cookzilla_request_duration_seconds_count{endpoint="main.index"} 1' in text)
+        self.assertTrue('# TYPE cookzilla_db_queries_total counter' in text)
+        self.app.config['COOKZILLA_METRICS_ALLOWED_IPS'] = ['10.0.0.2']
+        response = self.client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        self.assertTrue(response.status_code == 200)
+        response = self.client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        self.assertTrue(response.status_code == 403)
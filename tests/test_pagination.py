@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime
+
+from app import create_app, db
+from app.models import User, Role, Recipe
+from app.pagination import paginate, cached_count
+
+
+class PaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        u = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        # pairs of recipes share a timestamp, the id breaks the tie
+        db.session.add_all([Recipe(title='soup {}'.format(i), body='hot soup', author=u,
+                                   timestamp=datetime(2016, 1, 1, 0, 0, i // 2))
+                            for i in range(7)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _page(self, path):
+        with self.app.test_request_context(path):
+            pagination = paginate(Recipe.query, Recipe.timestamp, Recipe.id, 3, total='cached')
+            return pagination, pagination.prev_url, pagination.next_url
+
+    def test_walk(self):
+        expected = [r.id for r in Recipe.query.order_by(Recipe.timestamp.desc(), Recipe.id.desc())]
+        pages, path = [], '/'
+        while path:
+            pagination, prev_url, path = self._page(path)
+            pages.append(([r.id for r in pagination.items], prev_url))
+        self.assertTrue([ids for ids, _ in pages] == [expected[:3], expected[3:6], expected[6:]])
+        self.assertTrue(pagination.page == 3 and pagination.pages == 3 and pagination.total == 7)
+        self.assertFalse(pagination.has_next)
+
+        # back from the last page, across the tie
+        pagination, prev_url, next_url = self._page(pages[-1][1])
+        self.assertTrue([r.id for r in pagination.items] == expected[3:6])
+        self.assertTrue(pagination.page == 2 and pagination.has_prev)
+        pagination, prev_url, next_url = self._page(prev_url)
+        self.assertTrue([r.id for r in pagination.items] == expected[:3])
+        self.assertFalse(pagination.has_prev)
+
+        # old page number links still work
+        pagination, prev_url, next_url = self._page('/?page=2')
+        self.assertTrue([r.id for r in pagination.items] == expected[3:6])
+
+    def test_cached_count(self):
+        self.assertTrue(cached_count(Recipe.query) == 7)
+        db.session.add(Recipe(title='stew', body='hot stew'))
+        db.session.commit()
+        self.assertTrue(cached_count(Recipe.query) == 7)
+        self.assertTrue(cached_count(Recipe.query.filter(Recipe.title == 'stew')) == 1)
+        self.app.config['COOKZILLA_COUNT_TTL'] = 0
+        self.assertTrue(cached_count(Recipe.query) == 8)
@@ -0,0 +1,42 @@
+import unittest
+
+from app import create_app, db, password_hasher
+from app.models import User, Role
+
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        password_hasher.shutdown()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_rehash_on_login(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        old_hash = u.password_hash
+        self.assertTrue(old_hash.startswith('pbkdf2:sha256:1000$'))
+
+        self.app.config['COOKZILLA_PASSWORD_METHOD'] = 'pbkdf2:sha512:2000'
+        self.assertTrue(password_hasher.needs_rehash(old_hash))
+        self.assertFalse(u.verify_password('dog'))
+        self.assertTrue(u.password_hash == old_hash)
+        self.assertTrue(u.verify_password('cat'))
+        db.session.commit()
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha512:2000$'))
+        self.assertFalse(password_hasher.needs_rehash(u.password_hash))
+        self.assertTrue(u.verify_password('cat'))
+
+    def test_process_pool(self):
+        self.app.config['COOKZILLA_PASSWORD_WORKERS'] = 1
+        pwhash = password_hasher.hash('cat')
+        self.assertTrue(password_hasher.verify(pwhash, 'cat'))
+        self.assertFalse(password_hasher.verify(pwhash, 'dog'))
@@ -0,0 +1,66 @@
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app, db, last_seen_writer
+from app.decorators import read_write
+from app.exceptions import ReadOnlySessionError
+from app.models import User, Role
+
+
+class ReadOnlyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+
+        def rename():
+            User.query.get(self.user_id).name = 'John'
+            db.session.flush()
+            return 'ok'
+
+        @read_write
+        def rename_rw():
+            return rename()
+
+        self.app.add_url_rule('/rename', 'rename', rename, methods=['GET', 'POST'])
+        self.app.add_url_rule('/rename-rw', 'rename_rw', rename_rw)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        u = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(u)
+        db.session.commit()
+        self.user_id = u.id
+
+    def tearDown(self):
+        last_seen_writer.flush()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_get_is_read_only(self):
+        client = self.app.test_client()
+        with self.assertRaises(ReadOnlySessionError):
+            client.get('/rename')
+        self.assertTrue(client.get('/rename-rw').status_code == 200)
+        self.assertTrue(client.post('/rename').status_code == 200)
+
+    def test_last_seen_is_batched(self):
+        u = User.query.get(self.user_id)
+        long_ago = datetime.utcnow() - timedelta(days=1)
+        u.last_seen = long_ago
+        db.session.commit()
+        client = self.app.test_client(use_cookies=True)
+        client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        for _ in range(3):
+            self.assertTrue(client.get('/').status_code == 200)
+        # queued once, nothing written yet
+        self.assertTrue(last_seen_writer.pending == 1)
+        db.session.expire_all()
+        self.assertTrue(User.query.get(self.user_id).last_seen == long_ago)
+        self.assertTrue(last_seen_writer.flush() == 1)
+        db.session.expire_all()
+        last_seen = User.query.get(self.user_id).last_seen
+        self.assertTrue(last_seen > long_ago)
+        # throttled until COOKZILLA_LAST_SEEN_INTERVAL has passed
+        client.get('/')
+        self.assertTrue(last_seen_writer.pending == 0)
@@ -0,0 +1,61 @@
+import unittest
+from datetime import datetime, timedelta
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db, recommender
+from app.models import User, Role, Recipe, Tag, LogEvent, RelatedRecipe
+
+
+class RecommenderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        Tag.insert_tags()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_rebuild_and_refresh(self):
+        users = [User(email='u{}@example.com'.format(i), username='u{}'.format(i), password='cat')
+                 for i in range(3)]
+        recipes = [Recipe(title='r{}'.format(i), author=users[0],
+                          timestamp=datetime.utcnow() - timedelta(days=1)) for i in range(5)]
+        db.session.add_all(users + recipes)
+        db.session.commit()
+        chinese, italian = Tag.query.all()[:2]
+        recipes[0].tag(chinese)
+        recipes[1].tag(chinese)
+        recipes[2].tag(italian)
+        old = datetime.utcnow() - timedelta(days=1)
+        for user, recipe in ((0, 0), (0, 2), (1, 0), (1, 2), (2, 1)):
+            db.session.add(LogEvent(user_id=users[user].id, op='browse', recipe_id=recipes[recipe].id,
+                                    ct=3, logged_at=old))
+        db.session.commit()
+        r0, r1, r2, r3, r4 = [r.id for r in recipes]
+
+        stats = recommender.rebuild()
+        self.assertTrue(stats['recipes'] == 5)
+        # browsed by the same people beats a shared tag, which beats nothing
+        related = [r.id for r in recommender.related(r0)]
+        self.assertTrue(related == [r2, r1])
+        queries = len(get_debug_queries())
+        recommender.related(r0)
+        self.assertTrue(len(get_debug_queries()) - queries == 1)
+
+        # only a new recipe is rescored
+        r5 = Recipe(title='r5', author=users[0])
+        db.session.add(r5)
+        db.session.commit()
+        r5.tag(chinese)
+        db.session.commit()
+        stats = recommender.refresh(datetime.utcnow() - timedelta(hours=1))
+        self.assertTrue(stats['recipes'] == 1)
+        self.assertTrue([r.id for r in recommender.related(r5.id)][:2] in ([r0, r1], [r1, r0]))
+        self.assertTrue(r5.id not in [r.id for r in recommender.related(r0)])
+        self.assertTrue(RelatedRecipe.query.filter_by(related_id=r5.id).count() == 0)
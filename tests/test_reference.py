@@ -0,0 +1,54 @@
+import unittest
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db, reference_data
+from app.main.forms import EditProfileAdminForm
+from app.models import User, Role, Tag, Permission
+
+
+class ReferenceDataTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        Tag.insert_tags()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_zero_queries(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        u.id  # reload the expired user outside the counted block
+        with self.app.test_request_context('/'):
+            self.assertTrue(u.can(Permission.WRITE_ARTICLES))
+            queries = len(get_debug_queries())
+            self.assertTrue(u.can(Permission.FOLLOW))
+            self.assertFalse(u.is_administrator())
+            self.assertTrue([t.tag for t in reference_data.tags] == self.app.config['RECIPE_TAGS'])
+            form = EditProfileAdminForm(u)
+            self.assertTrue(sorted(name for id, name in form.role.choices) ==
+                            ['Administrator', 'Moderator', 'User'])
+            self.assertTrue(len(get_debug_queries()) == queries)
+
+    def test_invalidation(self):
+        reference_data.tags
+        version = reference_data.version
+        db.session.add(Tag(tag='Thai'))
+        db.session.commit()
+        self.assertTrue('Thai' in [t.tag for t in reference_data.tags])
+        self.assertTrue(reference_data.version > version)
+        # admin edits of a role are picked up by the next check
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.assertFalse(u.can(Permission.MODERATE_COMMENTS))
+        Role.query.filter_by(default=True).first().permissions |= Permission.MODERATE_COMMENTS
+        db.session.commit()
+        self.assertTrue(u.can(Permission.MODERATE_COMMENTS))
@@ -0,0 +1,58 @@
+import unittest
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import User, Role, Group, Event
+
+
+class RelationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_preload(self):
+        u = User(email='john@example.com', password='cat')
+        others = [User(email='user{}@example.com'.format(i), password='cat') for i in range(3)]
+        groups = [Group(title='g{}'.format(i), creator=u) for i in range(3)]
+        events = [Event(title='e{}'.format(i), group=groups[0], creator=u) for i in range(3)]
+        db.session.add_all([u] + others + groups + events)
+        db.session.commit()
+        u.follow(others[0])
+        others[1].follow(u)
+        u.member(groups[1])
+        u.go(events[0])
+        u.ungo(events[1])
+        db.session.commit()
+
+        # refresh the rows expired by the commit
+        [row.id for row in [u] + others + groups + events]
+
+        with self.app.test_request_context('/'):
+            queries = len(get_debug_queries())
+            u.preload_relations(users=others, groups=groups, events=events)
+            # one query per relation
+            self.assertTrue(len(get_debug_queries()) - queries == 4)
+            queries = len(get_debug_queries())
+            self.assertTrue([u.is_following(o) for o in others] == [True, False, False])
+            self.assertTrue([u.is_followed_by(o) for o in others] == [False, True, False])
+            self.assertTrue([u.is_member(g) for g in groups] == [False, True, False])
+            self.assertTrue([g.is_member(u) for g in groups] == [False, True, False])
+            self.assertTrue([u.is_go(e) for e in events] == [True, False, False])
+            self.assertTrue([u.is_not_go(e) for e in events] == [False, True, False])
+            self.assertTrue([e.is_rsvp(u) for e in events] == [True, True, False])
+            self.assertTrue(len(get_debug_queries()) == queries)
+            # writes keep the request's state current
+            u.unfollow(others[0])
+            self.assertFalse(u.is_following(others[0]))
+            self.assertFalse(others[0].is_followed_by(u))
+            u.go(events[2])
+            self.assertTrue(u.is_go(events[2]))
@@ -0,0 +1,67 @@
+import unittest
+
+from app import create_app, db, response_cache
+from app.models import User, Role, Recipe, Review
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        response_cache.clear()
+        response_cache.reset_stats()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_recipe_page(self):
+        u = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        r = Recipe(title='soup', body='hot soup', author=u)
+        db.session.add_all([u, r])
+        db.session.commit()
+        path = '/recipes/{}'.format(r.id)
+
+        response = self.client.get(path)
+        self.assertTrue(response.status_code == 200)
+        etag = response.headers['ETag']
+        self.assertTrue(response.headers['Last-Modified'])
+        self.assertTrue(response_cache.misses == 1)
+
+        # same ETag, served from the cache without rendering, with the
+        # visitor's own CSRF token
+        other = self.app.test_client()
+        response = other.get(path)
+        self.assertTrue(response.headers['ETag'] == etag)
+        self.assertTrue(b'hot soup' in response.data)
+        self.assertTrue(b'csrf-token" content="' in response.data)
+        self.assertTrue(b'__cookzilla_csrf_token__' not in response.data)
+        self.assertTrue(response_cache.hits == 1)
+
+        response = self.client.get(path, headers={'If-None-Match': etag})
+        self.assertTrue(response.status_code == 304)
+        self.assertTrue(response_cache.not_modified == 1)
+
+        # a new review purges the page and changes the validators
+        db.session.add(Review(body='tasty', recipe=r, author=u))
+        db.session.commit()
+        self.assertTrue(len(response_cache) == 0)
+        response = self.client.get(path, headers={'If-None-Match': etag})
+        self.assertTrue(response.status_code == 200)
+        self.assertTrue(response.headers['ETag'] != etag)
+        self.assertTrue(b'tasty' in response.data)
+
+    def test_logged_in_not_cached(self):
+        u = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(u)
+        db.session.commit()
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        response = self.client.get('/user/john')
+        self.assertTrue(response.status_code == 200)
+        self.assertTrue('ETag' not in response.headers)
+        self.assertTrue(len(response_cache) == 0)
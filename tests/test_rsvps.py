@@ -0,0 +1,143 @@
+import unittest
+from datetime import datetime, timedelta
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db, event_calendar
+from app.counters import reconcile_counters
+from app.models import User, Role, Group, Event, RSVP, RSVPStatus
+
+
+class RSVPTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.group = Group(title='cooks')
+        self.users = [User(email='{}@example.com'.format(name), username=name, password='cat', confirmed=True)
+                      for name in ('john', 'susan', 'david')]
+        db.session.add_all([self.group] + self.users)
+        for user in self.users:
+            user.member(self.group)
+        self.event = Event(title='dinner', group=self.group, creator=self.users[0],
+                           timestamp=datetime.utcnow() + timedelta(days=1))
+        db.session.add(self.event)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def tallies(self, event=None):
+        event = Event.query.get((event or self.event).id)
+        return event.going_count, event.not_going_count, event.maybe_count
+
+    def test_upsert(self):
+        john, susan, david = self.users
+        john.id, self.event.id
+        queries = len(get_debug_queries())
+        john.go(self.event)
+        statements = [q.statement.strip() for q in get_debug_queries()[queries:]]
+        self.assertTrue(len(statements) == 3 and statements[0].startswith('SELECT rsvps.status'))
+        self.assertTrue(statements[1].startswith('INSERT INTO rsvps') and statements[2].startswith('UPDATE events'))
+        # the same answer again only reads it
+        queries = len(get_debug_queries())
+        john.go(self.event)
+        self.assertTrue(len(get_debug_queries()) - queries == 1)
+        susan.maybe(self.event)
+        david.ungo(self.event)
+        db.session.commit()
+        self.assertTrue(self.tallies() == (1, 1, 1))
+        self.assertTrue(RSVP.query.filter_by(event_id=self.event.id).count() == 3)
+
+        john.ungo(self.event)
+        susan.go(self.event)
+        db.session.commit()
+        self.assertTrue(self.tallies() == (1, 2, 0))
+        self.assertTrue(john.is_not_go(self.event) and susan.is_go(self.event))
+        self.assertTrue(reconcile_counters(db.engine)['Event.going_count'] == 0)
+
+        # the commit listeners hear about RSVPs written past the session
+        self.assertTrue(event_calendar.next_events(david.id)[0].status == RSVPStatus.NOT_GOING)
+        david.maybe(self.event)
+        db.session.commit()
+        self.assertTrue(event_calendar.next_events(david.id)[0].status == RSVPStatus.MAYBE)
+
+        # servers without ON CONFLICT insert or update after reading the previous status
+        party = Event(title='party', group=self.group, creator=john)
+        db.session.add(party)
+        db.session.commit()
+        version = db.engine.dialect.server_version_info
+        db.engine.dialect.server_version_info = (3, 8, 10)
+        try:
+            david.go(self.event)
+            john.maybe(self.event)
+            susan.go(party)
+            db.session.commit()
+        finally:
+            db.engine.dialect.server_version_info = version
+        self.assertTrue(self.tallies() == (2, 0, 1) and self.tallies(party) == (1, 0, 0))
+        david.maybe(self.event)
+        john.ungo(self.event)
+        db.session.commit()
+        self.assertTrue(self.tallies() == (1, 1, 1))
+
+        # a rollback leaves the tallies alone
+        david.go(self.event)
+        db.session.rollback()
+        self.assertTrue(self.tallies() == (1, 1, 1))
+
+    def test_orm_writes(self):
+        john, susan, david = self.users
+        # an RSVP to a new event goes in with it
+        party = Event(title='party', group=self.group)
+        john.go(party)
+        db.session.add(party)
+        db.session.commit()
+        self.assertTrue(self.tallies(party) == (1, 0, 0))
+
+        susan.go(party)
+        db.session.commit()
+        rsvp = RSVP.query.get((susan.id, party.id))
+        rsvp.status = RSVPStatus.MAYBE
+        db.session.commit()
+        self.assertTrue(self.tallies(party) == (1, 0, 1))
+        db.session.delete(RSVP.query.get((john.id, party.id)))
+        db.session.commit()
+        self.assertTrue(self.tallies(party) == (0, 0, 1))
+        fixed = reconcile_counters(db.engine)
+        self.assertTrue(fixed['Event.going_count'] == fixed['Event.maybe_count'] == 0)
+
+    def test_event_page(self):
+        client = self.app.test_client(use_cookies=True)
+        client.post('/auth/login', data=dict(email='john@example.com', password='cat'))
+        self.assertTrue(client.get('/events/go/{}'.format(self.event.id)).status_code == 302)
+        client.get('/events/maybe/{}'.format(self.event.id))
+        # the request shares the test's app context, nothing commits it on teardown
+        db.session.commit()
+        self.assertTrue(self.tallies() == (0, 0, 1))
+
+        def render():
+            before = len(get_debug_queries())
+            response = client.get('/events/{}'.format(self.event.id))
+            return len(get_debug_queries()) - before, response.get_data(as_text=True)
+
+        client.get('/events/{}'.format(self.event.id))
+        count, page = render()
+        self.assertTrue('1 maybe' in page and 'john' in page)
+        others = [User(email='u{}@example.com'.format(i), username='u{}'.format(i), password='cat')
+                  for i in range(60)]
+        db.session.add_all(others)
+        db.session.commit()
+        for i, user in enumerate(others):
+            (user.go if i % 2 else user.ungo)(self.event)
+        db.session.commit()
+        self.app.config['COOKZILLA_ATTENDEES_SHOWN'] = 20
+        # new users reload the cached roles once
+        client.get('/events/{}'.format(self.event.id))
+        more_count, page = render()
+        self.assertTrue(more_count == count)
+        self.assertTrue('30 going' in page and 'and 10 more' in page and 'u59' not in page)
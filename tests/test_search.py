@@ -0,0 +1,58 @@
+import unittest
+
+from app import create_app, db, search_index
+from app.models import User, Role, Recipe, Ingredient, Tag
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        Tag.insert_tags()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def search(self, query):
+        return [r.title for r in search_index.search(query, 1, 10).items]
+
+    def test_index_sync(self):
+        u = User(email='john@example.com', password='cat')
+        r1 = Recipe(title='Tomato soup', body='Simmer the tomatoes.', author=u)
+        r2 = Recipe(title='Garlic bread', body='Bake it.', author=u)
+        db.session.add_all([u, r1, r2])
+        db.session.commit()
+        self.assertTrue(self.search('tomatoes') == ['Tomato soup'])
+        self.assertTrue(self.search('bre') == ['Garlic bread'])
+        self.assertTrue(self.search('') == [])
+
+        db.session.add(Ingredient(name='basil', recipe=r2, unit='gram(g)', quantity=5))
+        db.session.commit()
+        self.assertTrue(self.search('basil') == ['Garlic bread'])
+
+        r1.tag(Tag.query.filter_by(tag='Vegan').first())
+        db.session.commit()
+        self.assertTrue(self.search('vegan soup') == ['Tomato soup'])
+
+        r1.body = 'Roast the peppers.'
+        db.session.commit()
+        self.assertTrue(self.search('tomatoes') == ['Tomato soup'])
+        self.assertTrue(self.search('peppers') == ['Tomato soup'])
+        self.assertTrue(self.search('simmer') == [])
+
+    def test_ranking_and_rebuild(self):
+        u = User(email='john@example.com', password='cat')
+        r1 = Recipe(title='Curry', body='A rice dish.', author=u)
+        r2 = Recipe(title='Rice', body='Plain rice.', author=u)
+        db.session.add_all([u, r1, r2])
+        db.session.commit()
+        self.assertTrue(self.search('rice') == ['Rice', 'Curry'])
+        self.assertTrue(search_index.rebuild() == 2)
+        pagination = search_index.search('rice', 2, 1)
+        self.assertTrue(pagination.total == 2)
+        self.assertTrue([r.title for r in pagination.items] == ['Curry'])
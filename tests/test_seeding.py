@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+from app import create_app, db, search_index
+from app.models import User, Role, Recipe, Tag, Follow, GroupMember, Group
+from app.seeding import Seeder, save_snapshot, load_snapshot
+
+COUNTS = dict(users=20, follows=50, recipes=40, ingredients=80, recipe_tags=60, reviews=30,
+              groups=3, group_members=10, events=5, rsvps=10, reports=5, log_events=50)
+
+
+class SeedingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        Tag.insert_tags()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_deterministic(self):
+        Seeder(seed=1).run(COUNTS, report=lambda line: None)
+        first = [(r.id, r.title, r.author_id) for r in Recipe.query.order_by(Recipe.id)]
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        Role.insert_roles()
+        Tag.insert_tags()
+        Seeder(seed=1).run(COUNTS, report=lambda line: None)
+        second = [(r.id, r.title, r.author_id) for r in Recipe.query.order_by(Recipe.id)]
+        self.assertTrue(len(first) == 40)
+        self.assertTrue(first == second)
+
+    def test_consistency(self):
+        u = User(email='john@example.com', username='john', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        inserted = Seeder().run(COUNTS, report=lambda line: None)
+        self.assertTrue(User.query.count() == 21)
+        self.assertTrue(User.query.get(2).verify_password('cat'))
+        # every seeded user follows themselves
+        self.assertTrue(Follow.query.filter(Follow.follower_id == Follow.followed_id).count() == 21)
+        # group creators are members
+        for g in Group.query:
+            self.assertTrue(g.is_member(g.creator))
+        self.assertTrue(GroupMember.query.count() == inserted['group_members'])
+        self.assertTrue(search_index.search(Recipe.query.first().title, 1, 10).total > 0)
+
+    def test_snapshot(self):
+        Seeder().run(COUNTS, report=lambda line: None)
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        try:
+            save_snapshot(path)
+            Recipe.query.delete()
+            db.session.commit()
+            load_snapshot(path)
+            self.assertTrue(Recipe.query.count() == 40)
+        finally:
+            os.remove(path)
@@ -0,0 +1,104 @@
+import json
+import unittest
+
+import numpy as np
+
+from app import create_app, db, social_graph
+from app.models import User, Role, Group
+from app.social_graph import build_graph, _merge
+
+
+class SocialGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        names = ('john', 'susan', 'david', 'mary', 'paul')
+        self.users = dict((name, User(email='{}@example.com'.format(name), username=name, password='cat',
+                                      confirmed=True)) for name in names)
+        self.groups = dict((title, Group(title=title)) for title in ('bakers', 'grillers'))
+        db.session.add_all(list(self.users.values()) + list(self.groups.values()))
+        db.session.commit()
+        john, susan, david, mary, paul = [self.users[name] for name in names]
+        john.follow(susan)
+        john.follow(david)
+        susan.follow(john)
+        susan.follow(mary)
+        david.follow(mary)
+        david.follow(paul)
+        susan.member(self.groups['bakers'])
+        david.member(self.groups['bakers'])
+        mary.member(self.groups['grillers'])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def id(self, name):
+        return self.users[name].id
+
+    def test_queries(self):
+        john, susan, mary = self.id('john'), self.id('susan'), self.id('mary')
+        self.assertTrue(social_graph.following(john).tolist() == sorted([susan, self.id('david')]))
+        self.assertTrue(social_graph.followers(mary).tolist() == sorted([susan, self.id('david')]))
+        self.assertTrue(social_graph.mutual(john).tolist() == [susan])
+        self.assertTrue(social_graph.is_following(john, susan) and not social_graph.is_following(john, mary))
+        self.assertTrue(social_graph.known_followers(john, mary).tolist() == sorted([susan, self.id('david')]))
+        self.assertTrue(social_graph.members_of(self.groups['bakers'].id).tolist() ==
+                        sorted([susan, self.id('david')]))
+
+    def test_suggestions(self):
+        john = self.id('john')
+        self.assertTrue(social_graph.suggest_people(john) == [(self.id('mary'), 2), (self.id('paul'), 1)])
+        self.assertTrue(social_graph.suggest_people(john, limit=1) == [(self.id('mary'), 2)])
+        self.assertTrue(social_graph.suggest_groups(john) == [(self.groups['bakers'].id, 2)])
+
+        # commits in this worker apply without a reload
+        self.assertTrue(social_graph.loaded)
+        self.users['john'].follow(self.users['mary'])
+        self.users['john'].member(self.groups['bakers'])
+        db.session.commit()
+        self.assertTrue(social_graph.suggest_people(john) == [(self.id('paul'), 1)])
+        self.assertTrue(social_graph.suggest_groups(john) == [(self.groups['grillers'].id, 1)])
+        self.users['john'].unfollow(self.users['mary'])
+        db.session.commit()
+        self.assertTrue(social_graph.suggest_people(john)[0] == (self.id('mary'), 2))
+        self.assertTrue(social_graph.pending == 4)
+
+        # past COOKZILLA_SOCIAL_GRAPH_PENDING the changed rows are merged in
+        self.app.config['COOKZILLA_SOCIAL_GRAPH_PENDING'] = 0
+        self.users['paul'].follow(self.users['john'])
+        db.session.commit()
+        self.assertTrue(social_graph.pending == 0)
+        self.assertTrue(social_graph.mutual(john).tolist() == [self.id('susan')])
+        self.assertTrue(social_graph.followers(john).tolist() == sorted([self.id('susan'), self.id('paul')]))
+        self.assertTrue(social_graph.groups_of(john).tolist() == [self.groups['bakers'].id])
+
+    def test_fanout(self):
+        self.app.config['COOKZILLA_SOCIAL_GRAPH_FANOUT'] = 1
+        # only the lowest id each followed user follows counts: john for susan, mary for david
+        self.assertTrue(social_graph.suggest_people(self.id('john')) == [(self.id('mary'), 1)])
+
+    def test_merge(self):
+        graph = build_graph([1, 1, 2, 3, 3, 3], [2, 3, 3, 1, 2, 3], [], [])
+        offsets, targets = graph['following']
+        self.assertTrue(offsets.tolist() == [0, 0, 2, 3, 5] and targets.tolist() == [2, 3, 3, 1, 2])
+        offsets, targets = _merge((offsets, targets), {2: np.array([1, 4], dtype=np.uint32),
+                                                       6: np.array([1], dtype=np.uint32)})
+        self.assertTrue(offsets.tolist() == [0, 0, 2, 4, 6, 6, 6, 7])
+        self.assertTrue(targets.tolist() == [2, 3, 1, 4, 1, 2, 1])
+
+    def test_page(self):
+        client = self.app.test_client(use_cookies=True)
+        client.post('/auth/login', data=dict(email='john@example.com', password='cat'))
+        response = client.get('/suggestions')
+        page = response.get_data(as_text=True)
+        self.assertTrue(response.status_code == 200 and 'mary' in page and 'bakers' in page)
+        response = client.get('/suggestions', headers={'Accept': 'application/json'})
+        data = json.loads(response.get_data(as_text=True))
+        self.assertTrue([p['username'] for p in data['people']] == ['mary', 'paul'])
+        self.assertTrue(data['groups'][0]['members_followed'] == 2 and data['mutual'] == 1)
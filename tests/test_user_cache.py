@@ -0,0 +1,61 @@
+import unittest
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db, reference_data, user_cache
+from app.models import User, Role, Recipe
+
+
+class UserCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client(use_cookies=True)
+        u = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(u)
+        db.session.commit()
+        self.user_id = u.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        response = self.client.post('/auth/login', data=dict(email='john@example.com', password='cat'))
+        self.assertTrue(response.status_code == 302)
+        reference_data.roles
+
+    def queries(self, path):
+        before = len(get_debug_queries())
+        response = self.client.get(path)
+        return len(get_debug_queries()) - before, response
+
+    def test_one_query_then_none(self):
+        self.login()
+        count, response = self.queries('/auth/change-password')
+        self.assertTrue(response.status_code == 200 and count == 1)
+        count, response = self.queries('/auth/change-password')
+        self.assertTrue(response.status_code == 200 and count == 0)
+        self.assertTrue(user_cache.hits == 1 and user_cache.misses == 1)
+
+    def test_invalidation(self):
+        self.login()
+        self.queries('/auth/change-password')
+        u = User.query.get(self.user_id)
+        u.confirmed = False
+        db.session.commit()
+        count, response = self.queries('/auth/unconfirmed')
+        self.assertTrue(response.status_code == 200 and count == 1)
+
+        # counters of the user are written past the ORM, the commit of the
+        # child row drops the snapshot too
+        u.confirmed = True
+        db.session.commit()
+        self.queries('/auth/change-password')
+        db.session.add(Recipe(title='Soup', author_id=self.user_id))
+        db.session.commit()
+        self.assertTrue(self.user_id not in user_cache._users)
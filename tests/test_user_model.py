@@ -2,8 +2,8 @@ import time
 import unittest
 from datetime import datetime
 
-from app import create_app, db
-from app.models import User, AnonymousUser, Role, Permission, Follow, Group, Event, Report, LogEvent
+from app import create_app, db, log_writer
+from app.models import User, AnonymousUser, Role, Permission, Follow, Group, Event, Report, LogEvent, Recipe
 
 
 class UserModelTestCase(unittest.TestCase):
@@ -316,5 +316,78 @@ class UserModelTestCase(unittest.TestCase):
         self.assertFalse(r2 in e2.reports)
 
     def test_log(self):
-        pass
+        u = User(email='john@example.com', password='cat')
+        r = Recipe(title='soup', author=u)
+        db.session.add(u)
+        db.session.add(r)
+        db.session.commit()
+        LogEvent.log(u, 'browse', r)
+        LogEvent.log(u, 'browse', r)
+        LogEvent.log(AnonymousUser(), 'browse', r)
+        self.assertTrue(LogEvent.query.count() == 0)
+        self.assertTrue(log_writer.flush() == 1)
+        log = LogEvent.query.filter_by(user=u, op='browse', recipe=r).first()
+        self.assertTrue(log.ct == 2)
+        LogEvent.log(u, 'browse', r)
+        LogEvent.log(u, 'soup', r)
+        self.assertTrue(log_writer.flush() == 2)
+        db.session.expire_all()
+        self.assertTrue(log.ct == 3)
+        self.assertTrue(LogEvent.query.count() == 2)
+
+        # without the flush thread a full buffer is written inline
+        self.app.config['COOKZILLA_LOG_FLUSH_SIZE'] = 2
+        LogEvent.log(u, 'print', r)
+        self.assertTrue(log_writer.pending == 1)
+        LogEvent.log(u, 'share', r)
+        self.assertTrue(log_writer.pending == 0 and LogEvent.query.count() == 4)
+
+    def test_log_flush_failures(self):
+        import sqlalchemy as sa
+        u = User(email='john@example.com', password='cat')
+        r = Recipe(title='soup', author=u)
+        db.session.add_all([u, r])
+        db.session.commit()
+
+        dropped = log_writer.dropped
+
+        # a row the database refuses is dropped, the rest of the batch goes in
+        def foreign_keys(dbapi_connection, record):
+            dbapi_connection.execute('PRAGMA foreign_keys = ON')
+        sa.event.listen(db.engine, 'connect', foreign_keys)
+        db.engine.dispose()
+        try:
+            log_writer.record(u.id, 'browse', r.id)
+            log_writer.record(u.id, 'browse', r.id + 100)
+            self.assertTrue(log_writer.flush() == 1)
+            self.assertTrue(log_writer.dropped == dropped + 1 and log_writer.pending == 0)
+        finally:
+            sa.event.remove(db.engine, 'connect', foreign_keys)
+            db.engine.dispose()
+
+        # other failures are retried, then the batch is given up
+        self.app.config['COOKZILLA_LOG_FLUSH_RETRIES'] = 2
+        db.session.execute('ALTER TABLE log_events RENAME TO log_events_away')
+        db.session.commit()
+        try:
+            log_writer.record(u.id, 'print', r.id)
+            self.assertTrue(log_writer.flush() == 0 and log_writer.pending == 1)
+            self.assertTrue(log_writer.flush() == 0 and log_writer.pending == 0)
+            self.assertTrue(log_writer.dropped == dropped + 2)
+        finally:
+            db.session.execute('ALTER TABLE log_events_away RENAME TO log_events')
+            db.session.commit()
+        log_writer.record(u.id, 'print', r.id)
+        self.assertTrue(log_writer.flush() == 1 and LogEvent.query.count() == 2)
+
+        # SQLite before 3.24 has no ON CONFLICT, rows are updated or inserted
+        version = db.engine.dialect.server_version_info
+        db.engine.dialect.server_version_info = (3, 8, 10)
+        try:
+            log_writer.record(u.id, 'print', r.id)
+            log_writer.record(u.id, 'share', r.id)
+            self.assertTrue(log_writer.flush() == 2)
+        finally:
+            db.engine.dialect.server_version_info = version
+        self.assertTrue(LogEvent.query.filter_by(op='print').first().ct == 2 and LogEvent.query.count() == 3)
 